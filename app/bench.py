@@ -0,0 +1,454 @@
+"""
+benchmark suite, `python main.py bench [options]`.
+
+generates synthetic sprite sheets and times detection, box drawing and
+rendering of the preview, hit-testing and export on them. every case
+runs in its own process by default, so the reported peak RSS belongs to
+that case alone. results are written as JSON and can be compared with
+an earlier run to catch regressions.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+# case name -> what it times
+BENCH_CASES = {
+    "detect": "get_sprite_boxes of every splitter engine",
+    "draw": "PreviewArea.load_image, draw_boxes and painting the view",
+    "hit-test": "building the box index and point queries",
+    "export": "exporting one file per sprite",
+    "export-atlas": "exporting atlas pages",
+    "atlas-pack": "packing many sprite sizes onto many atlas pages",
+}
+
+# alpha of the background noise pixels, detection runs with this as
+# alpha threshold when the sheet has noise
+NOISE_ALPHA = 8
+
+DEFAULT_SHEET = {
+    "width": 2048,
+    "height": 2048,
+    "sprites": 1000,
+    "noise": 0.0,
+    "gap": 0,
+    "seed": 1,
+}
+
+# a p50 this much slower than the baseline counts as a regression
+DEFAULT_TOLERANCE = 0.1
+
+
+def make_sheet(path, width, height, sprites, noise=0.0, gap=0, seed=1):
+    """
+    write a synthetic RGBA sprite sheet to path.
+
+    sprites are opaque rectangles of random size and color, one per cell
+    of a grid covering the sheet, so no two of them touch. with gap > 0
+    every sprite wide enough is cut in two by a transparent column of gap
+    pixels. noise is the fraction of background pixels set to an alpha
+    of at most NOISE_ALPHA. returns the sprite boxes as
+    (left, top, right, bottom) rows
+    """
+    import numpy as np
+    from PIL import Image as PILImage
+    rng = np.random.default_rng(seed)
+    pixels = np.zeros((height, width, 4), dtype=np.uint8)
+    columns = max(1, math.ceil(math.sqrt(sprites * width / height)))
+    rows = max(1, math.ceil(sprites / columns))
+    cell_width = width // columns
+    cell_height = height // rows
+    if cell_width < 3 or cell_height < 3:
+        raise ValueError(f"{sprites} sprites do not fit a {width}x{height} "
+                         "sheet")
+
+    boxes = []
+    for i in range(sprites):
+        cell_x = (i % columns) * cell_width
+        cell_y = (i // columns) * cell_height
+        # one transparent pixel on every side keeps cells apart
+        sprite_width = int(rng.integers(max(1, cell_width // 3),
+                                        cell_width - 1))
+        sprite_height = int(rng.integers(max(1, cell_height // 3),
+                                         cell_height - 1))
+        left = cell_x + 1 + int(
+            rng.integers(0, cell_width - sprite_width - 1))
+        top = cell_y + 1 + int(
+            rng.integers(0, cell_height - sprite_height - 1))
+        right = left + sprite_width - 1
+        bottom = top + sprite_height - 1
+        color = rng.integers(0, 256, 3)
+        pixels[top:bottom + 1, left:right + 1, :3] = color
+        pixels[top:bottom + 1, left:right + 1, 3] = 255
+        if gap and sprite_width > gap + 2:
+            middle = left + (sprite_width - gap) // 2
+            pixels[top:bottom + 1, middle:middle + gap] = 0
+        boxes.append((left, top, right, bottom))
+
+    if noise:
+        background = pixels[:, :, 3] == 0
+        speckles = background & (rng.random((height, width)) < noise)
+        pixels[:, :, 3][speckles] = rng.integers(
+            1, NOISE_ALPHA + 1, int(speckles.sum()))
+    PILImage.fromarray(pixels, "RGBA").save(path, compress_level=1)
+    return np.array(boxes, dtype=np.int32).reshape(-1, 4)
+
+
+def percentile(samples, q):
+    import numpy as np
+    return float(np.percentile(samples, q)) if samples else None
+
+
+def summarize(name, samples, work, unit, **extra):
+    """
+    result record of a case. samples are seconds per run, work is the
+    amount of work of one run in the throughput unit
+    """
+    total = sum(samples)
+    return {
+        "case": name,
+        "runs": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1000, 4),
+        "p99_ms": round(percentile(samples, 99) * 1000, 4),
+        "mean_ms": round(total / len(samples) * 1000, 4),
+        "throughput": round(work * len(samples) / total, 2)
+        if total else None,
+        "unit": unit,
+        **extra,
+    }
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        # not available on windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes everywhere else
+    scale = 1024 * 1024 if sys.platform.startswith("darwin") else 1024
+    return round(peak / scale, 1)
+
+
+def timed(function, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def bench_detect(sheet_path, sheet, repeat, engine):
+    from .core.detection import create_splitter
+    options = {}
+    if sheet["noise"]:
+        options["alpha_threshold"] = NOISE_ALPHA
+    if sheet["gap"]:
+        options["merge_distance"] = sheet["gap"]
+    found = []
+
+    def run():
+        splitter = create_splitter(sheet_path, engine, options)
+        found.append(len(splitter.get_sprite_boxes()))
+
+    samples = timed(run, repeat)
+    megapixels = sheet["width"] * sheet["height"] / 1e6
+    return [summarize(f"detect:{engine}", samples, megapixels, "Mpx/s",
+                      boxes=found[-1])]
+
+
+def qt_application():
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PySide6.QtWidgets import QApplication
+    return QApplication.instance() or QApplication([])
+
+
+def bench_preview(sheet_path, boxes, repeat):
+    """
+    load_image, a redraw moving every box and painting the view
+    """
+    app = qt_application()
+    from .core.box_store import BoxStore
+    from .widgets.preview_area import PreviewArea
+    preview = PreviewArea(None, False)
+    preview.resize(1280, 800)
+    boxes = BoxStore(boxes)
+
+    def load():
+        preview.current_image_path = None
+        preview.load_image(sheet_path, boxes)
+        app.processEvents()
+
+    load_samples = timed(load, repeat)
+    shifted = [BoxStore(boxes.coords + offset) for offset in (1, 0)]
+    draws = 0
+
+    def draw():
+        nonlocal draws
+        preview.boxes = shifted[draws % 2]
+        draws += 1
+        preview.draw_boxes()
+
+    draw_samples = timed(draw, repeat)
+    render_samples = timed(lambda: preview.viewport().grab(), repeat)
+    return [
+        summarize("draw:load_image", load_samples, len(boxes), "boxes/s"),
+        summarize("draw:draw_boxes", draw_samples, len(boxes), "boxes/s"),
+        summarize("draw:render", render_samples, 1, "frames/s"),
+    ]
+
+
+def bench_hit_test(boxes, sheet, repeat, queries=10000):
+    """
+    latency of single point queries, like one mouse press each
+    """
+    import numpy as np
+    from .core.box_index import BoxIndex
+    build_samples = timed(lambda: BoxIndex(boxes), repeat)
+    index = BoxIndex(boxes)
+    rng = np.random.default_rng(sheet["seed"])
+    points = np.column_stack([
+        rng.uniform(0, sheet["width"], queries),
+        rng.uniform(0, sheet["height"], queries)]).tolist()
+    samples = []
+    for x, y in points:
+        start = time.perf_counter()
+        index.query_point(x, y, 5)
+        samples.append(time.perf_counter() - start)
+    return [
+        summarize("hit-test:build", build_samples, len(boxes), "boxes/s"),
+        summarize("hit-test:query", samples, 1, "queries/s"),
+    ]
+
+
+def bench_export(sheet_path, boxes, repeat, atlas=False):
+    """
+    the export InfoPanel starts, without its worker thread and dialogs
+    """
+    from .core.export import export_sprites
+    from .core.atlas import export_atlas
+    export_dir = tempfile.mkdtemp(prefix="bench-export-")
+    try:
+        def run():
+            shutil.rmtree(export_dir)
+            os.makedirs(export_dir)
+            if atlas:
+                export_atlas(sheet_path, boxes, export_dir)
+            else:
+                export_sprites(sheet_path, boxes, export_dir)
+
+        samples = timed(run, repeat)
+    finally:
+        shutil.rmtree(export_dir, ignore_errors=True)
+    name = "export-atlas" if atlas else "export"
+    return [summarize(name, samples, len(boxes), "sprites/s")]
+
+
+def bench_atlas_pack(sheet, repeat, sprites=50000, page_size=2048):
+    """
+    pack_rects alone, with far more sprites than the sheet has so they
+    fill dozens of pages
+    """
+    import numpy as np
+    from .core.atlas import pack_rects
+    rng = np.random.default_rng(sheet["seed"])
+    sizes = [tuple(size) for size in
+             rng.integers(8, 97, (sprites, 2)).tolist()]
+    pages = []
+
+    def run():
+        pages.append(len(pack_rects(sizes, page_size)[1]))
+
+    samples = timed(run, repeat)
+    return [summarize("atlas-pack", samples, sprites, "sprites/s",
+                      pages=pages[-1])]
+
+
+def run_case(case, sheet_path, sheet, boxes, repeat):
+    """
+    run one case on the sheet and its known sprite boxes, returns the
+    result records with the peak RSS of this process added
+    """
+    if case.startswith("detect:"):
+        results = bench_detect(sheet_path, sheet, repeat,
+                               case.split(":", 1)[1])
+    elif case == "draw":
+        results = bench_preview(sheet_path, boxes, repeat)
+    elif case == "hit-test":
+        results = bench_hit_test(boxes, sheet, repeat)
+    elif case == "export":
+        results = bench_export(sheet_path, boxes, repeat)
+    elif case == "export-atlas":
+        results = bench_export(sheet_path, boxes, repeat, atlas=True)
+    elif case == "atlas-pack":
+        results = bench_atlas_pack(sheet, repeat)
+    else:
+        raise ValueError(f"Unknown benchmark case: {case}")
+    rss = peak_rss_mb()
+    for result in results:
+        result["peak_rss_mb"] = rss
+    return results
+
+
+def expand_cases(names):
+    from .core.detection import SPLITTER_ENGINES
+    cases = []
+    for name in names:
+        if name == "detect":
+            cases.extend(f"detect:{engine}" for engine in SPLITTER_ENGINES)
+        else:
+            cases.append(name)
+    return cases
+
+
+def environment():
+    versions = {"python": platform.python_version()}
+    for module in ("numpy", "PIL", "PySide6"):
+        try:
+            versions[module] = __import__(module).__version__
+        except ImportError:
+            versions[module] = None
+    return {"platform": platform.platform(), "cpus": os.cpu_count(),
+            "versions": versions}
+
+
+def compare(results, baseline, tolerance):
+    """
+    print the p50 change of every case also in baseline, returns the
+    names of the cases slower than tolerance allows
+    """
+    old = {result["case"]: result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        before = old.get(result["case"])
+        if before is None or not before["p50_ms"]:
+            continue
+        change = result["p50_ms"] / before["p50_ms"] - 1
+        flag = ""
+        if change > tolerance:
+            regressions.append(result["case"])
+            flag = "  REGRESSION"
+        print(f"{result['case']:<20} {before['p50_ms']:10.3f} -> "
+              f"{result['p50_ms']:10.3f} ms  {change:+7.1%}{flag}",
+              file=sys.stderr)
+    return regressions
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="main.py bench",
+        description="Time detection, preview drawing, hit-testing and "
+                    "export on synthetic sprite sheets.")
+    parser.add_argument(
+        "cases", nargs="*", metavar="case",
+        help="cases to run, any of "
+             f"{', '.join(BENCH_CASES)} (default: all)")
+    parser.add_argument(
+        "-o", "--output", help="write the JSON report here instead of "
+                               "stdout")
+    parser.add_argument(
+        "-r", "--repeat", type=int, default=5,
+        help="timed runs per case (default: 5)")
+    parser.add_argument(
+        "--label", help="name of this run in the report, e.g. a version")
+    parser.add_argument(
+        "--no-isolate", action="store_true",
+        help="run every case in this process, peak RSS then includes "
+             "the cases before")
+
+    sheet = parser.add_argument_group("synthetic sheet")
+    sheet.add_argument("--width", type=int, default=DEFAULT_SHEET["width"])
+    sheet.add_argument("--height", type=int, default=DEFAULT_SHEET["height"])
+    sheet.add_argument("--sprites", type=int,
+                       default=DEFAULT_SHEET["sprites"])
+    sheet.add_argument(
+        "--noise", type=float, default=DEFAULT_SHEET["noise"],
+        help="fraction of background pixels with a faint alpha")
+    sheet.add_argument(
+        "--gap", type=int, default=DEFAULT_SHEET["gap"],
+        help="cut sprites in two by a transparent gap this wide")
+    sheet.add_argument("--seed", type=int, default=DEFAULT_SHEET["seed"])
+
+    regression = parser.add_argument_group("regressions")
+    regression.add_argument(
+        "--compare", metavar="BASELINE",
+        help="JSON report of an earlier run, exits with status 1 if a case "
+             "got slower")
+    regression.add_argument(
+        "--tolerance", type=float, default=DEFAULT_TOLERANCE,
+        help=f"allowed p50 slowdown (default: {DEFAULT_TOLERANCE})")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    unknown = [case for case in args.cases if case not in BENCH_CASES]
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(unknown)}")
+    sheet = {
+        "width": args.width,
+        "height": args.height,
+        "sprites": args.sprites,
+        "noise": args.noise,
+        "gap": args.gap,
+        "seed": args.seed,
+    }
+    cases = expand_cases(args.cases or list(BENCH_CASES))
+    work_dir = tempfile.mkdtemp(prefix="bench-")
+    results = []
+    try:
+        sheet_path = os.path.join(work_dir, "sheet.png")
+        try:
+            boxes = make_sheet(sheet_path, **sheet)
+        except ValueError as e:
+            parser.error(str(e))
+        for case in cases:
+            print(f"running {case}", file=sys.stderr)
+            if args.no_isolate:
+                results.extend(run_case(case, sheet_path, sheet, boxes,
+                                        args.repeat))
+                continue
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            # a fresh process per case, its peak RSS is the case's own
+            with ProcessPoolExecutor(
+                    max_workers=1,
+                    mp_context=multiprocessing.get_context("spawn")) \
+                    as executor:
+                results.extend(executor.submit(
+                    run_case, case, sheet_path, sheet, boxes,
+                    args.repeat).result())
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "label": args.label,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": environment(),
+        "sheet": sheet,
+        "repeat": args.repeat,
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("sheet") != sheet:
+            print("warning: the baseline was run on another sheet",
+                  file=sys.stderr)
+        if compare(results, baseline, args.tolerance):
+            return 1
+    return 0
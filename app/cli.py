@@ -0,0 +1,254 @@
+"""
+headless batch mode, `python main.py split [options] images... -o out/`.
+
+runs the same detection, box cache and export code as the GUI, but must
+never import Qt, so it works on machines without a display and starts
+fast.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from .core.file_scan import iter_image_files
+from .core.detection import (SPLITTER_ENGINES, DEFAULT_ENGINE,
+                             TILED_BAND_HEIGHT, OVERLAP_MODES,
+                             postprocess_options, split_image)
+from .core.export import (EXPORT_FORMATS, DEFAULT_EXPORT_OPTIONS,
+                          export_sprites)
+from .core.atlas import (ATLAS_PAGE_SIZES, DEFAULT_ATLAS_PAGE_SIZE,
+                         export_atlas)
+from .core.dedup import (DEDUP_MAPPING_NAME, DEFAULT_SIMILAR_DISTANCE,
+                         export_unique_sprites)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="main.py split",
+        description="Split sprite sheets and export their sprites "
+                    "without opening the GUI.")
+    parser.add_argument(
+        "images", nargs="+",
+        help="sprite sheets to split, folders are scanned recursively and "
+             "glob patterns are expanded")
+    parser.add_argument(
+        "-o", "--output", required=True,
+        help="export folder, created if missing")
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=os.cpu_count() or 1,
+        help="number of images processed in parallel (default: CPU count)")
+
+    split = parser.add_argument_group("split settings")
+    split.add_argument(
+        "--engine", choices=list(SPLITTER_ENGINES), default=DEFAULT_ENGINE)
+    split.add_argument(
+        "--alpha-threshold", type=int, default=0,
+        help="pixels with an alpha value above this belong to sprites "
+             "(numpy and grid engines)")
+    split.add_argument(
+        "--merge-distance", type=int, default=0,
+        help="keep pixels separated by at most this many transparent "
+             "pixels in one sprite (numpy engine)")
+    split.add_argument(
+        "--tiled", action="store_true",
+        help=f"label images in bands of {TILED_BAND_HEIGHT} rows "
+             "(numpy engine)")
+    split.add_argument(
+        "--trim-cells", action="store_true",
+        help="shrink every grid cell to the sprite pixels inside it "
+             "(grid engine)")
+    split.add_argument(
+        "--no-cache", action="store_true",
+        help="neither read nor write the box cache")
+
+    postprocess = parser.add_argument_group("post-processing")
+    postprocess.add_argument(
+        "--merge-gap", type=int, metavar="PIXELS",
+        help="merge boxes at most this many transparent pixels apart, 0 "
+             "merges touching boxes")
+    postprocess.add_argument(
+        "--min-area", type=int, default=0, metavar="PIXELS",
+        help="drop boxes covering fewer pixels")
+    postprocess.add_argument(
+        "--overlaps", choices=list(OVERLAP_MODES), default="keep",
+        help="keep overlapping boxes, drop the nested ones or merge them")
+
+    export = parser.add_argument_group("export settings")
+    export.add_argument(
+        "--format", choices=list(EXPORT_FORMATS), default="PNG")
+    export.add_argument(
+        "--compress-level", type=int, choices=range(10),
+        default=DEFAULT_EXPORT_OPTIONS["compress_level"], metavar="0-9",
+        help="PNG zlib level")
+    export.add_argument(
+        "--optimize", action="store_true",
+        help="search for the smallest PNG encoding")
+    export.add_argument(
+        "--lossy", action="store_true", help="encode WebP lossy")
+    export.add_argument(
+        "--atlas", action="store_true",
+        help="pack the sprites of every image into atlas pages")
+    export.add_argument(
+        "--atlas-size", type=int, choices=ATLAS_PAGE_SIZES,
+        default=DEFAULT_ATLAS_PAGE_SIZE)
+    export.add_argument(
+        "--no-trim", action="store_true",
+        help="keep transparent sprite borders in atlas pages")
+    export.add_argument(
+        "--rotate", action="store_true",
+        help="allow rotated sprites in atlas pages")
+    export.add_argument(
+        "--unique", action="store_true",
+        help="write every distinct sprite of all images once, with "
+             f"{DEDUP_MAPPING_NAME} mapping the boxes to their files")
+    export.add_argument(
+        "--similar", type=int, nargs="?", const=DEFAULT_SIMILAR_DISTANCE,
+        metavar="BITS",
+        help="with --unique, also merge sprites of the same size whose "
+             "difference hashes differ in at most BITS bits "
+             f"(default {DEFAULT_SIMILAR_DISTANCE})")
+    return parser
+
+
+def expand_images(patterns):
+    # same order, every image once
+    return list(iter_image_files(patterns))
+
+
+def split_settings(args):
+    options = {
+        "alpha_threshold": args.alpha_threshold,
+        "merge_distance": args.merge_distance,
+        "band_height": TILED_BAND_HEIGHT if args.tiled else 0,
+        "trim_cells": args.trim_cells,
+    }
+    accepted = SPLITTER_ENGINES[args.engine][1]
+    options = {k: v for k, v in options.items() if k in accepted}
+    options.update(postprocess_options({
+        "merge_gap": args.merge_gap,
+        "min_area": args.min_area,
+        "overlaps": args.overlaps,
+    }))
+    return args.engine, options
+
+
+def export_settings(args):
+    options = {
+        "compress_level": args.compress_level,
+        "optimize": args.optimize,
+        "lossless": not args.lossy,
+    }
+    atlas_options = None
+    if args.atlas:
+        atlas_options = {
+            "page_size": args.atlas_size,
+            "trim": not args.no_trim,
+            "rotate": args.rotate,
+        }
+    return args.format, options, atlas_options
+
+
+def process_image(image_path, export_dir, engine, options, use_cache,
+                  fmt, export_options, atlas_options, export_workers):
+    """
+    split and export a single image, runs in the worker processes.
+    returns (box count, exported sprite count)
+    """
+    boxes = split_image(image_path, engine, options, use_cache)
+    if not len(boxes):
+        return 0, 0
+    if atlas_options is None:
+        exported = export_sprites(image_path, boxes, export_dir, fmt,
+                                  export_options,
+                                  max_workers=export_workers)
+    else:
+        exported = export_atlas(image_path, boxes, export_dir, fmt,
+                                export_options, **atlas_options)
+    return len(boxes), exported
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.unique and args.atlas:
+        parser.error("--unique can not be combined with --atlas")
+    if (args.merge_gap is not None and args.merge_gap < 0) or \
+            args.min_area < 0:
+        parser.error("--merge-gap and --min-area can not be negative")
+    images = expand_images(args.images)
+    missing = [image for image in images if not os.path.isfile(image)]
+    for image in missing:
+        print(f"{image}: no such file", file=sys.stderr)
+    images = [image for image in images if image not in missing]
+    if not images:
+        print("no images to split", file=sys.stderr)
+        return 1
+    os.makedirs(args.output, exist_ok=True)
+
+    engine, options = split_settings(args)
+    fmt, export_options, atlas_options = export_settings(args)
+    jobs = max(1, min(args.jobs, len(images)))
+    # cores not used by the process pool encode sprites in threads
+    export_workers = max(1, (os.cpu_count() or 1) // jobs)
+    if args.unique:
+        # sprites are compared across images, so every image is split
+        # first and exported together afterwards
+        task = split_image
+        job_args = (engine, options, not args.no_cache)
+    else:
+        task = process_image
+        job_args = (args.output, engine, options, not args.no_cache,
+                    fmt, export_options, atlas_options, export_workers)
+
+    start = time.perf_counter()
+    succeeded = 0
+    total_sprites = 0
+    # image path -> boxes, with --unique
+    image_boxes = {}
+
+    def report(image_path, result=None, error=None):
+        nonlocal succeeded, total_sprites
+        if error is not None:
+            print(f"{image_path}: failed: {error}", file=sys.stderr)
+            return
+        succeeded += 1
+        if args.unique:
+            image_boxes[image_path] = result
+            print(f"{image_path}: {len(result)} boxes")
+            return
+        box_count, exported = result
+        total_sprites += exported
+        print(f"{image_path}: {box_count} boxes, {exported} sprites exported")
+
+    if jobs == 1:
+        # no process start-up cost for a single worker
+        for image_path in images:
+            try:
+                report(image_path, task(image_path, *job_args))
+            except Exception as e:
+                report(image_path, error=str(e) or repr(e))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {executor.submit(task, image_path, *job_args):
+                       image_path for image_path in images}
+            for future in as_completed(futures):
+                try:
+                    report(futures[future], future.result())
+                except Exception as e:
+                    report(futures[future], error=str(e) or repr(e))
+
+    if image_boxes:
+        sources = [(image_path, image_boxes[image_path])
+                   for image_path in images if image_path in image_boxes]
+        try:
+            total_sprites = export_unique_sprites(
+                sources, args.output, fmt, export_options, args.similar)
+        except Exception as e:
+            print(f"unique export failed: {str(e) or repr(e)}",
+                  file=sys.stderr)
+            return 1
+
+    total = len(images) + len(missing)
+    print(f"{succeeded} of {total} images, {total_sprites} sprites "
+          f"in {time.perf_counter() - start:.2f}s")
+    return 0 if succeeded == total else 1
@@ -0,0 +1,182 @@
+import io
+import struct
+import zlib
+import numpy as np
+from PIL import Image
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# png color type -> samples per pixel
+PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+
+
+def load_alpha(image_path: str) -> np.ndarray:
+    """
+    alpha channel of image_path as a (height, width) uint8 array. images
+    without alpha are treated as fully opaque, like AlphaSpriteSplitter
+    does after its RGBA conversion
+    """
+    image = Image.open(image_path)
+    if "A" in image.getbands():
+        return np.asarray(image.getchannel("A"))
+    if "transparency" in image.info:
+        return np.asarray(image.convert("RGBA").getchannel("A"))
+    return np.full((image.height, image.width), 255, dtype=np.uint8)
+
+
+def iter_alpha_bands(image_path: str, band_height: int):
+    """
+    yield (top, alpha) for consecutive horizontal bands of image_path.
+
+    8-bit non-interlaced PNGs are decoded band by band, so peak memory
+    depends on the band size only. other images are decoded at once and
+    sliced afterwards
+    """
+    reader = _PngBandReader.open(image_path)
+    if reader is None:
+        alpha = load_alpha(image_path)
+        for top in range(0, alpha.shape[0], band_height):
+            yield top, alpha[top:top + band_height]
+        return
+    with reader:
+        yield from reader.iter_bands(band_height)
+
+
+def _chunk(chunk_type, data):
+    return struct.pack(">I", len(data)) + chunk_type + data + \
+        struct.pack(">I", zlib.crc32(chunk_type + data))
+
+
+class _PngBandReader:
+    """
+    Streams the IDAT data of a png and decodes it in bands.
+
+    PNG scanline filters refer to the previous row, so every band is
+    wrapped in a small standalone png whose first row is the last decoded
+    row of the band before, stored unfiltered. Pillow decodes that png
+    and the helper row is dropped again.
+    """
+
+    def __init__(self, file, header, palette, transparency):
+        self._file = file
+        (self.width, self.height, self.bit_depth, self.color_type,
+         _, _, self.interlace) = struct.unpack(">IIBBBBB", header)
+        self._palette = palette
+        self._transparency = transparency
+        self._stride = self.width * PNG_CHANNELS[self.color_type]
+        self._pending_chunk = None
+
+    @classmethod
+    def open(cls, image_path):
+        """
+        reader for image_path, None if it is not a png this reader can
+        stream
+        """
+        f = open(image_path, "rb")
+        try:
+            if f.read(8) != PNG_SIGNATURE:
+                f.close()
+                return None
+            header, palette, transparency = None, None, None
+            while True:
+                chunk_type, data = cls._read_chunk(f)
+                if chunk_type == b"IHDR":
+                    header = data
+                elif chunk_type == b"PLTE":
+                    palette = data
+                elif chunk_type == b"tRNS":
+                    transparency = data
+                elif chunk_type in (b"IDAT", b"IEND"):
+                    break
+            reader = cls(f, header, palette, transparency)
+            reader._pending_chunk = (chunk_type, data)
+        except (struct.error, TypeError):
+            f.close()
+            return None
+        if reader.bit_depth != 8 or reader.interlace \
+                or reader.color_type not in PNG_CHANNELS:
+            f.close()
+            return None
+        return reader
+
+    @staticmethod
+    def _read_chunk(f):
+        length, chunk_type = struct.unpack(">I4s", f.read(8))
+        data = f.read(length)
+        f.read(4)  # crc
+        return chunk_type, data
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self._file.close()
+
+    def _iter_idat(self):
+        chunk_type, data = self._pending_chunk
+        while chunk_type == b"IDAT":
+            yield data
+            chunk_type, data = self._read_chunk(self._file)
+
+    def iter_bands(self, band_height):
+        row_bytes = self._stride + 1
+        band_bytes = band_height * row_bytes
+        decompressor = zlib.decompressobj()
+        buffer = bytearray()
+        previous_row = None
+        top = 0
+        idat = self._iter_idat()
+        compressed = b""
+        while top < self.height:
+            rows = min(band_height, self.height - top)
+            needed = rows * row_bytes
+            while len(buffer) < needed:
+                if not compressed:
+                    compressed = next(idat, None)
+                    if compressed is None:
+                        raise ValueError("Truncated png data")
+                # bounded output, all transparent areas compress very well
+                buffer += decompressor.decompress(compressed, band_bytes)
+                compressed = decompressor.unconsumed_tail
+            band, previous_row = self._decode_band(
+                bytes(buffer[:needed]), rows, previous_row)
+            del buffer[:needed]
+            yield top, band
+            top += rows
+
+    def _decode_band(self, filtered, rows, previous_row):
+        if previous_row is not None:
+            filtered = b"\x00" + previous_row + filtered
+            rows += 1
+        header = struct.pack(">IIBBBBB", self.width, rows, 8,
+                             self.color_type, 0, 0, 0)
+        data = PNG_SIGNATURE + _chunk(b"IHDR", header)
+        if self._palette is not None:
+            data += _chunk(b"PLTE", self._palette)
+        data += _chunk(b"IDAT", zlib.compress(filtered, 0)) + \
+            _chunk(b"IEND", b"")
+        pixels = np.asarray(Image.open(io.BytesIO(data)))
+        if previous_row is not None:
+            pixels = pixels[1:]
+        return self._alpha(pixels), pixels[-1].tobytes()
+
+    def _alpha(self, pixels):
+        if self.color_type == 6:
+            return pixels[..., 3]
+        if self.color_type == 4:
+            return pixels[..., 1]
+        alpha = np.full(pixels.shape[:2], 255, dtype=np.uint8)
+        if self._transparency is None:
+            return alpha
+        if self.color_type == 3:
+            table = np.full(256, 255, dtype=np.uint8)
+            table[:len(self._transparency)] = \
+                np.frombuffer(self._transparency, dtype=np.uint8)[:256]
+            return table[pixels]
+        # gray or rgb color key, stored as 16 bit samples
+        key = np.frombuffer(self._transparency, dtype=">u2").astype(np.uint8)
+        if self.color_type == 0:
+            alpha[pixels == key[0]] = 0
+        else:
+            alpha[np.all(pixels == key[:3], axis=-1)] = 0
+        return alpha
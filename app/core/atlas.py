@@ -0,0 +1,381 @@
+import json
+import math
+import os
+import struct
+import threading
+from .export import (EXPORT_FORMATS, encoder_params, load_source_image,
+                     crop_rects)
+
+# largest width and height of a single atlas page
+ATLAS_PAGE_SIZES = (1024, 2048, 4096, 8192)
+DEFAULT_ATLAS_PAGE_SIZE = 4096
+
+# transparent pixels kept between packed sprites against texture bleeding
+ATLAS_PADDING = 1
+
+ATLAS_FORMAT_VERSION = 1
+
+# binary descriptor layout, all values little endian:
+#   header: magic, version, page count, sprite count
+#   page:   width, height, file name length, utf-8 file name
+#   sprite: page, flags, atlas x/y/w/h, source box x/y/w/h,
+#           trim offset x/y inside the source box
+# atlas w/h is the packed size, so it is swapped for rotated sprites
+ATLAS_MAGIC = b"SPAT"
+ATLAS_HEADER = struct.Struct("<4sHHI")
+ATLAS_PAGE = struct.Struct("<HHH")
+ATLAS_SPRITE = struct.Struct("<HBxHHHHIIIIHH")
+
+# sprite record flags
+SPRITE_ROTATED = 1
+SPRITE_TRIMMED = 2
+
+
+class SkylinePacker:
+    """
+    Bottom-left skyline bin packer for a single atlas page.
+
+    The skyline is the upper outline of everything placed so far, kept
+    as [x, y, width] segments from left to right. A rectangle goes where
+    its bottom edge ends up lowest, so each insert only walks the
+    segments instead of a list of free rectangles.
+    """
+
+    def __init__(self, width, height, allow_rotation=False):
+        self.width = width
+        self.height = height
+        self.allow_rotation = allow_rotation
+        self.skyline = [[0, 0, width]]
+        self.used_width = 0
+        self.used_height = 0
+
+    def insert(self, width, height):
+        """
+        place a width x height rectangle, returns (x, y, rotated) or None
+        if it does not fit. rotated rectangles occupy height x width
+        """
+        best = self._find(width, height)
+        rotated = False
+        if self.allow_rotation and width != height:
+            candidate = self._find(height, width)
+            if candidate is not None and \
+                    (best is None or candidate[:2] < best[:2]):
+                best = candidate
+                rotated = True
+                width, height = height, width
+        if best is None:
+            return None
+
+        bottom, _, index = best
+        x = self.skyline[index][0]
+        self._add_level(index, x, bottom, width)
+        self.used_width = max(self.used_width, x + width)
+        self.used_height = max(self.used_height, bottom)
+        return x, bottom - height, rotated
+
+    def _find(self, width, height):
+        # (bottom, segment width, segment index) of the best position
+        best = None
+        skyline = self.skyline
+        # highest y a rectangle may rest on, lowered to the y of the
+        # best position so far, higher segments are not walked
+        limit = self.height - height
+        for index, (x, y, segment_width) in enumerate(skyline):
+            if x + width > self.width:
+                break
+            if y > limit:
+                continue
+            y = self._fit(index, width, limit)
+            if y is None:
+                continue
+            bottom = y + height
+            if best is None or (bottom, segment_width) < best[:2]:
+                best = (bottom, segment_width, index)
+                limit = y
+        return best
+
+    def _fit(self, index, width, limit):
+        # lowest y a rectangle of this width can rest on when its left
+        # edge starts at segment index, None if that is above limit
+        skyline = self.skyline
+        y = 0
+        while width > 0:
+            _, segment_y, segment_width = skyline[index]
+            if segment_y > y:
+                if segment_y > limit:
+                    return None
+                y = segment_y
+            width -= segment_width
+            index += 1
+        return y
+
+    def _add_level(self, index, x, y, width):
+        skyline = self.skyline
+        skyline.insert(index, [x, y, width])
+        right = x + width
+        # shorten or drop the segments now hidden below the new one
+        i = index + 1
+        while i < len(skyline) and skyline[i][0] < right:
+            segment = skyline[i]
+            segment_right = segment[0] + segment[2]
+            if segment_right <= right:
+                del skyline[i]
+                continue
+            segment[0] = right
+            segment[2] = segment_right - right
+            break
+        # only the new segment changed, merge it with equal neighbours
+        if index + 1 < len(skyline) and skyline[index + 1][1] == y:
+            skyline[index][2] += skyline[index + 1][2]
+            del skyline[index + 1]
+        if index > 0 and skyline[index - 1][1] == y:
+            skyline[index - 1][2] += skyline[index][2]
+            del skyline[index]
+
+
+def pack_rects(sizes, page_size=DEFAULT_ATLAS_PAGE_SIZE,
+               allow_rotation=False, padding=ATLAS_PADDING):
+    """
+    pack (width, height) sizes onto as few pages as needed.
+
+    returns the placements as (page, x, y, rotated) in the order of
+    sizes, and the used (width, height) of every page
+    """
+    # place big sprites first, small ones fill the gaps in between
+    order = sorted(range(len(sizes)),
+                   key=lambda i: (max(sizes[i]), min(sizes[i])),
+                   reverse=True)
+
+    def size_class(width, height):
+        # a page rejecting a class also rejects every larger one, both
+        # orientations are tried with rotation
+        if allow_rotation:
+            return max(width, height), min(width, height)
+        return width, height
+
+    # smallest class width and height among the sprites from order[k] on
+    classes = [size_class(*sizes[i]) for i in order]
+    least = [None] * (len(order) + 1)
+    least[-1] = (math.inf, math.inf)
+    for k in range(len(order) - 1, -1, -1):
+        least[k] = (min(classes[k][0], least[k + 1][0]),
+                    min(classes[k][1], least[k + 1][1]))
+
+    packers = []
+    # per page, the smallest classes it could not place. the skyline
+    # only rises, so those pages are skipped for larger sprites, and
+    # closed once no sprite left is smaller
+    rejected = []
+    open_pages = []
+    placements = [None] * len(sizes)
+    for k, i in enumerate(order):
+        width, height = sizes[i]
+        if max(width, height) > page_size:
+            raise ValueError(
+                f"Sprite {i} ({width} x {height}) does not fit on a "
+                f"{page_size} x {page_size} atlas page")
+        class_width, class_height = classes[k]
+        placed = None
+        closed = []
+        for page in open_pages:
+            if any(class_width >= w and class_height >= h
+                   for w, h in rejected[page]):
+                continue
+            placed = packers[page].insert(width + padding, height + padding)
+            if placed is not None:
+                break
+            if class_width <= least[k + 1][0] and \
+                    class_height <= least[k + 1][1]:
+                closed.append(page)
+            else:
+                rejected[page] = [
+                    (w, h) for w, h in rejected[page]
+                    if w < class_width or h < class_height]
+                rejected[page].append(classes[k])
+        for closed_page in closed:
+            open_pages.remove(closed_page)
+        if placed is None:
+            # the padding of the last column and row is cut off again
+            packer = SkylinePacker(page_size + padding, page_size + padding,
+                                   allow_rotation)
+            packers.append(packer)
+            rejected.append([])
+            page = len(packers) - 1
+            open_pages.append(page)
+            placed = packer.insert(width + padding, height + padding)
+        placements[i] = (page,) + placed
+
+    page_sizes = [(max(packer.used_width - padding, 1),
+                   max(packer.used_height - padding, 1))
+                  for packer in packers]
+    return placements, page_sizes
+
+
+def trim_rects(alpha, rects):
+    """
+    shrink (x, y, width, height) rects of the alpha array to their
+    non-transparent pixels. returns (offset x, offset y, width, height)
+    relative to each rect, empty rects keep a single pixel
+    """
+    import numpy as np
+    trimmed = []
+    for x, y, width, height in rects:
+        region = alpha[y:y + height, x:x + width]
+        rows = np.flatnonzero(region.any(axis=1))
+        if len(rows) == 0:
+            trimmed.append((0, 0, 1, 1))
+            continue
+        columns = np.flatnonzero(region.any(axis=0))
+        trimmed.append((int(columns[0]), int(rows[0]),
+                        int(columns[-1] - columns[0] + 1),
+                        int(rows[-1] - rows[0] + 1)))
+    return trimmed
+
+
+def atlas_descriptor(source_name, page_files, page_sizes, sprites):
+    """
+    sprites are dicts with name, page, frame, rotated, source and trim as
+    written by export_atlas. rotated sprites are stored turned 90 degrees
+    clockwise
+    """
+    return {
+        "version": ATLAS_FORMAT_VERSION,
+        "source": source_name,
+        "rotation": "clockwise",
+        "pages": [{"file": file, "width": width, "height": height}
+                  for file, (width, height) in zip(page_files, page_sizes)],
+        "sprites": sprites,
+    }
+
+
+def write_json_descriptor(path, descriptor):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(descriptor, f, separators=(",", ":"))
+
+
+def write_binary_descriptor(path, descriptor):
+    pages = descriptor["pages"]
+    sprites = descriptor["sprites"]
+    with open(path, "wb") as f:
+        f.write(ATLAS_HEADER.pack(ATLAS_MAGIC, descriptor["version"],
+                                  len(pages), len(sprites)))
+        for page in pages:
+            name = page["file"].encode("utf-8")
+            f.write(ATLAS_PAGE.pack(page["width"], page["height"], len(name)))
+            f.write(name)
+        for sprite in sprites:
+            width, height = sprite["frame"][2:]
+            if sprite["rotated"]:
+                width, height = height, width
+            flags = 0
+            if sprite["rotated"]:
+                flags |= SPRITE_ROTATED
+            if sprite["trim"] != [0, 0] or \
+                    [width, height] != sprite["source"][2:]:
+                flags |= SPRITE_TRIMMED
+            f.write(ATLAS_SPRITE.pack(sprite["page"], flags,
+                                      *sprite["frame"], *sprite["source"],
+                                      *sprite["trim"]))
+
+
+def read_binary_descriptor(path):
+    """
+    read a descriptor written by write_binary_descriptor back into the
+    json layout, sprite names are not part of the binary format
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, version, page_count, sprite_count = \
+        ATLAS_HEADER.unpack_from(data, 0)
+    if magic != ATLAS_MAGIC:
+        raise ValueError(f"{path} is not a sprite atlas descriptor")
+    offset = ATLAS_HEADER.size
+    pages = []
+    for _ in range(page_count):
+        width, height, name_length = ATLAS_PAGE.unpack_from(data, offset)
+        offset += ATLAS_PAGE.size
+        pages.append({
+            "file": data[offset:offset + name_length].decode("utf-8"),
+            "width": width, "height": height})
+        offset += name_length
+    sprites = []
+    for record in ATLAS_SPRITE.iter_unpack(
+            data[offset:offset + sprite_count * ATLAS_SPRITE.size]):
+        sprites.append({
+            "page": record[0],
+            "frame": list(record[2:6]),
+            "rotated": bool(record[1] & SPRITE_ROTATED),
+            "source": list(record[6:10]),
+            "trim": list(record[10:12]),
+        })
+    return {"version": version, "pages": pages, "sprites": sprites}
+
+
+def export_atlas(image_path, boxes, export_dir, fmt="PNG", options=None,
+                 page_size=DEFAULT_ATLAS_PAGE_SIZE, trim=True, rotate=False,
+                 progress=None, cancel_event=None):
+    """
+    pack the boxes of image_path into atlas pages and write the pages
+    together with a json and a binary descriptor to export_dir.
+
+    boxes are a BoxStore, (left, top, right, bottom) rows or a list of
+    Box. nothing is written if cancel_event is set before the pages are
+    saved. returns the number of packed sprites, 0 when cancelled
+    """
+    import numpy as np
+    from PIL import Image as PILImage
+    params = encoder_params(fmt, options)
+    cancel_event = cancel_event or threading.Event()
+    image = load_source_image(image_path, rgba=True)
+    base_name = os.path.splitext(os.path.basename(image_path))[0]
+    rects = [(left, top, right - left, bottom - top)
+             for left, top, right, bottom in
+             crop_rects(boxes, image.width, image.height)]
+    total = len(rects)
+    if trim:
+        trims = trim_rects(np.asarray(image.getchannel("A")), rects)
+    else:
+        trims = [(0, 0, width, height) for _, _, width, height in rects]
+    placements, page_sizes = pack_rects(
+        [(width, height) for _, _, width, height in trims],
+        page_size, rotate)
+    if cancel_event.is_set():
+        return 0
+
+    pages = [PILImage.new("RGBA", size, (0, 0, 0, 0)) for size in page_sizes]
+    sprites = []
+    for i, ((x, y, _, _), (trim_x, trim_y, width, height),
+            (page, atlas_x, atlas_y, rotated)) in \
+            enumerate(zip(rects, trims, placements)):
+        if i % 256 == 0:
+            if cancel_event.is_set():
+                return 0
+            if progress is not None:
+                progress(i, total)
+        sprite = image.crop((x + trim_x, y + trim_y,
+                             x + trim_x + width, y + trim_y + height))
+        if rotated:
+            sprite = sprite.transpose(PILImage.Transpose.ROTATE_270)
+        pages[page].paste(sprite, (atlas_x, atlas_y))
+        sprites.append({
+            "name": f"{base_name}_sprite_{i}",
+            "page": page,
+            "frame": [atlas_x, atlas_y, sprite.width, sprite.height],
+            "rotated": rotated,
+            "source": list(rects[i]),
+            "trim": [trim_x, trim_y],
+        })
+
+    page_files = [f"{base_name}_atlas_{page}{EXPORT_FORMATS[fmt]}"
+                  for page in range(len(pages))]
+    for file, page in zip(page_files, pages):
+        page.save(os.path.join(export_dir, file), fmt, **params)
+    descriptor = atlas_descriptor(os.path.basename(image_path), page_files,
+                                  page_sizes, sprites)
+    write_json_descriptor(
+        os.path.join(export_dir, f"{base_name}_atlas.json"), descriptor)
+    write_binary_descriptor(
+        os.path.join(export_dir, f"{base_name}_atlas.bin"), descriptor)
+    if progress is not None:
+        progress(total, total)
+    return total
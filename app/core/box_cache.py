@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+import numpy as np
+from sprite_splitter import Box
+from typing import List
+from .box_store import BoxStore, box_coords
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def default_cache_dir():
+    if sys.platform.startswith("win"):
+        base = os.environ.get("LOCALAPPDATA") or \
+            os.path.join(os.path.expanduser("~"), "AppData", "Local")
+    elif sys.platform.startswith("darwin"):
+        base = os.path.join(os.path.expanduser("~"), "Library", "Caches")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or \
+            os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "SpriteSplitterGUI")
+
+
+def file_digest(image_path, chunk_size=1024 * 1024):
+    digest = hashlib.blake2b(digest_size=20)
+    with open(image_path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BoxCache:
+    """
+    SQLite store of detected boxes, keyed by image content hash and
+    splitter parameters, shared by the GUI and the split workers.
+
+    Boxes saved by the user are kept next to the detected ones and take
+    precedence on lookup. The total size of stored boxes is bounded, the
+    least recently used entries are evicted first.
+    """
+
+    def __init__(self, db_path=None, max_bytes=DEFAULT_MAX_BYTES):
+        if db_path is None:
+            db_path = os.path.join(default_cache_dir(), "boxes.sqlite3")
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        # several split workers write concurrently
+        self._conn = sqlite3.connect(db_path, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS boxes (
+                digest TEXT NOT NULL,
+                params TEXT NOT NULL,
+                edited INTEGER NOT NULL,
+                boxes TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (digest, params, edited)
+            );
+            CREATE INDEX IF NOT EXISTS boxes_last_used
+                ON boxes (last_used);
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                digest TEXT NOT NULL
+            );
+        """)
+        self._conn.commit()
+
+    def file_digest(self, image_path):
+        """
+        content hash of image_path. the hash is remembered per path, size
+        and mtime, so unchanged files are only hashed once
+        """
+        image_path = os.path.abspath(image_path)
+        stat = os.stat(image_path)
+        row = self._conn.execute(
+            "SELECT digest FROM files WHERE path = ? AND size = ? "
+            "AND mtime_ns = ?",
+            (image_path, stat.st_size, stat.st_mtime_ns)).fetchone()
+        if row:
+            return row[0]
+        digest = file_digest(image_path)
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                (image_path, stat.st_size, stat.st_mtime_ns, digest))
+        return digest
+
+    def get(self, digest, params) -> BoxStore | None:
+        row = self._conn.execute(
+            "SELECT boxes, edited FROM boxes WHERE digest = ? AND params = ? "
+            "ORDER BY edited DESC LIMIT 1", (digest, params)).fetchone()
+        if row is None:
+            return None
+        with self._conn:
+            self._conn.execute(
+                "UPDATE boxes SET last_used = ? WHERE digest = ? "
+                "AND params = ? AND edited = ?",
+                (time.time(), digest, params, row[1]))
+        return BoxStore(np.array(json.loads(row[0]), dtype=np.int32))
+
+    def put(self, digest, params, boxes: BoxStore | List[Box], edited=False):
+        data = json.dumps(box_coords(boxes).tolist(), separators=(",", ":"))
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO boxes VALUES (?, ?, ?, ?, ?, ?)",
+                (digest, params, int(edited), data, len(data), time.time()))
+            self._evict()
+
+    def clear(self):
+        with self._conn:
+            self._conn.execute("DELETE FROM boxes")
+            self._conn.execute("DELETE FROM files")
+
+    def close(self):
+        self._conn.close()
+
+    def _evict(self):
+        total = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM boxes").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute(
+            "SELECT digest, params, edited, size FROM boxes "
+            "ORDER BY last_used")
+        stale = []
+        for digest, params, edited, size in rows:
+            if total <= self.max_bytes:
+                break
+            stale.append((digest, params, edited))
+            total -= size
+        self._conn.executemany(
+            "DELETE FROM boxes WHERE digest = ? AND params = ? "
+            "AND edited = ?", stale)
+        self._conn.execute(
+            "DELETE FROM files WHERE digest NOT IN "
+            "(SELECT digest FROM boxes)")
+
+
+_box_cache = None
+
+
+def get_box_cache() -> BoxCache | None:
+    """
+    per process cache instance, None if the cache can not be opened
+    """
+    global _box_cache
+    if _box_cache is None:
+        try:
+            _box_cache = BoxCache()
+        except (OSError, sqlite3.Error):
+            return None
+    return _box_cache
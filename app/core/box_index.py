@@ -0,0 +1,164 @@
+import numpy as np
+from sprite_splitter import Box
+from typing import List
+from .box_store import BoxStore, box_coords
+
+# changed boxes are tracked aside the grid, it is rebuilt once there are
+# more of them than this
+MAX_CHANGED_BOXES = 256
+# point queries touching more cells than this test every box instead
+MAX_QUERY_CELLS = 64
+
+
+def index_runs(starts, lengths) -> np.ndarray:
+    """
+    starts[0], ..., starts[0] + lengths[0] - 1, starts[1], ... in one
+    array
+    """
+    offsets = np.arange(lengths.sum()) - np.repeat(
+        np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(starts, lengths) + offsets
+
+
+def grid_entries(coords, cell_size, columns):
+    """
+    (cell id, box) of every grid cell overlapped by every box of coords,
+    cells are numbered row by row, columns per row. boxes list their
+    cells in a row
+    """
+    cells = coords // cell_size
+    widths = cells[:, 2] - cells[:, 0] + 1
+    heights = cells[:, 3] - cells[:, 1] + 1
+    counts = widths * heights
+    boxes = np.repeat(np.arange(len(coords)), counts)
+    # position of every entry inside the cell block of its box
+    offsets = np.arange(len(boxes)) - np.repeat(np.cumsum(counts) - counts,
+                                                counts)
+    cell_x = cells[boxes, 0] + offsets % widths[boxes]
+    cell_y = cells[boxes, 1] + offsets // widths[boxes]
+    return cell_y * columns + cell_x, boxes
+
+
+class BoxIndex:
+    """
+    Uniform grid index over boxes for hit-testing.
+
+    Every box is listed in the grid cells it overlaps, the (cell, box)
+    entries are kept sorted by cell, so finding the boxes of a cell is a
+    binary search. Moved or resized boxes are tracked in a small changed
+    set instead of re-sorting the grid, removing and inserting boxes
+    shifts the entries of the following boxes like list.pop and
+    list.insert shift their positions.
+    """
+
+    def __init__(self, boxes: BoxStore | List[Box] = ()):
+        self.rebuild(boxes)
+
+    def __len__(self):
+        return len(self._coords)
+
+    @property
+    def coords(self) -> np.ndarray:
+        """
+        (n, 4) [left, top, right, bottom] rows of the indexed boxes, not
+        to be changed in place
+        """
+        return self._coords
+
+    def rebuild(self, boxes: BoxStore | List[Box] = None):
+        """
+        index boxes, or re-index the current boxes if boxes is None
+        """
+        if boxes is not None:
+            # an own copy, cell ids of large sheets overflow int32
+            self._coords = box_coords(boxes).astype(np.int64)
+        coords = self._coords
+        if len(coords):
+            sizes = np.maximum(coords[:, 2] - coords[:, 0],
+                               coords[:, 3] - coords[:, 1]) + 1
+            # most boxes overlap one to four cells
+            self._cell_size = max(8, int(np.median(sizes)))
+            self._columns = int(coords[:, 2].max()) // self._cell_size + 1
+        else:
+            self._cell_size = 64
+            self._columns = 1
+
+        cell_ids, boxes = grid_entries(coords, self._cell_size, self._columns)
+        order = np.argsort(cell_ids, kind="stable")
+        self._entry_cells = cell_ids[order]
+        self._entry_boxes = boxes[order]
+        self._changed = np.zeros(len(coords), dtype=bool)
+        self._changed_boxes = set()
+
+    def update(self, i, box: Box):
+        self._coords[i] = box.left_top_corner + box.right_bottom_corner
+        self._mark_changed(i)
+
+    def remove(self, i):
+        self._coords = np.delete(self._coords, i, axis=0)
+        self._changed = np.delete(self._changed, i)
+        keep = self._entry_boxes != i
+        self._entry_cells = self._entry_cells[keep]
+        self._entry_boxes = self._entry_boxes[keep]
+        self._entry_boxes[self._entry_boxes > i] -= 1
+        self._changed_boxes = {
+            j - (j > i) for j in self._changed_boxes if j != i}
+
+    def insert(self, i, box: Box):
+        self._coords = np.insert(
+            self._coords, i, box.left_top_corner + box.right_bottom_corner,
+            axis=0)
+        self._changed = np.insert(self._changed, i, False)
+        self._entry_boxes[self._entry_boxes >= i] += 1
+        self._changed_boxes = {j + (j >= i) for j in self._changed_boxes}
+        self._mark_changed(i)
+
+    def query_point(self, x, y, margin=0) -> List[int]:
+        """
+        ascending indices of the boxes whose rect, grown by margin on
+        every side, contains (x, y). box rects span [left, right + 1]
+        like their QRectF in the preview
+        """
+        candidates = self._candidates(x - margin, y - margin,
+                                      x + margin, y + margin)
+        coords = self._coords[candidates]
+        hit = (coords[:, 0] - margin <= x) & (x <= coords[:, 2] + 1 + margin) \
+            & (coords[:, 1] - margin <= y) & (y <= coords[:, 3] + 1 + margin)
+        return candidates[hit].tolist()
+
+    def query_rect(self, left, top, right, bottom) -> np.ndarray:
+        """
+        ascending indices of the boxes whose rect overlaps the rect from
+        (left, top) to (right, bottom)
+        """
+        candidates = self._candidates(left, top, right, bottom)
+        coords = self._coords[candidates]
+        hit = (coords[:, 0] <= right) & (left <= coords[:, 2] + 1) \
+            & (coords[:, 1] <= bottom) & (top <= coords[:, 3] + 1)
+        return candidates[hit]
+
+    def _candidates(self, left, top, right, bottom) -> np.ndarray:
+        size = self._cell_size
+        max_column = self._columns - 1
+        column_0 = min(max(int(left // size), 0), max_column)
+        column_1 = min(max(int(right // size), 0), max_column)
+        row_0 = max(int(top // size), 0)
+        row_1 = max(int(bottom // size), 0)
+        if (column_1 - column_0 + 1) * (row_1 - row_0 + 1) > MAX_QUERY_CELLS:
+            return np.arange(len(self._coords))
+
+        found = [np.fromiter(self._changed_boxes, dtype=np.int64,
+                             count=len(self._changed_boxes))]
+        for row in range(row_0, row_1 + 1):
+            first = row * self._columns
+            lo = np.searchsorted(self._entry_cells, first + column_0, "left")
+            hi = np.searchsorted(self._entry_cells, first + column_1, "right")
+            boxes = self._entry_boxes[lo:hi]
+            found.append(boxes[~self._changed[boxes]])
+        return np.unique(np.concatenate(found))
+
+    def _mark_changed(self, i):
+        self._changed[i] = True
+        self._changed_boxes.add(i)
+        if len(self._changed_boxes) > MAX_CHANGED_BOXES:
+            self.rebuild()
@@ -0,0 +1,117 @@
+import numpy as np
+from sprite_splitter import Box
+
+
+def box_coords(boxes) -> np.ndarray:
+    """
+    N x 4 int32 array of (left, top, right, bottom) rows. boxes is a
+    BoxStore, an array of such rows or a sequence of Box. the array of a
+    BoxStore is returned read-only and without copying
+    """
+    if isinstance(boxes, BoxStore):
+        return boxes.coords
+    if isinstance(boxes, np.ndarray):
+        return boxes.astype(np.int32).reshape(-1, 4)
+    return np.array([box.left_top_corner + box.right_bottom_corner
+                     for box in boxes], dtype=np.int32).reshape(-1, 4)
+
+
+class BoxStore:
+    """
+    Boxes of one image kept as rows of an N x 4 int32 array instead of a
+    list of Box objects, 16 bytes per box.
+
+    Indexing and iterating return new Box objects built from the rows,
+    so code written for a list of Box keeps working. Changing a returned
+    Box does not change the store, boxes are replaced with store[i] = box.
+
+    copy() shares the array with the copy, the first write to either of
+    them copies it, so saving, cancelling and handing boxes to other
+    threads never copies boxes that are not changed afterwards.
+    """
+
+    def __init__(self, boxes=()):
+        if isinstance(boxes, BoxStore):
+            boxes._shared = True
+            self._coords = boxes._coords
+            self._shared = True
+        else:
+            self._coords = box_coords(boxes)
+            if isinstance(boxes, np.ndarray) and \
+                    np.shares_memory(self._coords, boxes):
+                # never write through to the caller's array
+                self._coords = self._coords.copy()
+            self._shared = False
+
+    def __len__(self):
+        return len(self._coords)
+
+    def __getitem__(self, i) -> Box:
+        left, top, right, bottom = self._coords[i].tolist()
+        return Box((left, top), (right, bottom))
+
+    def __setitem__(self, i, box: Box):
+        self._own()[i] = box.left_top_corner + box.right_bottom_corner
+
+    def __iter__(self):
+        for left, top, right, bottom in self._coords.tolist():
+            yield Box((left, top), (right, bottom))
+
+    def __getstate__(self):
+        # a pickled store owns its array
+        return {"_coords": self._coords, "_shared": False}
+
+    @property
+    def coords(self) -> np.ndarray:
+        """
+        read-only view of the (left, top, right, bottom) rows
+        """
+        view = self._coords.view()
+        view.flags.writeable = False
+        return view
+
+    def copy(self) -> "BoxStore":
+        return BoxStore(self)
+
+    def insert(self, i, box: Box):
+        self._coords = np.insert(
+            self._coords, i, box.left_top_corner + box.right_bottom_corner,
+            axis=0)
+        self._shared = False
+
+    def pop(self, i=-1) -> Box:
+        box = self[i]
+        self._coords = np.delete(self._coords, i, axis=0)
+        self._shared = False
+        return box
+
+    def normalized(self) -> "BoxStore":
+        """
+        boxes with their corners swapped where right < left or
+        bottom < top
+        """
+        coords = self._coords
+        return BoxStore(np.concatenate(
+            [np.minimum(coords[:, :2], coords[:, 2:]),
+             np.maximum(coords[:, :2], coords[:, 2:])], axis=1))
+
+    def clamped(self, width, height) -> "BoxStore":
+        """
+        boxes clipped to a width x height image
+        """
+        coords = self._coords.copy()
+        np.clip(coords[:, 0::2], 0, width - 1, out=coords[:, 0::2])
+        np.clip(coords[:, 1::2], 0, height - 1, out=coords[:, 1::2])
+        return BoxStore(coords)
+
+    def crop_rects(self):
+        """
+        (left, top, right + 1, bottom + 1) tuples for PIL.Image.crop
+        """
+        return list(map(tuple, (self._coords + (0, 0, 1, 1)).tolist()))
+
+    def _own(self):
+        if self._shared:
+            self._coords = self._coords.copy()
+            self._shared = False
+        return self._coords
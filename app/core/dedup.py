@@ -0,0 +1,264 @@
+import hashlib
+import os
+import threading
+from .export import (EXPORT_FORMATS, encoder_params, load_source_image,
+                     crop_rects, save_sprite_batch)
+from .atlas import write_json_descriptor
+
+# upper bound of sprites hashed by one pool task
+HASH_BATCH_SIZE = 64
+
+# width and height of the difference hash grid, 64 bits per sprite
+DHASH_SIZE = 8
+
+# differing dhash bits up to which two sprites count as the same when
+# similar sprites are merged
+DEFAULT_SIMILAR_DISTANCE = 4
+
+# largest difference of a channel of the color signatures of two sprites
+# merged as similar, the dhash only sees brightness edges
+SIMILAR_COLOR_TOLERANCE = 16
+
+DEDUP_FORMAT_VERSION = 1
+
+# name of the mapping file written next to the unique sprites
+DEDUP_MAPPING_NAME = "sprites.json"
+
+
+def unique_sprite_name(index, fmt="PNG"):
+    return f"sprite_{index}{EXPORT_FORMATS[fmt]}"
+
+
+def sprite_pixels(sprite):
+    """
+    RGBA pixels of a cropped sprite, fully transparent pixels are set to
+    0 so their hidden color never tells two sprites apart
+    """
+    import numpy as np
+    if sprite.mode != "RGBA":
+        sprite = sprite.convert("RGBA")
+    pixels = np.asarray(sprite)
+    transparent = pixels[..., 3] == 0
+    if transparent.any():
+        pixels = pixels.copy()
+        pixels[transparent] = 0
+    return pixels
+
+
+def exact_hash(pixels):
+    """
+    blake2b digest of the size and pixels of a sprite
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr(pixels.shape).encode())
+    digest.update(pixels.tobytes())
+    return digest.digest()
+
+
+def dhash(pixels, size=DHASH_SIZE):
+    """
+    difference hash of a sprite: the brightness of a (size + 1) x size
+    thumbnail, one bit per horizontal neighbour pair. sprites are laid on
+    a mid grey background, so dark and light outlines both count
+    """
+    import numpy as np
+    from PIL import Image as PILImage
+    alpha = pixels[..., 3] / 255.0
+    gray = pixels[..., :3] @ np.array([0.299, 0.587, 0.114])
+    gray = gray * alpha + 128.0 * (1.0 - alpha)
+    thumbnail = np.asarray(
+        PILImage.fromarray(gray.astype(np.float32), "F").resize(
+            (size + 1, size), PILImage.Resampling.BILINEAR))
+    bits = (thumbnail[:, 1:] > thumbnail[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def color_signature(pixels, size=DHASH_SIZE):
+    """
+    mean premultiplied RGBA of every cell of a size x size grid over the
+    sprite, as a (size, size, 4) uint8 array
+    """
+    import numpy as np
+    from PIL import Image as PILImage
+    alpha = pixels[..., 3] / 255.0
+    channels = [pixels[..., channel] * alpha for channel in range(3)]
+    channels.append(pixels[..., 3])
+    cells = [np.asarray(PILImage.fromarray(
+        channel.astype(np.float32), "F").resize(
+            (size, size), PILImage.Resampling.BOX))
+        for channel in channels]
+    return np.rint(np.stack(cells, axis=2)).astype(np.uint8)
+
+
+def hash_sprite_batch(image, crop_rects, similar, stop_events):
+    """
+    (exact hash, (dhash, color signature) or None) of every crop rect of
+    image
+    """
+    hashes = []
+    for crop_rect in crop_rects:
+        if any(event.is_set() for event in stop_events):
+            break
+        pixels = sprite_pixels(image.crop(crop_rect))
+        hashes.append((exact_hash(pixels),
+                       (dhash(pixels), color_signature(pixels))
+                       if similar else None))
+    return hashes
+
+
+class SpriteIndex:
+    """
+    Unique sprites seen so far.
+
+    Exact hashes are looked up in a dict. With a max_distance, sprites
+    of the same size whose dhash differs in at most that many bits and
+    whose color signatures differ in no channel by more than
+    SIMILAR_COLOR_TOLERANCE are matched as well, the earliest one wins.
+
+    The dhash is cut into max_distance + 1 bands, two hashes that close
+    are equal in at least one of them, so only the sprites sharing a band
+    with the new one are compared.
+    """
+
+    def __init__(self, max_distance=None):
+        self.max_distance = max_distance
+        self.count = 0
+        # exact hash -> unique index
+        self._exact = {}
+        # (size, band, band bits) -> [unique index]
+        self._bands = {}
+        # unique index -> (dhash, color signature)
+        self._similar = {}
+        if max_distance is not None:
+            bits = DHASH_SIZE * DHASH_SIZE
+            count = min(max_distance + 1, bits)
+            edges = [bits * band // count for band in range(count + 1)]
+            # (shift, mask) of every band
+            self._band_masks = [(start, (1 << (end - start)) - 1)
+                                for start, end in zip(edges, edges[1:])]
+
+    def find(self, size, exact, similar=None):
+        import numpy as np
+        index = self._exact.get(exact)
+        if index is not None or self.max_distance is None:
+            return index
+        difference, signature = similar
+        candidates = set()
+        for key in self._band_keys(size, difference):
+            candidates.update(self._bands.get(key, ()))
+        for index in sorted(candidates):
+            other, other_signature = self._similar[index]
+            if (other ^ difference).bit_count() > self.max_distance:
+                continue
+            distance = np.abs(signature.astype(np.int16) - other_signature)
+            if distance.max() <= SIMILAR_COLOR_TOLERANCE:
+                return index
+        return None
+
+    def add(self, size, exact, similar=None):
+        index = self.count
+        self.count += 1
+        self._exact[exact] = index
+        if self.max_distance is not None:
+            self._similar[index] = similar
+            for key in self._band_keys(size, similar[0]):
+                self._bands.setdefault(key, []).append(index)
+        return index
+
+    def lookup(self, size, exact, similar=None):
+        """
+        (unique index, True if the sprite was not seen before)
+        """
+        index = self.find(size, exact, similar)
+        if index is not None:
+            self._exact.setdefault(exact, index)
+            return index, False
+        return self.add(size, exact, similar), True
+
+    def _band_keys(self, size, difference):
+        return [(size, band, (difference >> shift) & mask)
+                for band, (shift, mask) in enumerate(self._band_masks)]
+
+
+def export_unique_sprites(sources, export_dir, fmt="PNG", options=None,
+                          max_distance=None, max_workers=None,
+                          progress=None, cancel_event=None):
+    """
+    export the boxes of several images with every distinct sprite written
+    once, as sprite_0, sprite_1, ... in export_dir.
+
+    sources are (image path, boxes) pairs. sprites are told apart by a
+    blake2b hash of their pixels, with max_distance sprites of the same
+    size whose difference hashes are that close and whose colors match
+    are merged too. crops are hashed by a thread pool in box order, so
+    the first occurrence of a sprite always gives its file.
+
+    DEDUP_MAPPING_NAME maps the boxes of every image to their sprite
+    file, it is written unless the export is cancelled. progress(done,
+    total) counts boxes. returns the number of written sprites
+    """
+    from concurrent.futures import ThreadPoolExecutor, wait
+    params = encoder_params(fmt, options)
+    cancel_event = cancel_event or threading.Event()
+    abort_event = threading.Event()
+    stop_events = (cancel_event, abort_event)
+    max_workers = max_workers or os.cpu_count() or 1
+    sprite_index = SpriteIndex(max_distance)
+    similar = max_distance is not None
+    total = sum(len(boxes) for _, boxes in sources)
+    done = 0
+    images = []
+    written = 0
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        try:
+            for image_path, boxes in sources:
+                if cancel_event.is_set():
+                    break
+                image = load_source_image(image_path)
+                crops = crop_rects(boxes, image.width, image.height)
+                batches = [crops[start:start + HASH_BATCH_SIZE]
+                           for start in range(0, len(crops), HASH_BATCH_SIZE)]
+                hash_futures = [executor.submit(
+                    hash_sprite_batch, image, batch, similar, stop_events)
+                    for batch in batches]
+                save_futures = []
+                mapping = []
+                for batch, future in zip(batches, hash_futures):
+                    hashes = future.result()
+                    if len(hashes) < len(batch):
+                        # cancelled while hashing
+                        break
+                    new_crops = []
+                    new_paths = []
+                    for (left, top, right, bottom), (exact, looks) in \
+                            zip(batch, hashes):
+                        size = (right - left, bottom - top)
+                        index, is_new = sprite_index.lookup(
+                            size, exact, looks)
+                        name = unique_sprite_name(index, fmt)
+                        if is_new:
+                            new_crops.append((left, top, right, bottom))
+                            new_paths.append(os.path.join(export_dir, name))
+                        mapping.append({"file": name,
+                                        "source": [left, top, *size]})
+                    save_futures.append(executor.submit(
+                        save_sprite_batch, image, new_crops, new_paths, fmt,
+                        params, stop_events))
+                    done += len(hashes)
+                    if progress is not None:
+                        progress(done, total)
+                for future in wait(save_futures).done:
+                    # re-raises the first failed save
+                    written += future.result()
+                images.append({"image": os.path.abspath(image_path),
+                               "boxes": mapping})
+        finally:
+            abort_event.set()
+
+    if not cancel_event.is_set():
+        write_json_descriptor(
+            os.path.join(export_dir, DEDUP_MAPPING_NAME),
+            {"version": DEDUP_FORMAT_VERSION, "sprites": sprite_index.count,
+             "images": images})
+    return written
@@ -0,0 +1,153 @@
+import json
+from typing import List, TYPE_CHECKING
+
+# the splitters and the box cache are imported on first use, the GUI
+# only needs the engine table below to build its settings panel
+if TYPE_CHECKING:
+    from sprite_splitter import Box
+    from .box_store import BoxStore
+
+DEFAULT_ENGINE = "sprite-splitter"
+
+# engine name -> (display name, options accepted by its splitter)
+SPLITTER_ENGINES = {
+    "sprite-splitter": ("sprite-splitter library", ()),
+    "numpy": ("NumPy components",
+              ("alpha_threshold", "merge_distance", "band_height")),
+    "grid": ("Grid cells", ("alpha_threshold", "trim_cells")),
+}
+
+# engines whose boxes are the connected sprites of the alpha mask, their
+# boxes can be labeled again in part after the image changed
+RELABEL_ENGINES = ("numpy",)
+
+# options that change how boxes are computed, but not the boxes
+RESULT_NEUTRAL_OPTIONS = ("band_height",)
+
+# rows per band of the tiled detection mode
+TILED_BAND_HEIGHT = 512
+
+# ways to resolve boxes overlapping each other, name -> display name
+OVERLAP_MODES = {
+    "keep": "Keep",
+    "nested": "Drop nested",
+    "merge": "Merge overlapping",
+}
+
+# post-processing option -> the value that switches its step off, the
+# steps run on the boxes of every engine
+POSTPROCESS_DEFAULTS = {"merge_gap": None, "min_area": 0, "overlaps": "keep"}
+
+
+def create_splitter(image_path: str, engine=DEFAULT_ENGINE, options=None):
+    if engine not in SPLITTER_ENGINES:
+        raise ValueError(f"Unknown splitter engine: {engine}")
+    options = engine_options(engine, options)
+    if engine == "numpy":
+        from .numpy_splitter import NumpyAlphaSplitter
+        return NumpyAlphaSplitter(image_path, **options)
+    if engine == "grid":
+        from .grid_splitter import GridSpriteSplitter
+        return GridSpriteSplitter(image_path, **options)
+    from sprite_splitter import AlphaSpriteSplitter
+    return AlphaSpriteSplitter(image_path)
+
+
+def detect_boxes(image_path: str, engine=DEFAULT_ENGINE,
+                 options=None) -> "BoxStore":
+    """
+    boxes of the engine, post-processed if options switch it on
+    """
+    from .box_store import BoxStore
+    splitter = create_splitter(image_path, engine, options)
+    if hasattr(splitter, "get_sprite_coords"):
+        # skip the Box objects, the splitter has the rows already
+        boxes = BoxStore(splitter.get_sprite_coords())
+    else:
+        boxes = BoxStore(splitter.get_sprite_boxes())
+    postprocess = postprocess_options(options)
+    if postprocess:
+        from .postprocess import postprocess_boxes
+        boxes = BoxStore(postprocess_boxes(boxes, **postprocess))
+    return boxes
+
+
+def postprocess_options(options):
+    """
+    the post-processing options of options that are switched on
+    """
+    return {k: v for k, v in (options or {}).items()
+            if k in POSTPROCESS_DEFAULTS and v != POSTPROCESS_DEFAULTS[k]}
+
+
+def engine_options(engine, options):
+    """
+    the subset of options that affects the given engine
+    """
+    accepted = SPLITTER_ENGINES[engine][1]
+    return {k: v for k, v in (options or {}).items() if k in accepted}
+
+
+def split_params(engine=DEFAULT_ENGINE, options=None):
+    """
+    key describing the splitter configuration, detected boxes are only
+    reused for the same key
+    """
+    # post-processing options are only listed when switched on, so the
+    # keys of earlier cached boxes stay valid
+    params = {"engine": engine, **engine_options(engine, options),
+              **postprocess_options(options)}
+    for option in RESULT_NEUTRAL_OPTIONS:
+        params.pop(option, None)
+    if engine == "sprite-splitter":
+        params["algorithm"] = "sprite-scan"
+    return json.dumps(params, sort_keys=True)
+
+
+def split_image(image_path: str, engine=DEFAULT_ENGINE, options=None,
+                use_cache=True) -> "BoxStore":
+    """
+    detect sprite boxes of a single image, going through the on-disk box
+    cache first.
+
+    this runs inside the split worker processes, so it (and everything
+    it imports) must stay importable without Qt
+    """
+    from .box_cache import get_box_cache
+    cache = get_box_cache() if use_cache else None
+    if cache is None:
+        return detect_boxes(image_path, engine, options)
+
+    digest = cache.file_digest(image_path)
+    params = split_params(engine, options)
+    boxes = cache.get(digest, params)
+    if boxes is None:
+        boxes = detect_boxes(image_path, engine, options)
+        cache.put(digest, params, boxes)
+    return boxes
+
+
+def save_detected_boxes(image_path: str, boxes: "BoxStore | List[Box]",
+                        engine=DEFAULT_ENGINE, options=None):
+    """
+    remember boxes of image_path as detected by the engine, edited boxes
+    saved for it are still returned first
+    """
+    from .box_cache import get_box_cache
+    cache = get_box_cache()
+    if cache is not None:
+        cache.put(cache.file_digest(image_path),
+                  split_params(engine, options), boxes)
+
+
+def save_edited_boxes(image_path: str, boxes: "BoxStore | List[Box]",
+                      engine=DEFAULT_ENGINE, options=None):
+    """
+    remember user edited boxes of image_path, they are returned by
+    split_image instead of the detected ones from now on
+    """
+    from .box_cache import get_box_cache
+    cache = get_box_cache()
+    if cache is not None:
+        cache.put(cache.file_digest(image_path),
+                  split_params(engine, options), boxes, edited=True)
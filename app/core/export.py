@@ -0,0 +1,148 @@
+import os
+import threading
+from .perf import tracer
+
+# PIL and the thread pool are imported on first export, the GUI imports
+# this module for its settings panel
+
+# format name -> file extension
+EXPORT_FORMATS = {
+    "PNG": ".png",
+    "WebP": ".webp",
+}
+
+# upper bound of sprites saved by one pool task
+EXPORT_BATCH_SIZE = 32
+
+DEFAULT_EXPORT_OPTIONS = {
+    "compress_level": 6,
+    "optimize": False,
+    "lossless": True,
+}
+
+
+def encoder_params(fmt="PNG", options=None):
+    """
+    keyword arguments for PIL.Image.save of the given format
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    options = {**DEFAULT_EXPORT_OPTIONS, **(options or {})}
+    if fmt == "PNG":
+        # optimize makes the encoder search for the best compression,
+        # compress_level is ignored then
+        return {"compress_level": options["compress_level"],
+                "optimize": options["optimize"]}
+    return {"lossless": options["lossless"]}
+
+
+def sprite_path(export_dir, base_name, index, fmt="PNG"):
+    return os.path.join(
+        export_dir, f"{base_name}_sprite_{index}{EXPORT_FORMATS[fmt]}")
+
+
+def load_source_image(image_path, rgba=False):
+    """
+    decode the sprite sheet once, crops of a loaded image can be taken
+    from several threads at the same time.
+
+    an image the preview already decoded is taken from the image cache.
+    the cache holds RGBA pixels, other sheets are decoded again unless
+    rgba is set, so their sprites keep the mode of the sheet
+    """
+    from .image_cache import get_image_cache
+    decoded = get_image_cache().peek(image_path)
+    if decoded is not None and (rgba or decoded.mode == "RGBA"):
+        return decoded.pil()
+    from PIL import Image as PILImage
+    image = PILImage.open(image_path)
+    image.load()
+    if rgba and image.mode != "RGBA":
+        image = image.convert("RGBA")
+    return image
+
+
+def crop_rects(boxes, width, height):
+    """
+    PIL crop rects of boxes, normalized and clipped to a width x height
+    image in one pass over the box array
+    """
+    from .box_store import BoxStore
+    return BoxStore(boxes).normalized().clamped(width, height).crop_rects()
+
+
+def save_sprite(image, crop_rect, output_path, fmt="PNG", params=None):
+    with tracer.span("save sprite", "export", path=output_path):
+        sprite = image.crop(crop_rect)
+        sprite.save(output_path, fmt, **(params or {}))
+
+
+def save_sprite_batch(image, crop_rects, output_paths, fmt, params,
+                      stop_events):
+    saved = 0
+    for crop_rect, output_path in zip(crop_rects, output_paths):
+        if any(event.is_set() for event in stop_events):
+            break
+        save_sprite(image, crop_rect, output_path, fmt, params)
+        saved += 1
+    return saved
+
+
+def export_sprites(image_path, boxes, export_dir, fmt="PNG", options=None,
+                   max_workers=None, progress=None, cancel_event=None):
+    """
+    crop every box of image_path and write it to export_dir.
+
+    boxes are a BoxStore, (left, top, right, bottom) rows or a list of
+    Box. the source is decoded once and shared read-only by a thread
+    pool, PIL releases the GIL while encoding so the encoders run in
+    parallel. boxes are handed out in small batches and only a few
+    batches per worker are in flight at a time, which bounds memory on
+    sheets with thousands of boxes.
+
+    progress(done, total) is called from the calling thread. returns the
+    number of exported sprites, which is smaller than len(boxes) if
+    cancel_event was set.
+    """
+    from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+    params = encoder_params(fmt, options)
+    image = load_source_image(image_path)
+    crops = crop_rects(boxes, image.width, image.height)
+    base_name = os.path.splitext(os.path.basename(image_path))[0]
+    cancel_event = cancel_event or threading.Event()
+    # set when the export ends early for any other reason
+    abort_event = threading.Event()
+    max_workers = max_workers or os.cpu_count() or 1
+    total = len(crops)
+    # most sprites encode in well under a millisecond, one future per
+    # sprite would cost more than the encoding itself
+    batch_size = max(1, min(EXPORT_BATCH_SIZE, total // (max_workers * 4)))
+    done = 0
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        in_flight = set()
+        next_index = 0
+        try:
+            while next_index < total or in_flight:
+                while next_index < total \
+                        and len(in_flight) < max_workers * 2 \
+                        and not cancel_event.is_set():
+                    end = min(next_index + batch_size, total)
+                    in_flight.add(executor.submit(
+                        save_sprite_batch, image, crops[next_index:end],
+                        [sprite_path(export_dir, base_name, i, fmt)
+                         for i in range(next_index, end)],
+                        fmt, params, (cancel_event, abort_event)))
+                    next_index = end
+                if not in_flight:
+                    break
+                finished, in_flight = wait(in_flight,
+                                           return_when=FIRST_COMPLETED)
+                for future in finished:
+                    # re-raises the first failed save
+                    done += future.result()
+                if progress is not None:
+                    progress(done, total)
+        finally:
+            abort_event.set()
+    return done
@@ -0,0 +1,59 @@
+import glob
+import os
+
+# files with these suffixes are picked up when folders are scanned
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".gif", ".webp",
+                    ".tga", ".tif", ".tiff", ".dds")
+
+
+def is_image_file(path):
+    return path.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def needs_scan(path):
+    """
+    True for folders and glob patterns, which are expanded by
+    iter_image_files, False for single files
+    """
+    if glob.has_magic(path) and not os.path.exists(path):
+        return True
+    return os.path.isdir(path)
+
+
+def scan_folder(folder):
+    """
+    image files below folder in sorted order, hidden folders are skipped
+    """
+    for root, dirs, files in os.walk(folder):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for name in sorted(files):
+            if is_image_file(name):
+                yield os.path.join(root, name)
+
+
+def iter_glob(pattern):
+    for match in sorted(glob.iglob(pattern, recursive=True)):
+        if os.path.isdir(match):
+            yield from scan_folder(match)
+        elif is_image_file(match):
+            yield match
+
+
+def iter_image_files(paths):
+    """
+    expand paths lazily: folders are scanned recursively, glob patterns
+    (** included) are matched, single files are passed through as they
+    are. every file is yielded once
+    """
+    seen = set()
+    for path in paths:
+        if not needs_scan(path):
+            found = [path]
+        elif os.path.isdir(path):
+            found = scan_folder(path)
+        else:
+            found = iter_glob(path)
+        for file_path in found:
+            if file_path not in seen:
+                seen.add(file_path)
+                yield file_path
@@ -0,0 +1,173 @@
+import numpy as np
+from sprite_splitter import Box
+from typing import List
+from .alpha_bands import load_alpha
+
+# smallest cell edge considered when the pitch is searched
+MIN_CELL_SIZE = 2
+
+# a pitch is rejected if fewer of its cells along an axis hold sprites,
+# otherwise half a pitch would fit sprites that sit in one half of
+# their cells
+MIN_FILLED_SHARE = 0.75
+
+
+def fold(occupied: np.ndarray, pitch: int) -> np.ndarray:
+    """
+    occupied phases modulo pitch, True where any position with that
+    phase is occupied
+    """
+    padded = np.zeros(-(-len(occupied) // pitch) * pitch, dtype=bool)
+    padded[:len(occupied)] = occupied
+    return padded.reshape(-1, pitch).any(axis=0)
+
+
+def longest_run(occupied: np.ndarray) -> int:
+    steps = np.diff(np.concatenate(([0], occupied.astype(np.int8), [0])))
+    starts = np.nonzero(steps == 1)[0]
+    ends = np.nonzero(steps == -1)[0]
+    return int((ends - starts).max()) if len(starts) else 0
+
+
+def cell_layout(occupied: np.ndarray, pitch: int):
+    """
+    (offset, cell size) of a grid with the given pitch: cells start at
+    offset + k * pitch and are as wide as the content of the widest
+    cell, the rest of the pitch is spacing. cell size is pitch if no
+    phase is empty in every cell
+    """
+    phases = fold(occupied, pitch)
+    if phases.all():
+        return 0, pitch
+    # the longest run of empty phases, taken around the end of the
+    # pitch, separates neighbouring cells
+    doubled = np.concatenate((phases, phases)).astype(np.int8)
+    steps = np.diff(np.concatenate(([1], doubled, [1])))
+    starts = np.nonzero(steps == -1)[0]
+    ends = np.nonzero(steps == 1)[0]
+    lengths = np.minimum(ends - starts, pitch)
+    longest = int(np.argmax(lengths))
+    offset = int(ends[longest]) % pitch
+    return offset, pitch - int(lengths[longest])
+
+
+def detect_pitch(occupied: np.ndarray) -> int:
+    """
+    cell pitch along one axis of the sheet, 0 if there is no grid.
+
+    a pitch fits if some phase is empty in every cell, so grid lines
+    never cut through sprites. around the true pitch a few neighbouring
+    ones fit as well, the one with the widest common gap wins
+    """
+    positions = np.nonzero(occupied)[0]
+    if len(positions) == 0:
+        return 0
+    content = occupied[positions[0]:positions[-1] + 1]
+    positions = positions - positions[0]
+    best_pitch, best_gap = 0, 0
+    # shorter pitches would cut a run of occupied pixels
+    for pitch in range(max(MIN_CELL_SIZE, longest_run(content) + 1),
+                       len(content)):
+        offset, size = cell_layout(content, pitch)
+        cells = (positions - offset) // pitch
+        count = int(cells[-1] - cells[0]) + 1
+        fits = size < pitch and count > 1 and \
+            len(np.unique(cells)) >= count * MIN_FILLED_SHARE
+        if fits and pitch - size > best_gap:
+            best_pitch, best_gap = pitch, pitch - size
+        elif not fits and best_pitch:
+            break
+    return best_pitch
+
+
+def axis_cells(occupied: np.ndarray):
+    """
+    (starts, ends) of the cells along one axis from the columns or rows
+    that hold sprite pixels, inclusive and clipped to the image. a
+    single cell covers the content if there is no grid
+    """
+    positions = np.nonzero(occupied)[0].astype(np.int64)
+    if len(positions) == 0:
+        return positions, positions
+    pitch = detect_pitch(occupied)
+    if pitch == 0:
+        return positions[:1], positions[-1:]
+    offset, size = cell_layout(occupied, pitch)
+    # a cell may start before the image, if the offset wraps around
+    first = (int(positions[0]) - offset) // pitch
+    last = (int(positions[-1]) - offset) // pitch
+    starts = offset + np.arange(first, last + 1, dtype=np.int64) * pitch
+    ends = np.minimum(starts + size - 1, len(occupied) - 1)
+    return np.maximum(starts, 0), ends
+
+
+def grid_boxes(mask: np.ndarray, trim_cells=False) -> np.ndarray:
+    """
+    (n, 4) array of inclusive [left, top, right, bottom] per non-empty
+    cell of the grid the sprites in mask are laid out on, ordered top
+    to bottom, left to right
+    """
+    xs, xe = axis_cells(mask.any(axis=0))
+    ys, ye = axis_cells(mask.any(axis=1))
+    if len(xs) == 0 or len(ys) == 0:
+        return np.zeros((0, 4), dtype=np.int64)
+
+    # occupied columns per row of cells, any() on the row slices is many
+    # times faster than reduceat along the first axis
+    row_bands = np.array([mask[top:bottom + 1].any(axis=0)
+                          for top, bottom in zip(ys.tolist(), ye.tolist())])
+    # every pixel outside the cells is transparent, so reducing from one
+    # cell start to the next sees the pixels of that cell only
+    filled = np.logical_or.reduceat(row_bands, xs, axis=1)
+    rows, columns = np.nonzero(filled)
+    if not trim_cells:
+        return np.stack([xs[columns], ys[rows], xe[columns], ye[rows]],
+                        axis=1)
+
+    column_bands = np.logical_or.reduceat(mask, xs, axis=1)
+    height, width = mask.shape
+    x_index = np.arange(width)
+    y_index = np.arange(height)[:, None]
+    left = np.minimum.reduceat(
+        np.where(row_bands, x_index, width), xs, axis=1)
+    right = np.maximum.reduceat(
+        np.where(row_bands, x_index, -1), xs, axis=1)
+    top = np.minimum.reduceat(
+        np.where(column_bands, y_index, height), ys, axis=0)
+    bottom = np.maximum.reduceat(
+        np.where(column_bands, y_index, -1), ys, axis=0)
+    return np.stack([left[rows, columns], top[rows, columns],
+                     right[rows, columns], bottom[rows, columns]], axis=1)
+
+
+class GridSpriteSplitter:
+    """
+    Splitter for sheets laid out on a uniform grid.
+
+    Instead of labeling connected components, the cell pitch is found
+    from the periodicity of the alpha projections of columns and rows.
+    Cell offset and size follow from the phases that are transparent
+    in every cell. Each non-empty cell becomes one box, trimmed to its
+    content with trim_cells. Sheets without a grid along an axis are
+    treated as a single cell along it.
+    """
+
+    def __init__(self, image_path: str, alpha_threshold=0, trim_cells=False):
+        self._alpha = load_alpha(image_path)
+        self.alpha_threshold = alpha_threshold
+        self.trim_cells = trim_cells
+        self._last_sprite_coords: np.ndarray | None = None
+
+    def get_sprite_coords(self) -> np.ndarray:
+        """
+        the sprite boxes as (left, top, right, bottom) rows
+        """
+        if self._last_sprite_coords is None:
+            self._last_sprite_coords = grid_boxes(
+                self._alpha > self.alpha_threshold, self.trim_cells)
+        return self._last_sprite_coords
+
+    def get_sprite_boxes(self) -> List[Box]:
+        return [Box((left, top), (right, bottom))
+                for left, top, right, bottom
+                in self.get_sprite_coords().tolist()]
@@ -0,0 +1,160 @@
+DEFAULT_HISTORY_DEPTH = 200
+
+
+class ModifyBox:
+    __slots__ = ("index", "old_box", "new_box")
+
+    def __init__(self, index, old_box, new_box):
+        self.index = index
+        self.old_box = old_box
+        self.new_box = new_box
+
+    def redo(self, target):
+        target.set_box(self.index, self.new_box)
+        return self.index
+
+    def undo(self, target):
+        target.set_box(self.index, self.old_box)
+        return self.index
+
+
+class InsertBox:
+    __slots__ = ("index", "box")
+
+    def __init__(self, index, box):
+        self.index = index
+        self.box = box
+
+    def redo(self, target):
+        target.insert_box(self.index, self.box)
+        return self.index
+
+    def undo(self, target):
+        target.remove_box(self.index)
+        return None
+
+
+class DeleteBox:
+    __slots__ = ("index", "box")
+
+    def __init__(self, index, box):
+        self.index = index
+        self.box = box
+
+    def redo(self, target):
+        target.remove_box(self.index)
+        return None
+
+    def undo(self, target):
+        target.insert_box(self.index, self.box)
+        return self.index
+
+
+class ReplaceBoxes:
+    """
+    a bulk edit of many boxes at once, both box sets are kept in full
+    """
+    __slots__ = ("old_boxes", "new_boxes")
+
+    def __init__(self, old_boxes, new_boxes):
+        self.old_boxes = old_boxes
+        self.new_boxes = new_boxes
+
+    def redo(self, target):
+        target.replace_boxes(self.new_boxes)
+        return None
+
+    def undo(self, target):
+        target.replace_boxes(self.old_boxes)
+        return None
+
+
+class BoxHistory:
+    """
+    Undo and redo history of the box edits of one image.
+
+    Every edit is stored as a small command holding only the boxes it
+    touched, boxes are never changed in place, so a command stays valid
+    as long as it is in the history. Commands are replayed on a target
+    with set_box, insert_box, remove_box and replace_boxes methods.
+
+    commands[:position] are applied. saved is the position matching the
+    boxes last saved, or None once that state can not be reached anymore.
+    """
+
+    def __init__(self, max_depth=DEFAULT_HISTORY_DEPTH):
+        self.max_depth = max_depth
+        self.commands = []
+        self.position = 0
+        self.saved = 0
+
+    def record(self, command):
+        """
+        add an already applied command, this drops the redo steps
+        """
+        del self.commands[self.position:]
+        if self.saved is not None and self.saved > self.position:
+            self.saved = None
+        self.commands.append(command)
+        self.position += 1
+        self._trim()
+
+    def set_max_depth(self, max_depth):
+        self.max_depth = max_depth
+        self._trim()
+
+    def _trim(self):
+        excess = len(self.commands) - self.max_depth
+        if excess <= 0:
+            return
+        # drop the oldest steps, redo steps are kept
+        excess = min(excess, self.position)
+        del self.commands[:excess]
+        self.position -= excess
+        if self.saved is not None:
+            self.saved = self.saved - excess if self.saved >= excess else None
+
+    def can_undo(self):
+        return self.position > 0
+
+    def can_redo(self):
+        return self.position < len(self.commands)
+
+    def undo(self, target):
+        """
+        revert the last command on target, returns the index of the box
+        to select afterwards, or None
+        """
+        if not self.can_undo():
+            return None
+        self.position -= 1
+        return self.commands[self.position].undo(target)
+
+    def redo(self, target):
+        if not self.can_redo():
+            return None
+        command = self.commands[self.position]
+        self.position += 1
+        return command.redo(target)
+
+    def mark_saved(self):
+        self.saved = self.position
+
+    def is_modified(self):
+        return self.position != self.saved
+
+    def seek_saved(self):
+        """
+        the boxes were reset to their saved state from outside, move the
+        position there without replaying anything. steps done after the
+        save stay available as redo steps
+        """
+        if self.saved is None:
+            self.clear()
+        else:
+            self.position = self.saved
+
+    def clear(self):
+        self.commands.clear()
+        self.position = 0
+        self.saved = 0
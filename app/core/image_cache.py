@@ -0,0 +1,162 @@
+import os
+import threading
+from collections import OrderedDict
+
+# upper bound of the decoded pixels kept in memory, in bytes
+DEFAULT_IMAGE_CACHE_BYTES = 512 * 1024 * 1024
+
+
+class DecodedImage:
+    """
+    Pixels of one image file, decoded once to a read-only RGBA array.
+
+    pil() and the QImage built by the preview wrap the same buffer
+    without copying it, so they must not outlive this object.
+    """
+
+    def __init__(self, path, mtime_ns, file_size, mode, pixels):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.file_size = file_size
+        # mode of the file before it was converted to RGBA
+        self.mode = mode
+        self.pixels = pixels
+        self.pixels.flags.writeable = False
+
+    @property
+    def width(self):
+        return self.pixels.shape[1]
+
+    @property
+    def height(self):
+        return self.pixels.shape[0]
+
+    @property
+    def nbytes(self):
+        return self.pixels.nbytes
+
+    def pil(self):
+        """
+        read-only PIL image on the pixel buffer
+        """
+        from PIL import Image as PILImage
+        return PILImage.frombuffer("RGBA", (self.width, self.height),
+                                   self.pixels, "raw", "RGBA", 0, 1)
+
+
+def decode_image(path, stat=None) -> DecodedImage:
+    import numpy as np
+    from PIL import Image as PILImage
+    stat = stat or os.stat(path)
+    with PILImage.open(path) as image:
+        mode = image.mode
+        image.load()
+        if image.mode != "RGBA":
+            image = image.convert("RGBA")
+        pixels = np.asarray(image)
+    return DecodedImage(path, stat.st_mtime_ns, stat.st_size, mode, pixels)
+
+
+class ImageCache:
+    """
+    LRU cache of decoded images shared by the preview, the info panel
+    and export, so an image is decoded once however many of them use it.
+
+    Entries are checked against the size and mtime of their file on
+    every lookup and decoded again once it changed. The pixels of all
+    entries are bounded by max_bytes, the most recently used image is
+    always kept, even if it is larger on its own.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_IMAGE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        # export threads share the cache with the GUI thread
+        self._lock = threading.Lock()
+
+    def get(self, path) -> DecodedImage:
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry.mtime_ns == stat.st_mtime_ns \
+                    and entry.file_size == stat.st_size:
+                self._entries.move_to_end(path)
+                return entry
+        # decode without the lock, other images stay available meanwhile
+        entry = decode_image(path, stat)
+        with self._lock:
+            self._remove(path)
+            self._entries[path] = entry
+            self._bytes += entry.nbytes
+            self._evict()
+        return entry
+
+    def peek(self, path, stale=False) -> DecodedImage | None:
+        """
+        the cached entry of path if it is up to date, or whatever entry
+        is cached with stale, never decodes
+        """
+        path = os.path.abspath(path)
+        with self._lock:
+            entry = self._entries.get(path)
+        if stale or entry is None:
+            return entry
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if entry.mtime_ns != stat.st_mtime_ns \
+                or entry.file_size != stat.st_size:
+            return None
+        return entry
+
+    def refresh(self, path):
+        """
+        decode path again, returns the previous entry, even if its file
+        changed since, or None, and the new one
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self._lock:
+            old = self._entries.get(path)
+        entry = decode_image(path, stat)
+        with self._lock:
+            self._remove(path)
+            self._entries[path] = entry
+            self._bytes += entry.nbytes
+            self._evict()
+        return old, entry
+
+    def invalidate(self, path):
+        with self._lock:
+            self._remove(os.path.abspath(path))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, path):
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self._bytes -= entry.nbytes
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.nbytes
+
+
+_image_cache = None
+
+
+def get_image_cache() -> ImageCache:
+    """
+    per process cache instance
+    """
+    global _image_cache
+    if _image_cache is None:
+        _image_cache = ImageCache()
+    return _image_cache
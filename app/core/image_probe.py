@@ -0,0 +1,94 @@
+import os
+import struct
+import threading
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# png (color type, bit depth) -> mode PIL opens the image with
+PNG_MODES = {
+    (0, 1): "1", (0, 2): "L", (0, 4): "L", (0, 8): "L", (0, 16): "I;16",
+    (2, 8): "RGB", (2, 16): "RGB",
+    (3, 1): "P", (3, 2): "P", (3, 4): "P", (3, 8): "P",
+    (4, 8): "LA", (4, 16): "LA",
+    (6, 8): "RGBA", (6, 16): "RGBA",
+}
+
+
+class ImageInfo:
+    __slots__ = ("width", "height", "mode", "format")
+
+    def __init__(self, width, height, mode, format):
+        self.width = width
+        self.height = height
+        self.mode = mode
+        self.format = format
+
+
+def probe_png(header: bytes) -> ImageInfo | None:
+    """
+    info from the IHDR chunk at the start of a png file, None if header
+    is not one
+    """
+    if len(header) < 29 or not header.startswith(PNG_SIGNATURE) \
+            or header[12:16] != b"IHDR":
+        return None
+    width, height, bit_depth, color_type = struct.unpack(
+        ">IIBB", header[16:26])
+    mode = PNG_MODES.get((color_type, bit_depth))
+    if mode is None or width == 0 or height == 0:
+        raise ValueError("broken PNG header")
+    return ImageInfo(width, height, mode, "PNG")
+
+
+def probe_image(image_path) -> ImageInfo:
+    """
+    size and mode of an image, read from its header only. raises if the
+    file is not an image PIL can open
+    """
+    with open(image_path, "rb") as f:
+        header = f.read(32)
+    info = probe_png(header)
+    if info is not None:
+        return info
+    # other formats are left to PIL, which also reads just the header
+    from PIL import Image as PILImage
+    with PILImage.open(image_path) as image:
+        return ImageInfo(image.width, image.height, image.mode,
+                         image.format)
+
+
+class ProbeCache:
+    """
+    probe results by path, dropped once the size or mtime of the file
+    changed. probes run in background threads, so access is locked
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, image_path) -> ImageInfo:
+        stat = os.stat(image_path)
+        key = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entry = self._entries.get(image_path)
+        if entry is not None and entry[0] == key:
+            return entry[1]
+        info = probe_image(image_path)
+        with self._lock:
+            self._entries[image_path] = (key, info)
+        return info
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_probe_cache = ProbeCache()
+
+
+def get_image_info(image_path) -> ImageInfo:
+    """
+    cached probe_image
+    """
+    return _probe_cache.get(image_path)
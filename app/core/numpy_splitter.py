@@ -0,0 +1,258 @@
+import numpy as np
+from sprite_splitter import Box
+from typing import List
+from .alpha_bands import load_alpha, iter_alpha_bands
+
+# rows converted to runs at once, bounds the scratch memory per step
+ROW_CHUNK = 512
+
+
+def find_runs(mask: np.ndarray, row_offset=0):
+    """
+    horizontal runs of True pixels in mask, as (rows, starts, ends)
+    arrays with exclusive ends, ordered by row and start
+    """
+    height, width = mask.shape
+    rows, starts, ends = [], [], []
+    padded = np.zeros((min(ROW_CHUNK, height), width + 2), dtype=np.int8)
+    for y0 in range(0, height, ROW_CHUNK):
+        chunk = mask[y0:y0 + ROW_CHUNK]
+        scratch = padded[:len(chunk)]
+        scratch[:, 1:-1] = chunk
+        steps = np.diff(scratch, axis=1)
+        chunk_rows, chunk_starts = np.nonzero(steps == 1)
+        chunk_ends = np.nonzero(steps == -1)[1]
+        rows.append(chunk_rows + (y0 + row_offset))
+        starts.append(chunk_starts)
+        ends.append(chunk_ends)
+    if not rows:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+    return (np.concatenate(rows).astype(np.int64),
+            np.concatenate(starts).astype(np.int64),
+            np.concatenate(ends).astype(np.int64))
+
+
+def connect_runs(rows, starts, ends, width, merge_distance=0):
+    """
+    pairs (a, b) of run indices that belong to the same sprite.
+
+    runs are connected when some of their pixels are at most
+    merge_distance + 1 apart in both directions, merge_distance=0 is
+    plain 8-connectivity. rows must be sorted, starts sorted per row
+    """
+    count = len(rows)
+    # row stride of the search keys, wide enough that a search window
+    # never leaks into a neighbouring row
+    stride = width + 2 * merge_distance + 2
+    start_keys = rows * stride + starts
+    end_keys = rows * stride + ends
+    indices = np.arange(count)
+    pairs_a, pairs_b = [], []
+
+    if merge_distance > 0:
+        same_row = (rows[1:] == rows[:-1]) & \
+            (starts[1:] - ends[:-1] <= merge_distance)
+        left = np.nonzero(same_row)[0]
+        pairs_a.append(left + 1)
+        pairs_b.append(left)
+
+    for dy in range(1, merge_distance + 2):
+        # the connected runs of row - dy form one contiguous range
+        lo = np.searchsorted(
+            end_keys, (rows - dy) * stride + starts - merge_distance, "left")
+        hi = np.searchsorted(
+            start_keys, (rows - dy) * stride + ends + merge_distance, "right")
+        counts = np.maximum(hi - lo, 0)
+        total = int(counts.sum())
+        if total == 0:
+            continue
+        first = np.cumsum(counts) - counts
+        pairs_a.append(np.repeat(indices, counts))
+        pairs_b.append(np.repeat(lo, counts) +
+                       np.arange(total) - np.repeat(first, counts))
+
+    if not pairs_a:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+    return np.concatenate(pairs_a), np.concatenate(pairs_b)
+
+
+def component_labels(count, pairs_a, pairs_b) -> np.ndarray:
+    """
+    vectorized union-find: label of every node, equal labels for nodes
+    connected through the given pairs
+    """
+    parent = np.arange(count)
+    while len(pairs_a):
+        roots_a = parent[pairs_a]
+        roots_b = parent[pairs_b]
+        # merged pairs stay merged, only keep the open ones
+        open_pairs = roots_a != roots_b
+        if not open_pairs.any():
+            break
+        pairs_a, pairs_b = pairs_a[open_pairs], pairs_b[open_pairs]
+        roots_a, roots_b = roots_a[open_pairs], roots_b[open_pairs]
+        # hook the larger root under the smaller one, parent[i] <= i
+        # always holds, so no cycles can form
+        np.minimum.at(parent, np.maximum(roots_a, roots_b),
+                      np.minimum(roots_a, roots_b))
+        while True:
+            grand_parent = parent[parent]
+            if np.array_equal(grand_parent, parent):
+                break
+            parent = grand_parent
+    return parent
+
+
+def reduce_boxes(labels, left, top, right, bottom):
+    """
+    sorted unique labels and the (n, 4) bounding box
+    [left, top, right, bottom] covering all items of each label
+    """
+    if len(labels) == 0:
+        return labels, np.zeros((0, 4), dtype=np.int64)
+    order = np.argsort(labels, kind="stable")
+    sorted_labels = labels[order]
+    first = np.concatenate(
+        ([0], np.nonzero(sorted_labels[1:] != sorted_labels[:-1])[0] + 1))
+    boxes = np.stack([
+        np.minimum.reduceat(left[order], first),
+        np.minimum.reduceat(top[order], first),
+        np.maximum.reduceat(right[order], first),
+        np.maximum.reduceat(bottom[order], first),
+    ], axis=1)
+    return sorted_labels[first], boxes
+
+
+class BandLabeler:
+    """
+    Labels an alpha mask fed as consecutive horizontal bands.
+
+    Components are labeled per band. The runs of the last
+    merge_distance + 1 rows are carried over to the next band, so
+    components crossing a band seam get linked, and the linked band
+    components are merged at the end. Only the carried runs and one box
+    per band component are kept, so the result does not depend on the
+    band height.
+    """
+
+    def __init__(self, width, alpha_threshold=0, merge_distance=0):
+        self.width = width
+        self.alpha_threshold = alpha_threshold
+        self.merge_distance = merge_distance
+        empty = np.zeros(0, dtype=np.int64)
+        # runs close enough to the next band to connect to it, with the
+        # band component id they belong to
+        self._tail = (empty, empty, empty, empty)
+        self._component_count = 0
+        self._component_boxes = []
+        self._links_a, self._links_b = [], []
+
+    def feed(self, top, alpha_band: np.ndarray):
+        rows, starts, ends = find_runs(alpha_band > self.alpha_threshold, top)
+        tail_rows, tail_starts, tail_ends, tail_ids = self._tail
+        tail_count = len(tail_rows)
+        rows = np.concatenate((tail_rows, rows))
+        starts = np.concatenate((tail_starts, starts))
+        ends = np.concatenate((tail_ends, ends))
+
+        labels = component_labels(
+            len(rows), *connect_runs(rows, starts, ends, self.width,
+                                     self.merge_distance))
+        band = slice(tail_count, None)
+        unique_labels, boxes = reduce_boxes(
+            labels[band], starts[band], rows[band], ends[band] - 1, rows[band])
+        ids = self._component_count + np.arange(len(unique_labels))
+        self._component_count += len(unique_labels)
+        self._component_boxes.append(boxes)
+
+        if tail_count and len(unique_labels):
+            # carried runs that ended up in a component of this band
+            tail_labels = labels[:tail_count]
+            position = np.minimum(np.searchsorted(unique_labels, tail_labels),
+                                  len(unique_labels) - 1)
+            linked = unique_labels[position] == tail_labels
+            self._links_a.append(ids[position[linked]])
+            self._links_b.append(tail_ids[linked])
+
+        band_ids = ids[np.searchsorted(unique_labels, labels[band])]
+        keep = rows >= top + len(alpha_band) - self.merge_distance - 1
+        self._tail = (rows[keep], starts[keep], ends[keep],
+                      np.concatenate((tail_ids, band_ids))[keep])
+
+    def boxes(self) -> np.ndarray:
+        """
+        (n, 4) array of inclusive [left, top, right, bottom] per sprite,
+        ordered top to bottom, left to right
+        """
+        if not self._component_boxes:
+            return np.zeros((0, 4), dtype=np.int64)
+        boxes = np.concatenate(self._component_boxes)
+        if self._links_a:
+            labels = component_labels(len(boxes),
+                                      np.concatenate(self._links_a),
+                                      np.concatenate(self._links_b))
+            _, boxes = reduce_boxes(labels, *boxes.T)
+        return boxes[np.lexsort((boxes[:, 0], boxes[:, 1]))]
+
+
+def label_alpha(alpha: np.ndarray, alpha_threshold=0,
+                merge_distance=0) -> np.ndarray:
+    labeler = BandLabeler(alpha.shape[1], alpha_threshold, merge_distance)
+    labeler.feed(0, alpha)
+    return labeler.boxes()
+
+
+class NumpyAlphaSplitter:
+    """
+    Alpha sprite splitter based on connected component labeling of the
+    alpha mask, vectorized with numpy.
+
+    Pixels with alpha above alpha_threshold belong to sprites. Sprite
+    pixels are grouped when they are 8-connected, or separated by at most
+    merge_distance transparent pixels, so small gaps (e.g. between hair
+    strands) do not split a sprite apart.
+
+    With a band_height the image is read and labeled in bands of that
+    many rows instead of at once, which bounds the memory used for very
+    large sheets. The boxes are the same either way.
+    """
+
+    def __init__(self, image_path: str, alpha_threshold=0, merge_distance=0,
+                 band_height=0):
+        self._image_path = image_path
+        self.band_height = band_height
+        self._alpha = None if band_height else load_alpha(image_path)
+        self.alpha_threshold = alpha_threshold
+        self.merge_distance = merge_distance
+        self._last_sprite_coords: np.ndarray | None = None
+
+    def get_sprite_coords(self) -> np.ndarray:
+        """
+        the sprite boxes as (left, top, right, bottom) rows
+        """
+        if self._last_sprite_coords is None:
+            if self._alpha is not None:
+                self._last_sprite_coords = label_alpha(
+                    self._alpha, self.alpha_threshold, self.merge_distance)
+            else:
+                self._last_sprite_coords = self._label_bands()
+        return self._last_sprite_coords
+
+    def get_sprite_boxes(self) -> List[Box]:
+        return [Box((left, top), (right, bottom))
+                for left, top, right, bottom
+                in self.get_sprite_coords().tolist()]
+
+    def _label_bands(self):
+        labeler = None
+        for top, alpha in iter_alpha_bands(self._image_path,
+                                           self.band_height):
+            if labeler is None:
+                labeler = BandLabeler(alpha.shape[1], self.alpha_threshold,
+                                      self.merge_distance)
+            labeler.feed(top, alpha)
+        if labeler is None:
+            return np.zeros((0, 4), dtype=np.int64)
+        return labeler.boxes()
@@ -0,0 +1,98 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+# events kept by the tracer, older ones are dropped
+DEFAULT_TRACE_CAPACITY = 100000
+
+# set to 1 to trace from startup on
+TRACE_ENV = "SPRITE_SPLITTER_TRACE"
+
+# returned by every disabled span, nullcontext can be entered repeatedly
+_NO_SPAN = nullcontext()
+
+
+class Tracer:
+    """
+    Opt-in timing of the expensive paths, kept in a ring buffer.
+
+    Events are (name, category, start, duration, thread id, args) with
+    perf_counter seconds. Disabled spans cost one attribute lookup and
+    record nothing. Recording only appends to a deque, so spans can be
+    recorded from any thread.
+    """
+
+    def __init__(self, capacity=DEFAULT_TRACE_CAPACITY, enabled=False):
+        self.enabled = enabled
+        self.events = deque(maxlen=capacity)
+        # name -> duration of its latest event, for the overlay
+        self.latest = {}
+        self._origin = time.perf_counter()
+
+    def span(self, name, category="app", **args):
+        if not self.enabled:
+            return _NO_SPAN
+        return self._span(name, category, args)
+
+    @contextmanager
+    def _span(self, name, category, args):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter(), category, **args)
+
+    def record(self, name, start, end=None, category="app", **args):
+        """
+        add an event measured by the caller, e.g. across signals
+        """
+        if not self.enabled:
+            return
+        duration = (end if end is not None else time.perf_counter()) - start
+        self.events.append((name, category, start, duration,
+                            threading.get_ident(), args))
+        self.latest[name] = duration
+
+    def clear(self):
+        self.events.clear()
+        self.latest.clear()
+
+    def chrome_trace(self):
+        """
+        the events in the trace event format of chrome://tracing and
+        Perfetto
+        """
+        pid = os.getpid()
+        thread_names = {thread.ident: thread.name
+                        for thread in threading.enumerate()}
+        events = []
+        threads = set()
+        for name, category, start, duration, tid, args in list(self.events):
+            threads.add(tid)
+            events.append({
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": round((start - self._origin) * 1e6, 3),
+                "dur": round(duration * 1e6, 3),
+                "pid": pid,
+                "tid": tid,
+                "args": args,
+            })
+        for tid in threads:
+            events.append({
+                "name": "thread_name", "ph": "M", "pid": pid, "tid": tid,
+                "args": {"name": thread_names.get(tid, str(tid))},
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def dump(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.chrome_trace(), f, default=str)
+
+
+# the tracer of this process
+tracer = Tracer(enabled=os.environ.get(TRACE_ENV) == "1")
@@ -0,0 +1,135 @@
+import numpy as np
+from .box_store import BoxStore
+from .box_index import grid_entries, index_runs
+from .detection import OVERLAP_MODES
+
+
+def close_pairs(coords, gap):
+    """
+    (first, second) index arrays of every pair of boxes, first < second,
+    that are at most gap transparent pixels apart both horizontally and
+    vertically. gap 0 pairs touching boxes, -1 only boxes sharing pixels.
+
+    boxes are put in a uniform grid, only boxes listed in the same cell
+    are compared, so this takes O(n log n) for boxes of similar size
+    """
+    empty = np.zeros(0, dtype=np.int64)
+    if len(coords) < 2:
+        return empty, empty
+    # boxes are close exactly if they overlap once grown by gap + 1 to
+    # the right and bottom
+    grown = coords.copy()
+    grown[:, 2:] += gap + 1
+    sizes = np.maximum(grown[:, 2] - grown[:, 0],
+                       grown[:, 3] - grown[:, 1]) + 1
+    cell_size = max(8, int(np.median(sizes)))
+    columns = int(grown[:, 2].max()) // cell_size + 1
+    cell_ids, boxes = grid_entries(grown, cell_size, columns)
+    order = np.argsort(cell_ids, kind="stable")
+    cell_ids = cell_ids[order]
+    boxes = boxes[order]
+
+    # every entry against the entries after it in the same cell
+    positions = np.arange(len(cell_ids))
+    counts = np.searchsorted(cell_ids, cell_ids, "right") - positions - 1
+    first = np.repeat(boxes, counts)
+    second = boxes[index_runs(positions + 1, counts)]
+    cells = np.repeat(cell_ids, counts)
+    a, b = grown[first], grown[second]
+    left = np.maximum(a[:, 0], b[:, 0])
+    top = np.maximum(a[:, 1], b[:, 1])
+    hit = (left <= np.minimum(a[:, 2], b[:, 2])) & \
+        (top <= np.minimum(a[:, 3], b[:, 3]))
+    # boxes sharing several cells are paired once, in the cell holding
+    # the top left corner of their overlap
+    hit &= cells == (top // cell_size) * columns + left // cell_size
+    first, second = first[hit], second[hit]
+    return np.minimum(first, second), np.maximum(first, second)
+
+
+def connected_groups(count, first, second) -> np.ndarray:
+    """
+    the smallest index of the group of every one of count items, items
+    of a pair are in the same group
+    """
+    labels = np.arange(count)
+    while True:
+        low = np.minimum(labels[first], labels[second])
+        hooked = labels.copy()
+        # point the group of either item of a pair to the lower one
+        np.minimum.at(hooked, labels[first], low)
+        np.minimum.at(hooked, labels[second], low)
+        while True:
+            jumped = hooked[hooked]
+            if (jumped == hooked).all():
+                break
+            hooked = jumped
+        if (hooked == labels).all():
+            return labels
+        labels = hooked
+
+
+def merge_close(coords, gap) -> np.ndarray:
+    """
+    replace every group of boxes at most gap pixels apart by their
+    bounding box, until no two boxes are that close. a merged box takes
+    the place of the first box of its group
+    """
+    while True:
+        first, second = close_pairs(coords, gap)
+        if not len(first):
+            return coords
+        labels = connected_groups(len(coords), first, second)
+        order = np.argsort(labels, kind="stable")
+        starts = np.flatnonzero(np.diff(labels[order], prepend=-1))
+        coords = np.concatenate(
+            (np.minimum.reduceat(coords[order, :2], starts),
+             np.maximum.reduceat(coords[order, 2:], starts)), axis=1)
+
+
+def drop_nested(coords) -> np.ndarray:
+    """
+    remove boxes lying inside another box, of equal boxes the first one
+    is kept
+    """
+    first, second = close_pairs(coords, -1)
+    a, b = coords[first], coords[second]
+    a_in_b = (a[:, :2] >= b[:, :2]).all(axis=1) & \
+        (a[:, 2:] <= b[:, 2:]).all(axis=1)
+    b_in_a = (b[:, :2] >= a[:, :2]).all(axis=1) & \
+        (b[:, 2:] <= a[:, 2:]).all(axis=1)
+    nested = np.zeros(len(coords), dtype=bool)
+    nested[first[a_in_b & ~b_in_a]] = True
+    nested[second[b_in_a]] = True
+    return coords[~nested]
+
+
+def postprocess_boxes(boxes, merge_gap=None, min_area=0,
+                      overlaps="keep") -> np.ndarray:
+    """
+    clean up detected or edited boxes, in this order:
+
+    - merge_gap: merge boxes at most this many transparent pixels apart,
+      None keeps them apart
+    - overlaps: "keep" overlapping boxes, drop the "nested" ones lying
+      inside another box, or "merge" overlapping boxes
+    - min_area: drop boxes covering fewer pixels
+
+    boxes keep their order, a merged box takes the place of its first
+    box. returns (n, 4) int32 [left, top, right, bottom] rows
+    """
+    if overlaps not in OVERLAP_MODES:
+        raise ValueError(f"Unknown overlap mode: {overlaps}")
+    # edited boxes may have their corners swapped
+    coords = BoxStore(boxes).normalized().coords.astype(np.int64)
+    if merge_gap is not None:
+        coords = merge_close(coords, merge_gap)
+    if overlaps == "merge":
+        coords = merge_close(coords, -1)
+    elif overlaps == "nested":
+        coords = drop_nested(coords)
+    if min_area > 0:
+        areas = (coords[:, 2] - coords[:, 0] + 1) * \
+            (coords[:, 3] - coords[:, 1] + 1)
+        coords = coords[areas >= min_area]
+    return coords.astype(np.int32)
@@ -0,0 +1,117 @@
+import numpy as np
+from .box_store import BoxStore
+from .numpy_splitter import label_alpha
+
+# changed pixels are gathered per tile of this size, neighbouring changed
+# tiles form one dirty rect
+DIRTY_TILE_SIZE = 64
+
+
+def dirty_rects(old_mask: np.ndarray, new_mask: np.ndarray,
+                tile_size=DIRTY_TILE_SIZE) -> np.ndarray:
+    """
+    (n, 4) array of inclusive [left, top, right, bottom] rects covering
+    every pixel that differs between the two masks, which must have the
+    same shape
+    """
+    height, width = new_mask.shape
+    rows = -(-height // tile_size)
+    columns = -(-width // tile_size)
+    changed = np.zeros((rows * tile_size, columns * tile_size), dtype=bool)
+    np.not_equal(old_mask, new_mask, out=changed[:height, :width])
+    tiles = changed.reshape(rows, tile_size, columns, tile_size).any(
+        axis=(1, 3))
+    if not tiles.any():
+        return np.zeros((0, 4), dtype=np.int64)
+    # clusters of 8-connected changed tiles
+    rects = label_alpha(tiles.view(np.uint8)) * tile_size
+    rects[:, 2:] += tile_size - 1
+    np.minimum(rects[:, 2], width - 1, out=rects[:, 2])
+    np.minimum(rects[:, 3], height - 1, out=rects[:, 3])
+    return rects
+
+
+def overlapping(coords, left, top, right, bottom) -> np.ndarray:
+    return (coords[:, 0] <= right) & (coords[:, 2] >= left) & \
+        (coords[:, 1] <= bottom) & (coords[:, 3] >= top)
+
+
+def relabel_rect(mask, coords, rect, merge_distance=0):
+    """
+    grow rect until no sprite of mask and no box of coords crosses its
+    border, then label it. returns the grown rect and the sprite boxes
+    overlapping it
+    """
+    height, width = mask.shape
+    # pixels this far apart still belong to the same sprite
+    reach = merge_distance + 1
+    left, top, right, bottom = (int(v) for v in rect)
+    while True:
+        hit = coords[overlapping(coords, left, top, right, bottom)]
+        if len(hit):
+            left = min(left, int(hit[:, 0].min()))
+            top = min(top, int(hit[:, 1].min()))
+            right = max(right, int(hit[:, 2].max()))
+            bottom = max(bottom, int(hit[:, 3].max()))
+        # sprites crossing the rect are labeled in full as long as they
+        # stay inside the window, larger ones grow the rect
+        x0, y0 = max(left - 2 * reach, 0), max(top - 2 * reach, 0)
+        x1 = min(right + 2 * reach, width - 1)
+        y1 = min(bottom + 2 * reach, height - 1)
+        sprites = label_alpha(mask[y0:y1 + 1, x0:x1 + 1].view(np.uint8),
+                              0, merge_distance) + (x0, y0, x0, y0)
+        sprites = sprites[overlapping(sprites, left, top, right, bottom)]
+        grown = (left, top, right, bottom)
+        if len(sprites):
+            grown = (min(left, int(sprites[:, 0].min())),
+                     min(top, int(sprites[:, 1].min())),
+                     max(right, int(sprites[:, 2].max())),
+                     max(bottom, int(sprites[:, 3].max())))
+        if grown == (left, top, right, bottom):
+            return grown, sprites
+        left, top, right, bottom = grown
+
+
+def relabel_boxes(boxes, mask: np.ndarray, rects,
+                  merge_distance=0) -> np.ndarray:
+    """
+    boxes of an image after the pixels in rects changed to mask.
+
+    boxes overlapping a changed rect are replaced by the sprites of mask
+    found there, every other box, edited ones included, is kept as it is.
+    only the changed rects grown to the sprites and boxes crossing them
+    are labeled. returns (n, 4) [left, top, right, bottom] rows ordered
+    top to bottom, left to right
+    """
+    # edited boxes may have their corners swapped
+    coords = BoxStore(boxes).normalized().coords.astype(np.int64)
+    for rect in rects:
+        grown, sprites = relabel_rect(mask, coords, rect, merge_distance)
+        # rects may overlap, sprites found for one of them are boxes
+        # for the next
+        coords = np.concatenate(
+            (coords[~overlapping(coords, *grown)], sprites))
+    return coords[np.lexsort((coords[:, 0], coords[:, 1]))]
+
+
+def refresh_boxes(image_path, boxes, alpha_threshold=0, merge_distance=0,
+                  old=None):
+    """
+    decode image_path again after it changed on disk and relabel only
+    the regions whose sprite pixels differ from old, the decode from
+    before the change, or else the decode in the image cache.
+
+    returns the new boxes and the new decode. the boxes are None if
+    there is no old decode of the same size, the image has to be split
+    in full then
+    """
+    from .image_cache import get_image_cache
+    cached, new = get_image_cache().refresh(image_path)
+    if old is None:
+        old = cached
+    if old is None or old.pixels.shape != new.pixels.shape:
+        return None, new
+    old_mask = old.pixels[..., 3] > alpha_threshold
+    new_mask = new.pixels[..., 3] > alpha_threshold
+    return relabel_boxes(boxes, new_mask, dirty_rects(old_mask, new_mask),
+                         merge_distance), new
@@ -0,0 +1,155 @@
+import importlib
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# modules the GUI does not need for its first frame. they are imported
+# where they are used and warmed up in the background once the window
+# is on screen
+HEAVY_MODULES = (
+    "numpy",
+    "PIL.Image",
+    "PIL.PngImagePlugin",
+    "sprite_splitter",
+    "multiprocessing.pool",
+    "concurrent.futures",
+    "sqlite3",
+    "app.core.box_store",
+    "app.core.box_index",
+    "app.core.detection",
+    "app.core.numpy_splitter",
+    "app.core.box_cache",
+    "app.core.export",
+    "app.core.atlas",
+)
+
+
+def warm_up(module_names=HEAVY_MODULES):
+    """
+    import module_names in a daemon thread, so they are ready by the
+    time they are first used
+    """
+    def run():
+        for name in module_names:
+            try:
+                importlib.import_module(name)
+            except Exception:
+                # the real import reports the error where it matters
+                pass
+
+    thread = threading.Thread(target=run, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+class _TimedLoader:
+    def __init__(self, profiler, loader):
+        self._profiler = profiler
+        self._loader = loader
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        with self._profiler._time_import(module.__name__):
+            self._loader.exec_module(module)
+
+
+class StartupProfiler:
+    """
+    Records how long startup phases and module imports take.
+
+    Imports are timed by a finder at the front of sys.meta_path that
+    wraps the loader of every module found afterwards. The self time of
+    an import excludes the imports it triggered, like python -X importtime.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        # (name, duration), marks have no duration
+        self.phases = []
+        self.marks = {}
+        # module name -> [self time, cumulative time, nesting depth]
+        self.imports = {}
+        self._stack = []
+        self._local = threading.local()
+
+    def install(self):
+        sys.meta_path.insert(0, self)
+
+    def uninstall(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def find_spec(self, name, path=None, target=None):
+        # find the real spec with every finder after this one
+        if getattr(self._local, "finding", False):
+            return None
+        self._local.finding = True
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                spec = finder.find_spec(name, path, target)
+                if spec is not None:
+                    break
+            else:
+                return None
+        finally:
+            self._local.finding = False
+        if spec.loader is not None and hasattr(spec.loader, "exec_module") \
+                and threading.current_thread() is threading.main_thread():
+            spec.loader = _TimedLoader(self, spec.loader)
+        return spec
+
+    @contextmanager
+    def _time_import(self, name):
+        self._stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            children = self._stack.pop()
+            self.imports[name] = [elapsed - children, elapsed,
+                                  len(self._stack)]
+            if self._stack:
+                self._stack[-1] += elapsed
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start))
+
+    def mark(self, name):
+        """
+        record a point in time, like the first painted frame
+        """
+        self.phases.append((name, None))
+        self.marks[name] = time.perf_counter() - self.start
+
+    def report(self, file=None, top=15):
+        file = file or sys.stderr
+        print("startup profile (ms)", file=file)
+        for name, elapsed in self.phases:
+            if elapsed is None:
+                print(f"  {name:<28} at {self.marks[name] * 1000:8.1f}",
+                      file=file)
+            else:
+                print(f"  {name:<28} {elapsed * 1000:11.1f}", file=file)
+
+        print(f"slowest imports ({len(self.imports)} modules timed)",
+              file=file)
+        print(f"  {'self':>8} {'cumulative':>11}  module", file=file)
+        slowest = sorted(self.imports.items(), key=lambda item: item[1][1],
+                         reverse=True)
+        for name, (self_time, cumulative, depth) in slowest[:top]:
+            print(f"  {self_time * 1000:8.1f} {cumulative * 1000:11.1f}  "
+                  f"{'  ' * depth}{name}", file=file)
@@ -1,13 +1,17 @@
 from PySide6.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
-    QPushButton
+    QPushButton, QFileDialog, QMessageBox
 )
 from PySide6.QtGui import QShortcut, QKeySequence, QPalette
+from PySide6.QtCore import Signal, QTimer
 from .widgets.file_list import FileListWidget
 from .widgets.preview_area import PreviewArea
 from .widgets.info_panel import InfoPanel
-from sprite_splitter import Box
-from typing import List
+from .core.perf import tracer
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .core.box_store import BoxStore
 
 
 def is_dark_mode(app):
@@ -20,8 +24,12 @@ def is_dark_mode(app):
 
 
 class MainWindow(QMainWindow,):
+    # emitted once, right after the window was painted for the first time
+    first_frame_shown = Signal()
+
     def __init__(self, app):
         super().__init__()
+        self._first_frame_shown = False
         self.setWindowTitle("Sprite Splitter GUI")
         self.setMinimumSize(800, 600)
         self.is_dark_mode = is_dark_mode(app)
@@ -64,14 +72,42 @@ class MainWindow(QMainWindow,):
         self.save_button.clicked.connect(self.save_changes)
         self.cancel_button.clicked.connect(self.cancel_changes)
         self.file_list.file_selected.connect(self.load_image)
+        self.file_list.boxes_reset.connect(self.on_boxes_reset)
         self.preview_area.box_modified.connect(self.on_box_modified)
         self.info_panel.box_info_changed.connect(self.on_box_info_changed)
+        self.info_panel.pre_split_changed.connect(
+            self.file_list.set_pre_split)
+        self.info_panel.history_depth_changed.connect(
+            self.preview_area.set_history_depth)
+        self.info_panel.split_settings_changed.connect(
+            self.on_split_settings_changed)
+        self.info_panel.clean_up_requested.connect(
+            self.preview_area.clean_up_boxes)
         self.info_panel.get_current_boxes = self.get_current_boxes
 
     def setup_shortcuts(self):
         self.undo_shortcut = QShortcut(QKeySequence.Undo, self)
         self.undo_shortcut.activated.connect(
             self.preview_area.undo_last_action)
+        # Ctrl+Shift+Z everywhere, plus the platform redo key (Ctrl+Y on
+        # Windows) if that is a different one
+        redo_keys = [QKeySequence("Ctrl+Shift+Z")]
+        for key in QKeySequence.keyBindings(QKeySequence.Redo):
+            if key not in redo_keys:
+                redo_keys.append(key)
+        self.redo_shortcuts = []
+        for key in redo_keys:
+            shortcut = QShortcut(key, self)
+            shortcut.activated.connect(self.preview_area.redo_last_action)
+            self.redo_shortcuts.append(shortcut)
+
+        # performance overlay, tracing runs while it is shown
+        self.perf_overlay_shortcut = QShortcut(QKeySequence("F3"), self)
+        self.perf_overlay_shortcut.activated.connect(
+            self.preview_area.toggle_perf_overlay)
+        self.save_trace_shortcut = QShortcut(
+            QKeySequence("Ctrl+Shift+T"), self)
+        self.save_trace_shortcut.activated.connect(self.save_trace)
 
     def on_box_modified(self):
         """
@@ -91,13 +127,28 @@ class MainWindow(QMainWindow,):
         is modified
         """
         if self.preview_area.selected_box is not None:
-            self.preview_area.boxes[self.preview_area.selected_box] = new_box
-            self.preview_area.draw_boxes()
+            self.preview_area.edit_box(self.preview_area.selected_box, new_box)
+
+    def on_split_settings_changed(self, engine, options):
+        # boxes of the current image are detected again, drop the loaded
+        # preview so it is rebuilt once they arrive
+        self.preview_area.current_image_path = None
+        self.preview_area.clear_histories()
+        self.save_button.setEnabled(False)
+        self.cancel_button.setEnabled(False)
+        self.file_list.set_split_settings(engine, options)
+
+    def on_boxes_reset(self, image_path):
+        if self.preview_area.current_image_path == image_path:
+            self.preview_area.current_image_path = None
+            self.save_button.setEnabled(False)
+            self.cancel_button.setEnabled(False)
+        self.preview_area.clear_history(image_path)
 
     def save_changes(self):
         self.preview_area.save_changes()
-        self.file_list.image_boxes[self.file_list.currentItem().text()] = \
-            self.preview_area.original_boxes.copy()
+        self.file_list.save_boxes(self.file_list.current_path(),
+                                  self.preview_area.original_boxes.copy())
         self.save_button.setEnabled(False)
         self.cancel_button.setEnabled(False)
 
@@ -106,11 +157,38 @@ class MainWindow(QMainWindow,):
         self.save_button.setEnabled(False)
         self.cancel_button.setEnabled(False)
 
-    def load_image(self, image_path, boxes: List[Box]):
+    def load_image(self, image_path, boxes: "BoxStore"):
         self.preview_area.load_image(image_path, boxes)
         self.info_panel.update_image_info(image_path)
 
+    def save_trace(self):
+        if not tracer.events:
+            QMessageBox.information(
+                self, "Save Trace",
+                "Nothing was traced yet, press F3 to start tracing.")
+            return
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Save Trace", "trace.json", "Trace Files (*.json)")
+        if not path:
+            return
+        try:
+            tracer.dump(path)
+        except OSError as e:
+            QMessageBox.warning(self, "Save trace failed: ", f"{e}")
+
     def get_current_boxes(self):
-        if self.file_list.currentItem():
+        if self.file_list.current_path():
             return self.preview_area.boxes
         return []
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self._first_frame_shown:
+            self._first_frame_shown = True
+            # let the frame reach the screen before anyone reacts
+            QTimer.singleShot(0, self.first_frame_shown.emit)
+
+    def closeEvent(self, event):
+        self.file_list.shutdown()
+        self.info_panel.shutdown()
+        super().closeEvent(event)
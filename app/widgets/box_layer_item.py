@@ -0,0 +1,133 @@
+import numpy as np
+from PySide6.QtWidgets import QGraphicsItem
+from PySide6.QtCore import QRectF, QPoint
+from PySide6.QtGui import QPainter, QImage, QTransform
+from ..core.box_index import index_runs
+
+# boxes smaller than this many device pixels on both sides are drawn
+# into one image with numpy, the painter takes about a microsecond per
+# rect. sub-pixel boxes end up as a single dot there
+RASTER_BOX_PIXELS = 32
+
+
+class BoxLayerItem(QGraphicsItem):
+    """
+    Draws every box of the preview in one paint call.
+
+    The boxes intersecting the exposed rect are looked up in the BoxIndex
+    of the preview. Boxes that are small on screen have their outlines
+    set in a pixel array covering the exposed rect, boxes below a pixel
+    collapse into dots, and the array is drawn as one image. Only the
+    larger boxes go to the painter, as one list of rects. The rect of
+    every box is kept between paints, edits only replace the rects of
+    the boxes they touch and repaint their area.
+    """
+
+    def __init__(self, box_index, pen, bounds: QRectF, parent=None):
+        super().__init__(parent)
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption)
+        self.box_index = box_index
+        self.pen = pen
+        self._bounds = QRectF(bounds)
+        self._rects = []
+        # device pixels per scene unit of the last paint
+        self._scale = 1.0
+        self.reset()
+
+    def boundingRect(self):
+        return self._bounds
+
+    def reset(self):
+        """
+        take the rects of every box from the index again
+        """
+        self._rects = [QRectF(left, top, right - left + 1, bottom - top + 1)
+                       for left, top, right, bottom
+                       in self.box_index.coords.tolist()]
+        self.update()
+
+    def update_box(self, i):
+        old = self._rects[i]
+        self._rects[i] = self._box_rect(i)
+        self._update_area(old.united(self._rects[i]))
+
+    def insert_box(self, i):
+        self._rects.insert(i, self._box_rect(i))
+        self._update_area(self._rects[i])
+
+    def remove_box(self, i):
+        self._update_area(self._rects.pop(i))
+
+    def paint(self, painter, option, widget=None):
+        exposed = option.exposedRect
+        indices = self.box_index.query_rect(
+            exposed.left(), exposed.top(), exposed.right(), exposed.bottom())
+        transform = painter.worldTransform()
+        self._scale = transform.m11()
+        if not len(indices):
+            return
+        coords = self.box_index.coords[indices]
+        sizes = np.maximum(coords[:, 2] - coords[:, 0],
+                           coords[:, 3] - coords[:, 1]) + 1
+        small = sizes * self._scale < RASTER_BOX_PIXELS
+
+        painter.save()
+        # 1 pixel outlines need no antialiasing and draw much faster
+        # without it
+        painter.setRenderHint(QPainter.Antialiasing, False)
+        painter.setPen(self.pen)
+        rects = self._rects
+        painter.drawRects([rects[i] for i in indices[~small].tolist()])
+        if small.any():
+            self._paint_outlines(painter, transform, exposed, coords[small])
+        painter.restore()
+
+    def _paint_outlines(self, painter, transform, exposed, coords):
+        """
+        draw the outlines of coords as one image over the exposed rect
+        """
+        device = transform.mapRect(exposed).toAlignedRect()
+        width, height = device.width(), device.height()
+        if width <= 0 or height <= 0:
+            return
+        scale = np.array([transform.m11(), transform.m22()])
+        offset = np.array([transform.dx() - device.left(),
+                           transform.dy() - device.top()])
+        # device pixels of the corners, the painter draws the right and
+        # bottom edges on the pixel holding right + 1 and bottom + 1 too
+        first = np.floor(coords[:, :2] * scale + offset).astype(np.int64)
+        last = np.maximum(np.floor((coords[:, 2:] + 1) * scale + offset)
+                          .astype(np.int64), first)
+        # edges outside the exposed rect land on a one pixel border
+        # around it, which is not drawn
+        np.clip(first, -1, (width, height), out=first)
+        np.clip(last, -1, (width, height), out=last)
+        first += 1
+        last += 1
+        stride = width + 2
+        widths = last[:, 0] - first[:, 0] + 1
+        heights = last[:, 1] - first[:, 1] + 1
+        columns = index_runs(first[:, 0], widths)
+        rows = index_runs(first[:, 1], heights) * stride
+
+        mask = np.zeros((height + 2) * stride, dtype=np.uint8)
+        mask[np.repeat(first[:, 1] * stride, widths) + columns] = 1
+        mask[np.repeat(last[:, 1] * stride, widths) + columns] = 1
+        mask[rows + np.repeat(first[:, 0], heights)] = 1
+        mask[rows + np.repeat(last[:, 0], heights)] = 1
+        # the image starts inside the border
+        visible = mask[stride + 1:]
+        image = QImage(visible.data, width, height, stride,
+                       QImage.Format_Indexed8)
+        image.setColorTable([0, self.pen.color().rgba()])
+        painter.setWorldTransform(QTransform())
+        painter.drawImage(QPoint(device.left(), device.top()), image)
+
+    def _box_rect(self, i) -> QRectF:
+        left, top, right, bottom = self.box_index.coords[i].tolist()
+        return QRectF(left, top, right - left + 1, bottom - top + 1)
+
+    def _update_area(self, rect: QRectF):
+        # the cosmetic outline reaches a device pixel past the rect
+        margin = 2 / self._scale
+        self.update(rect.adjusted(-margin, -margin, margin, margin))
@@ -1,36 +1,377 @@
-from PySide6.QtWidgets import QListWidget, QMessageBox
-from PySide6.QtCore import Signal
-from PIL import Image
-from sprite_splitter import AlphaSpriteSplitter
+from PySide6.QtWidgets import (QAbstractItemView, QListView, QMessageBox,
+                               QMenu, QStyledItemDelegate)
+from PySide6.QtCore import Qt, Signal, QAbstractListModel, QModelIndex
+from PySide6.QtGui import QPalette
+from ..core.detection import (SPLITTER_ENGINES, RELABEL_ENGINES,
+                              engine_options, postprocess_options,
+                              save_detected_boxes, save_edited_boxes)
+from ..core.file_scan import needs_scan
+from ..core.image_cache import get_image_cache
+from ..workers.split_pool import SplitPool
+from ..workers.probe_worker import ProbeWorker
+from ..workers.file_watcher import FileWatcher
+from ..workers.refresh_worker import RefreshWorker
 
+# item data role holding the split status text of a file
+STATUS_ROLE = Qt.UserRole + 1
+# rows handed to the view at once, more follow as it scrolls down
+FETCH_ROWS = 1000
 
-class FileListWidget(QListWidget):
-    file_selected = Signal(str, list)
+
+class FileStatusDelegate(QStyledItemDelegate):
+    """
+    draw the split status of a file right-aligned over its path
+    """
+
+    def paint(self, painter, option, index):
+        super().paint(painter, option, index)
+        status = index.data(STATUS_ROLE)
+        if not status:
+            return
+        painter.save()
+        rect = option.rect.adjusted(0, 0, -6, 0)
+        metrics = option.fontMetrics
+        text_width = metrics.horizontalAdvance(status) + 8
+        badge = rect.adjusted(rect.width() - text_width, 0, 0, 0)
+        painter.fillRect(badge, option.palette.color(QPalette.Base))
+        painter.setPen(option.palette.color(QPalette.PlaceholderText))
+        painter.drawText(badge, Qt.AlignRight | Qt.AlignVCenter, status)
+        painter.restore()
+
+
+class FileListModel(QAbstractListModel):
+    """
+    Paths of the added files with their split state.
+
+    Rows are read straight from the path list, the view asks for the
+    path and status of visible rows only. The view lays out every row
+    it knows of after each change, so only the rows it scrolled to are
+    shown to it, the rest is fetched when the view reaches the end.
+    Statuses are kept for the files that have one, the box count of
+    split files is computed when it is drawn.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.paths = []
+        # path -> row
+        self.rows = {}
+        # path -> status text, while checking, queued, splitting or after
+        # a failure
+        self.statuses = {}
+        # path -> BoxStore of split files
+        self.image_boxes = {}
+        # paths whose boxes were edited by the user
+        self.edited_files = set()
+        # rows the view knows of, the first ones of paths
+        self.shown_rows = 0
+
+    def rowCount(self, parent=QModelIndex()):
+        # a list has no children
+        return 0 if parent.isValid() else self.shown_rows
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.shown_rows < len(self.paths)
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not parent.isValid():
+            self.show_rows(self.shown_rows + FETCH_ROWS)
+
+    def show_rows(self, count):
+        """
+        let the view know of the first count rows
+        """
+        count = min(count, len(self.paths))
+        if count <= self.shown_rows:
+            return
+        self.beginInsertRows(QModelIndex(), self.shown_rows, count - 1)
+        self.shown_rows = count
+        self.endInsertRows()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        path = self.paths[index.row()]
+        if role in (Qt.DisplayRole, Qt.ToolTipRole):
+            return path
+        if role == STATUS_ROLE:
+            return self.status(path)
+        return None
+
+    def status(self, path):
+        status = self.statuses.get(path)
+        if status is None and path in self.image_boxes:
+            return f"{len(self.image_boxes[path])} boxes"
+        return status
+
+    def __contains__(self, path):
+        return path in self.rows
+
+    def __len__(self):
+        return len(self.paths)
+
+    def path_index(self, path):
+        """
+        index of the row of path, fetched for the view if it was not yet
+        """
+        row = self.rows.get(path)
+        if row is None:
+            return QModelIndex()
+        self.show_rows(row + 1)
+        return self.index(row)
+
+    def append_files(self, paths, status=None):
+        """
+        add rows for paths, which must not be listed yet
+        """
+        if not paths:
+            return
+        first = len(self.paths)
+        for row, path in enumerate(paths, first):
+            self.paths.append(path)
+            self.rows[path] = row
+            if status is not None:
+                self.statuses[path] = status
+        self.show_rows(FETCH_ROWS)
+
+    def remove_files(self, paths):
+        rows = sorted((self.rows[path] for path in paths if path in self.rows),
+                      reverse=True)
+        # runs of adjacent rows are removed at once, from the bottom up
+        end = 0
+        while end < len(rows):
+            start = end
+            while end + 1 < len(rows) and rows[end + 1] == rows[end] - 1:
+                end += 1
+            first, last = rows[end], rows[start]
+            end += 1
+            # only the rows the view knows of are removed from it
+            shown = min(last + 1, self.shown_rows) - first
+            if shown > 0:
+                self.beginRemoveRows(QModelIndex(), first, first + shown - 1)
+            for path in self.paths[first:last + 1]:
+                del self.rows[path]
+                self.statuses.pop(path, None)
+                self.image_boxes.pop(path, None)
+                self.edited_files.discard(path)
+            del self.paths[first:last + 1]
+            if shown > 0:
+                self.shown_rows -= shown
+                self.endRemoveRows()
+        if rows:
+            # rows after the first removed one moved up
+            for row in range(rows[-1], len(self.paths)):
+                self.rows[self.paths[row]] = row
+
+    def set_status(self, path, status):
+        if path not in self.rows:
+            return
+        if status is None:
+            self.statuses.pop(path, None)
+        else:
+            self.statuses[path] = status
+        self.status_changed(path)
+
+    def set_boxes(self, path, boxes, edited=False):
+        if path not in self.rows:
+            return
+        self.image_boxes[path] = boxes
+        if edited:
+            self.edited_files.add(path)
+        else:
+            self.edited_files.discard(path)
+        self.statuses.pop(path, None)
+        self.status_changed(path)
+
+    def clear_file_boxes(self, path, keep_status=False):
+        if path not in self.rows:
+            return
+        self.image_boxes.pop(path, None)
+        self.edited_files.discard(path)
+        if not keep_status:
+            self.statuses.pop(path, None)
+        self.status_changed(path)
+
+    def clear_boxes(self, keep_status=None):
+        """
+        drop the boxes of every file, and the statuses of all files
+        keep_status(path) is not True for
+        """
+        self.image_boxes.clear()
+        self.edited_files.clear()
+        for path in list(self.statuses):
+            if keep_status is None or not keep_status(path):
+                del self.statuses[path]
+        if self.shown_rows:
+            self.dataChanged.emit(self.index(0),
+                                  self.index(self.shown_rows - 1),
+                                  [STATUS_ROLE])
+
+    def status_changed(self, path):
+        row = self.rows.get(path)
+        # rows not fetched yet are read when the view gets to them
+        if row is not None and row < self.shown_rows:
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [STATUS_ROLE])
+
+
+class FileListWidget(QListView):
+    # image path and its BoxStore
+    file_selected = Signal(str, object)
+    # image path whose boxes are detected again, after its engine or its
+    # file changed
+    boxes_reset = Signal(str)
 
     def __init__(self):
         super().__init__()
-        self.files = []
-        self.itemClicked.connect(self.on_item_clicked)
-        self._sprite_splitters = {}
-        self.image_boxes = {}
+        self.file_model = FileListModel(self)
+        self.setModel(self.file_model)
+        self.clicked.connect(
+            lambda index: self.open_file(self.file_model.paths[index.row()]))
+        # split every added file in the background instead of waiting
+        # for its first click
+        self.pre_split = False
+        self.setItemDelegate(FileStatusDelegate(self))
+        self.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        # every row is one line of text, so the view never has to measure
+        # each item again when thousands are added
+        self.setUniformItemSizes(True)
+
+        # sprite detection runs in background processes, results
+        # come back through on_split_finished
+        self.split_pool = SplitPool()
+        self.split_pool.split_queued.connect(
+            lambda path: self.set_file_status(path, "queued"))
+        self.split_pool.split_started.connect(
+            lambda path: self.set_file_status(path, "splitting..."))
+        self.split_pool.split_cancelled.connect(
+            lambda path: self.set_file_status(path, "cancelled"))
+        self.split_pool.split_finished.connect(self.on_split_finished)
+        self.split_pool.split_failed.connect(self.on_split_failed)
+
+        # added files are listed at once and checked in the background,
+        # batch id -> (listed files, failed files, valid files) of
+        # running checks
+        self.probe_worker = ProbeWorker()
+        self.probe_worker.probed.connect(self.on_files_probed)
+        self._probe_batches = {}
+        self._checking = set()
+
+        # split files changed on disk are split again, only the changed
+        # regions are labeled again where the engine allows it. files
+        # without boxes are read when they are split anyway
+        self.file_watcher = FileWatcher()
+        self.file_watcher.files_changed.connect(self.on_files_changed)
+        self.refresh_worker = RefreshWorker()
+        self.refresh_worker.refreshed.connect(self.on_file_refreshed)
+        self.refresh_worker.refresh_failed.connect(
+            lambda path, error: self.split_again(path, restart=True))
+
+    @property
+    def image_boxes(self):
+        return self.file_model.image_boxes
+
+    def dataChanged(self, top_left, bottom_right, roles=()):
+        # QListView lays out every row again on dataChanged, a status
+        # never changes the size of a row, repainting it is enough
+        if list(roles) == [STATUS_ROLE]:
+            if top_left == bottom_right:
+                self.update(top_left)
+            else:
+                self.viewport().update()
+            return
+        super().dataChanged(top_left, bottom_right, roles)
 
     def add_files(self, file_paths):
-        failed_files = []
-        new_file = 0
-        old_index = -1
-        for path in file_paths:
-            if path in self.files:
-                old_index = self.files.index(path)
-                continue
+        """
+        add image files, folders and glob patterns. folders and patterns
+        are expanded in the background, their files are listed as they
+        are found
+        """
+        new_files = []
+        scan_paths = []
+        old_path = None
+        for path in dict.fromkeys(file_paths):
+            if needs_scan(path):
+                scan_paths.append(path)
+            elif path in self.file_model:
+                old_path = path
             else:
-                new_file += 1
-            try:
-                Image.open(path)
-                self.files.append(path)
-                self.addItem(path)
-            except Exception:
+                new_files.append(path)
+        self.append_files(new_files, "checking...")
+        self._checking.update(new_files)
+
+        if not new_files and not scan_paths:
+            if old_path is not None:
+                self.select_file(old_path)
+            return
+        batch = self.probe_worker.probe(new_files + scan_paths)
+        self._probe_batches[batch] = (set(new_files), [], [])
+
+    def on_files_probed(self, batch, results, last):
+        listed_files, failed_files, valid_files = self._probe_batches[batch]
+        model = self.file_model
+        checked_files = []
+        found_files = []
+        removed_files = []
+        for path, info, error in results:
+            if path in listed_files:
+                self._checking.discard(path)
+                if path not in model:
+                    # removed while it was checked
+                    continue
+                if info is None:
+                    failed_files.append(path)
+                    removed_files.append(path)
+                    continue
+                # unless a split started meanwhile
+                if model.statuses.get(path) == "checking...":
+                    model.set_status(path, None)
+            elif info is None:
+                # found by a scan, never listed
                 failed_files.append(path)
+                continue
+            elif path in model:
+                valid_files.append(path)
+                continue
+            else:
+                found_files.append(path)
+            checked_files.append(path)
+        model.remove_files(removed_files)
+        self.append_files(found_files)
+        valid_files.extend(checked_files)
+        # the selected file goes to the front of the queue once the
+        # batch is checked, the rest follows in list order
+        if self.pre_split:
+            self.queue_unsplit_files(checked_files)
+        if not last:
+            return
+
+        del self._probe_batches[batch]
+        self.warn_failed_files(failed_files)
+        # choose the last valid file
+        if valid_files and valid_files[-1] in model:
+            self.select_file(valid_files[-1])
+
+    def append_files(self, paths, status=None):
+        self.file_model.append_files(paths, status)
+        # the view fetches the new rows once it has updated its geometry,
+        # if the last row it knows of is in sight
+        if self.file_model.canFetchMore():
+            self.updateGeometries()
+
+    def select_file(self, path):
+        index = self.file_model.path_index(path)
+        self.setCurrentIndex(index)
+        self.scrollTo(index)
+        self.open_file(path)
 
+    def remove_file(self, path):
+        self.file_watcher.unwatch([path])
+        self.refresh_worker.cancel(path)
+        self.file_model.remove_files([path])
+
+    def warn_failed_files(self, failed_files):
         if failed_files:
             QMessageBox.warning(
                 self,
@@ -39,27 +380,185 @@ class FileListWidget(QListWidget):
                     '\n'.join(failed_files)}"
             )
 
-        # choose the last valid file
-        if new_file == 0:
-            self.setCurrentRow(old_index)
-            self.on_item_clicked(self.item(old_index))
-        else:
-            file_cnt = self.count()
-            if file_cnt > 0 and self.currentItem() is not file_cnt - 1:
-                self.setCurrentRow(file_cnt - 1)
-                self.on_item_clicked(self.item(file_cnt - 1))
+    def set_pre_split(self, enabled):
+        self.pre_split = enabled
+        if enabled:
+            current_path = self.current_path()
+            if current_path and current_path not in self.image_boxes:
+                self.split_pool.submit(current_path, front=True)
+            self.queue_unsplit_files(self.file_model.paths)
 
-    def on_item_clicked(self, item):
-        try:
-            img_file_path = item.text()
-            if not self._sprite_splitters.get(img_file_path):
-                self._sprite_splitters[img_file_path] = AlphaSpriteSplitter(
-                    img_file_path)
-            if not self.image_boxes.get(img_file_path):
-                self.image_boxes[img_file_path] = \
-                    self._sprite_splitters[img_file_path].get_sprite_boxes()
+    def set_split_settings(self, engine, options):
+        """
+        switch the splitter engine, boxes of every file are detected again
+        """
+        self.split_pool.set_options(engine, options)
+        self.refresh_worker.cancel_all()
+        self.file_model.clear_boxes(
+            keep_status=lambda path: self.split_pool.is_busy(path) or
+            path in self._checking)
+
+        current_path = self.current_path()
+        if current_path:
+            self.split_pool.submit(current_path, front=True)
+        if self.pre_split:
+            self.queue_unsplit_files(self.file_model.paths)
+
+    def set_file_engine(self, path, engine):
+        """
+        split path with its own engine, None uses the split settings
+        again. the boxes of the file are detected again
+        """
+        if engine == self.split_pool.file_engines.get(path):
+            return
+        self.split_pool.set_file_engine(path, engine)
+        self.split_again(path)
+
+    def split_again(self, path, restart=False):
+        """
+        drop the boxes of path and detect them again. restart=True also
+        abandons a running split, the file changed
+        """
+        self.refresh_worker.cancel(path)
+        self.file_model.clear_file_boxes(
+            path, keep_status=self.split_pool.is_busy(path) or
+            path in self._checking)
+        self.boxes_reset.emit(path)
+        submit = self.split_pool.restart if restart else \
+            self.split_pool.submit
+        if path == self.current_path():
+            submit(path, front=True)
+        elif path not in self._checking and \
+                (self.pre_split or self.split_pool.is_busy(path)):
+            submit(path)
+
+    def on_files_changed(self, paths):
+        """
+        files changed on disk. split files keep their boxes away from
+        the changed pixels if their engine allows it
+        """
+        for path in paths:
+            if path not in self.file_model or path in self._checking:
+                continue
+            engine = self.split_pool.engine_for(path)
+            boxes = self.image_boxes.get(path)
+            # post-processed boxes can not be told apart from sprites
+            if boxes is None or engine not in RELABEL_ENGINES or \
+                    postprocess_options(self.split_pool.options):
+                self.split_again(path, restart=True)
+                continue
+            options = engine_options(engine, self.split_pool.options)
+            self.set_file_status(path, "refreshing...")
+            # the decode of the file before the change, the preview may
+            # decode the new file before the refresh runs
+            self.refresh_worker.refresh(
+                path, boxes, options.get("alpha_threshold", 0),
+                options.get("merge_distance", 0),
+                get_image_cache().peek(path, stale=True))
+
+    def on_file_refreshed(self, path, boxes):
+        if path not in self.file_model:
+            return
+        if boxes is None:
+            # no decode of the old file to compare with
+            self.split_again(path, restart=True)
+            return
+        self.boxes_reset.emit(path)
+        # detected boxes stay detected, so edits made later win over them
+        self.save_boxes(path, boxes,
+                        edited=path in self.file_model.edited_files)
+        if path == self.current_path():
+            self.file_selected.emit(path, boxes)
 
+    def queue_unsplit_files(self, file_paths):
+        for path in file_paths:
+            if path not in self.image_boxes and path not in self._checking:
+                self.split_pool.submit(path)
+
+    def open_file(self, img_file_path):
+        if img_file_path in self.image_boxes:
             boxes = self.image_boxes[img_file_path]
             self.file_selected.emit(img_file_path, boxes)
+        else:
+            # the selected file always goes first, file_selected is
+            # emitted once its boxes are ready
+            self.split_pool.submit(img_file_path, front=True)
+
+    def on_split_finished(self, img_file_path, boxes):
+        self.file_model.set_boxes(img_file_path, boxes)
+        if img_file_path in self.file_model:
+            self.file_watcher.watch([img_file_path])
+        if self.current_path() == img_file_path:
+            self.file_selected.emit(img_file_path, boxes)
+
+    def on_split_failed(self, img_file_path, error):
+        self.set_file_status(img_file_path, "failed")
+        if self.current_path() == img_file_path:
+            QMessageBox.warning(self, "Open select file failed: ", error)
+
+    def save_boxes(self, img_file_path, boxes, edited=True):
+        """
+        keep user edited boxes in memory and in the on-disk box cache,
+        or boxes that are still the detected ones with edited False
+        """
+        self.file_model.set_boxes(img_file_path, boxes, edited)
+        save = save_edited_boxes if edited else save_detected_boxes
+        try:
+            save(img_file_path, boxes,
+                 self.split_pool.engine_for(img_file_path),
+                 self.split_pool.options)
         except Exception as e:
-            QMessageBox.warning(self, "Open select file failed: ", f"{e}")
+            QMessageBox.warning(self, "Save boxes to cache failed: ", f"{e}")
+
+    def current_path(self):
+        index = self.currentIndex()
+        if not index.isValid():
+            return None
+        return self.file_model.paths[index.row()]
+
+    def set_file_status(self, img_file_path, status):
+        self.file_model.set_status(img_file_path, status)
+
+    def contextMenuEvent(self, event):
+        index = self.indexAt(event.pos())
+        path = self.file_model.paths[index.row()] if index.isValid() else None
+        menu = QMenu(self)
+        cancel_action = menu.addAction("Cancel Splitting")
+        cancel_action.setEnabled(
+            path is not None and self.split_pool.is_busy(path))
+        cancel_all_action = menu.addAction("Cancel All Splitting")
+
+        # engine of this file only, instead of the one of the split settings
+        mode_menu = menu.addMenu("Split Mode")
+        mode_menu.setEnabled(path is not None)
+        file_engine = self.split_pool.file_engines.get(path)
+        engine_actions = {}
+        for engine, display_name in [(None, "Split Settings")] + [
+                (engine, name) for engine, (name, _)
+                in SPLITTER_ENGINES.items()]:
+            engine_action = mode_menu.addAction(display_name)
+            engine_action.setCheckable(True)
+            engine_action.setChecked(engine == file_engine)
+            engine_actions[engine_action] = engine
+
+        action = menu.exec(event.globalPos())
+        if action is cancel_action:
+            self.split_pool.cancel(path)
+        elif action is cancel_all_action:
+            self.split_pool.cancel_all()
+        elif action in engine_actions:
+            self.set_file_engine(path, engine_actions[action])
+
+    def keyPressEvent(self, event):
+        """
+        escape cancels the split of the current file
+        """
+        if event.key() == Qt.Key_Escape and self.current_path():
+            self.split_pool.cancel(self.current_path())
+            event.accept()
+        else:
+            super().keyPressEvent(event)
+
+    def shutdown(self):
+        self.probe_worker.shutdown()
+        self.split_pool.shutdown()
@@ -1,15 +1,32 @@
 from PySide6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel,
                                QLineEdit, QGroupBox, QFormLayout, QMessageBox,
-                               QPushButton, QFileDialog, QScrollArea)
-from PySide6.QtCore import Qt, Signal
+                               QPushButton, QFileDialog, QScrollArea,
+                               QCheckBox, QComboBox, QSpinBox, QProgressBar)
+from PySide6.QtCore import Qt, Signal, QTimer
 from PySide6.QtGui import QFontMetrics
-from PIL import Image as PILImage
-from sprite_splitter import Box
+from typing import TYPE_CHECKING
+from ..core.detection import (SPLITTER_ENGINES, DEFAULT_ENGINE,
+                              TILED_BAND_HEIGHT, OVERLAP_MODES)
+from ..core.export import EXPORT_FORMATS, DEFAULT_EXPORT_OPTIONS
+from ..core.atlas import ATLAS_PAGE_SIZES, DEFAULT_ATLAS_PAGE_SIZE
+from ..core.dedup import DEFAULT_SIMILAR_DISTANCE
+from ..core.history import DEFAULT_HISTORY_DEPTH
+from ..core.image_cache import get_image_cache
+from ..core.image_probe import get_image_info
+from ..workers.export_worker import ExportWorker
 import os
 
+# PIL and sprite_splitter are imported on first use
+if TYPE_CHECKING:
+    from sprite_splitter import Box
+
 
 class InfoPanel(QWidget):
     box_info_changed = Signal(tuple)
+    pre_split_changed = Signal(bool)
+    history_depth_changed = Signal(int)
+    split_settings_changed = Signal(str, dict)
+    clean_up_requested = Signal(dict)
 
     def __init__(self, file_list):
         super().__init__()
@@ -27,6 +44,12 @@ class InfoPanel(QWidget):
 
         self.origin_height_recorder = {}
 
+        self.export_worker = ExportWorker()
+        self.export_worker.export_progress.connect(self.on_export_progress)
+        self.export_worker.export_finished.connect(self.on_export_finished)
+        self.export_worker.export_failed.connect(self.on_export_failed)
+        self.export_worker.export_cancelled.connect(self.on_export_cancelled)
+
     def resizeEvent(self, event):
         self.image_path_area.setMaximumHeight(
             self.get_label_font_height(self.image_path, self.image_path.text()))
@@ -141,9 +164,145 @@ class InfoPanel(QWidget):
         box_layout.addRow(width_label, self.width_edit)
         box_layout.addRow(height_label, self.height_edit)
 
+        undo_steps_label = QLabel("Undo:")
+        undo_steps_label.setToolTip(
+            "Number of box edits that can be undone for each image")
+        undo_steps_label.setFixedWidth(label_width)
+        self.history_depth_spin = QSpinBox()
+        self.history_depth_spin.setRange(1, 10000)
+        self.history_depth_spin.setValue(DEFAULT_HISTORY_DEPTH)
+        self.history_depth_spin.setSuffix(" steps")
+        self.history_depth_spin.valueChanged.connect(
+            self.history_depth_changed)
+        box_layout.addRow(undo_steps_label, self.history_depth_spin)
+
         box_group.setLayout(box_layout)
         layout.addWidget(box_group)
 
+        """
+        init split settings panel
+        """
+        split_group = QGroupBox("Split Settings")
+        split_layout = QFormLayout()
+        split_layout.setFieldGrowthPolicy(QFormLayout.AllNonFixedFieldsGrow)
+        split_layout.setLabelAlignment(Qt.AlignLeft | Qt.AlignVCenter)
+
+        self.engine_combo = QComboBox()
+        for engine, (display_name, _) in SPLITTER_ENGINES.items():
+            self.engine_combo.addItem(display_name, engine)
+        self.engine_combo.setCurrentIndex(
+            self.engine_combo.findData(DEFAULT_ENGINE))
+
+        self.alpha_threshold_spin = QSpinBox()
+        self.alpha_threshold_spin.setRange(0, 254)
+        self.alpha_threshold_spin.setToolTip(
+            "Pixels with an alpha value above this threshold belong to sprites")
+
+        self.merge_distance_spin = QSpinBox()
+        self.merge_distance_spin.setRange(0, 64)
+        self.merge_distance_spin.setToolTip(
+            "Pixels separated by at most this many transparent pixels "
+            "are kept in the same sprite")
+
+        self.tiled_check = QCheckBox("Tiled detection")
+        self.tiled_check.setToolTip(
+            f"Read and label images in bands of {TILED_BAND_HEIGHT} rows, "
+            "which keeps memory low on very large sheets")
+
+        self.trim_cells_check = QCheckBox("Trim cells")
+        self.trim_cells_check.setToolTip(
+            "Shrink every grid cell to the sprite pixels inside it")
+
+        self.pre_split_check = QCheckBox("Pre-split on add")
+        self.pre_split_check.setToolTip(
+            "Split every added image in the background, so selecting "
+            "it later is instant")
+        self.pre_split_check.toggled.connect(self.pre_split_changed)
+
+        split_layout.addRow(QLabel("Engine:"), self.engine_combo)
+        split_layout.addRow(QLabel("Alpha:"), self.alpha_threshold_spin)
+        split_layout.addRow(QLabel("Merge:"), self.merge_distance_spin)
+        split_layout.addRow(self.tiled_check)
+        split_layout.addRow(self.trim_cells_check)
+        split_layout.addRow(self.pre_split_check)
+
+        # spin boxes change in single steps, wait until the user
+        # stopped editing before splitting again
+        self.split_settings_timer = QTimer()
+        self.split_settings_timer.setSingleShot(True)
+        self.split_settings_timer.setInterval(500)
+        self.split_settings_timer.timeout.connect(
+            self.emit_split_settings)
+        self.engine_combo.currentIndexChanged.connect(
+            self.on_split_settings_edited)
+        self.alpha_threshold_spin.valueChanged.connect(
+            self.on_split_settings_edited)
+        self.merge_distance_spin.valueChanged.connect(
+            self.on_split_settings_edited)
+        self.tiled_check.toggled.connect(self.on_split_settings_edited)
+        self.trim_cells_check.toggled.connect(self.on_split_settings_edited)
+        self.update_split_option_widgets()
+
+        split_group.setLayout(split_layout)
+        layout.addWidget(split_group)
+
+        """
+        init post-processing panel
+        """
+        postprocess_group = QGroupBox("Post-processing")
+        postprocess_layout = QFormLayout()
+        postprocess_layout.setFieldGrowthPolicy(
+            QFormLayout.AllNonFixedFieldsGrow)
+        postprocess_layout.setLabelAlignment(Qt.AlignLeft | Qt.AlignVCenter)
+
+        self.merge_gap_spin = QSpinBox()
+        # -1 is shown as "Off"
+        self.merge_gap_spin.setRange(-1, 256)
+        self.merge_gap_spin.setSpecialValueText("Off")
+        self.merge_gap_spin.setValue(-1)
+        self.merge_gap_spin.setToolTip(
+            "Merge boxes at most this many transparent pixels apart, "
+            "0 merges touching boxes")
+
+        self.min_area_spin = QSpinBox()
+        self.min_area_spin.setRange(0, 1000000)
+        self.min_area_spin.setSpecialValueText("Off")
+        self.min_area_spin.setToolTip("Drop boxes covering fewer pixels")
+
+        self.overlaps_combo = QComboBox()
+        for mode, display_name in OVERLAP_MODES.items():
+            self.overlaps_combo.addItem(display_name, mode)
+        self.overlaps_combo.setToolTip(
+            "Keep overlapping boxes, drop the ones lying inside another "
+            "box or merge overlapping boxes")
+
+        self.post_split_check = QCheckBox("Apply after split")
+        self.post_split_check.setToolTip(
+            "Post-process the boxes of every image right after it is split")
+
+        self.clean_up_button = QPushButton("Clean Up Image")
+        self.clean_up_button.setToolTip(
+            "Post-process the boxes of the current image, undo restores "
+            "them")
+        self.clean_up_button.clicked.connect(
+            lambda: self.clean_up_requested.emit(
+                self.get_postprocess_options()))
+
+        postprocess_layout.addRow(QLabel("Gap:"), self.merge_gap_spin)
+        postprocess_layout.addRow(QLabel("Min area:"), self.min_area_spin)
+        postprocess_layout.addRow(QLabel("Overlaps:"), self.overlaps_combo)
+        postprocess_layout.addRow(self.post_split_check)
+        postprocess_layout.addRow(self.clean_up_button)
+
+        self.merge_gap_spin.valueChanged.connect(self.on_postprocess_edited)
+        self.min_area_spin.valueChanged.connect(self.on_postprocess_edited)
+        self.overlaps_combo.currentIndexChanged.connect(
+            self.on_postprocess_edited)
+        self.post_split_check.toggled.connect(self.on_split_settings_edited)
+
+        postprocess_group.setLayout(postprocess_layout)
+        layout.addWidget(postprocess_group)
+
         """ 
         init export settings panel
         """
@@ -155,20 +314,100 @@ class InfoPanel(QWidget):
         self.export_path.setPlaceholderText("Select export folder...")
         self.export_path.setReadOnly(True)
 
+        encoder_layout = QFormLayout()
+        encoder_layout.setFieldGrowthPolicy(QFormLayout.AllNonFixedFieldsGrow)
+        encoder_layout.setLabelAlignment(Qt.AlignLeft | Qt.AlignVCenter)
+
+        self.export_mode_combo = QComboBox()
+        self.export_mode_combo.addItem("Sprites", "sprites")
+        self.export_mode_combo.addItem("Atlas", "atlas")
+        self.export_mode_combo.addItem("Unique sprites", "unique")
+        self.export_mode_combo.setToolTip(
+            "Write one file per sprite, pack all sprites into atlas "
+            "pages with a json and a binary descriptor, or write every "
+            "distinct sprite of all split images once with a json "
+            "mapping boxes to files")
+        self.export_mode_combo.currentIndexChanged.connect(
+            self.update_encoder_widgets)
+
+        self.atlas_size_combo = QComboBox()
+        for size in ATLAS_PAGE_SIZES:
+            self.atlas_size_combo.addItem(f"{size} x {size}", size)
+        self.atlas_size_combo.setCurrentIndex(
+            self.atlas_size_combo.findData(DEFAULT_ATLAS_PAGE_SIZE))
+        self.atlas_size_combo.setToolTip("Largest size of one atlas page")
+
+        self.trim_check = QCheckBox("Trim")
+        self.trim_check.setChecked(True)
+        self.trim_check.setToolTip(
+            "Cut transparent borders off the sprites before packing")
+
+        self.rotate_check = QCheckBox("Rotate")
+        self.rotate_check.setToolTip(
+            "Allow sprites to be turned 90 degrees clockwise "
+            "when they pack tighter")
+
+        self.similar_check = QCheckBox("Merge similar")
+        self.similar_check.setToolTip(
+            "Also treat sprites of the same size that look nearly alike "
+            "as one sprite")
+
+        self.format_combo = QComboBox()
+        self.format_combo.addItems(list(EXPORT_FORMATS))
+        self.format_combo.currentIndexChanged.connect(
+            self.update_encoder_widgets)
+
+        self.compress_level_spin = QSpinBox()
+        self.compress_level_spin.setRange(0, 9)
+        self.compress_level_spin.setValue(
+            DEFAULT_EXPORT_OPTIONS["compress_level"])
+        self.compress_level_spin.setToolTip(
+            "PNG zlib level, 0 is fastest and 9 gives the smallest files")
+
+        self.optimize_check = QCheckBox("Optimize")
+        self.optimize_check.setChecked(DEFAULT_EXPORT_OPTIONS["optimize"])
+        self.optimize_check.setToolTip(
+            "Search for the smallest PNG encoding, much slower")
+
+        self.lossless_check = QCheckBox("Lossless")
+        self.lossless_check.setChecked(DEFAULT_EXPORT_OPTIONS["lossless"])
+        self.lossless_check.setToolTip("Encode WebP sprites without loss")
+
+        encoder_layout.addRow(QLabel("Mode:"), self.export_mode_combo)
+        encoder_layout.addRow(QLabel("Atlas size:"), self.atlas_size_combo)
+        encoder_layout.addRow(self.trim_check)
+        encoder_layout.addRow(self.rotate_check)
+        encoder_layout.addRow(self.similar_check)
+        encoder_layout.addRow(QLabel("Format:"), self.format_combo)
+        encoder_layout.addRow(QLabel("Compression:"),
+                              self.compress_level_spin)
+        encoder_layout.addRow(self.optimize_check)
+        encoder_layout.addRow(self.lossless_check)
+        self.update_encoder_widgets()
+
         button_layout = QHBoxLayout()
         browse_button = QPushButton("Browse")
         browse_button.clicked.connect(self.browse_export_path)
         self.export_button = QPushButton("Export")
         self.export_button.setEnabled(False)
         self.export_button.clicked.connect(self.export_sprites)
+        self.cancel_export_button = QPushButton("Cancel")
+        self.cancel_export_button.setVisible(False)
+        self.cancel_export_button.clicked.connect(self.cancel_export)
 
         button_layout.addWidget(browse_button)
         button_layout.addWidget(self.export_button)
+        button_layout.addWidget(self.cancel_export_button)
         button_layout.addStretch()
 
+        self.export_progress = QProgressBar()
+        self.export_progress.setVisible(False)
+
         export_layout.addWidget(path_label)
         export_layout.addWidget(self.export_path)
+        export_layout.addLayout(encoder_layout)
         export_layout.addLayout(button_layout)
+        export_layout.addWidget(self.export_progress)
 
         export_group.setLayout(export_layout)
 
@@ -181,6 +420,49 @@ class InfoPanel(QWidget):
             edit.returnPressed.connect(self.on_value_changed)
             edit.editingFinished.connect(self.on_value_changed)
 
+    def update_split_option_widgets(self):
+        accepted = SPLITTER_ENGINES[self.engine_combo.currentData()][1]
+        self.alpha_threshold_spin.setEnabled("alpha_threshold" in accepted)
+        self.merge_distance_spin.setEnabled("merge_distance" in accepted)
+        self.tiled_check.setEnabled("band_height" in accepted)
+        self.trim_cells_check.setEnabled("trim_cells" in accepted)
+
+    def on_split_settings_edited(self):
+        self.update_split_option_widgets()
+        self.split_settings_timer.start()
+
+    def on_postprocess_edited(self):
+        # only split again if the boxes of every split are post-processed
+        if self.post_split_check.isChecked():
+            self.split_settings_timer.start()
+
+    def get_split_settings(self):
+        """
+        the engine and the options of every engine, images with their own
+        split mode pick the options of their engine from them
+        """
+        options = {
+            "alpha_threshold": self.alpha_threshold_spin.value(),
+            "merge_distance": self.merge_distance_spin.value(),
+            "band_height":
+                TILED_BAND_HEIGHT if self.tiled_check.isChecked() else 0,
+            "trim_cells": self.trim_cells_check.isChecked(),
+        }
+        if self.post_split_check.isChecked():
+            options.update(self.get_postprocess_options())
+        return self.engine_combo.currentData(), options
+
+    def get_postprocess_options(self):
+        merge_gap = self.merge_gap_spin.value()
+        return {
+            "merge_gap": merge_gap if merge_gap >= 0 else None,
+            "min_area": self.min_area_spin.value(),
+            "overlaps": self.overlaps_combo.currentData(),
+        }
+
+    def emit_split_settings(self):
+        self.split_settings_changed.emit(*self.get_split_settings())
+
     def create_validator(self):
         # used in box info exitor
         from PySide6.QtGui import QIntValidator
@@ -198,7 +480,10 @@ class InfoPanel(QWidget):
             return
 
         try:
-            img = PILImage.open(image_path)
+            # the preview decoded the image just before, otherwise its
+            # header was read when it was added
+            img = get_image_cache().peek(image_path) or \
+                get_image_info(image_path)
             self.image_name.setText(image_path.split('/')[-1])
             self.image_path.setText(image_path)
             self.image_size.setText(f"{img.width} x {img.height}")
@@ -226,7 +511,7 @@ class InfoPanel(QWidget):
         self.image_size.setText("")
         self.image_mode.setText("")
 
-    def update_box_info(self, box: Box):
+    def update_box_info(self, box: "Box"):
         self.is_updating = True
         self.current_box = box
 
@@ -265,6 +550,7 @@ class InfoPanel(QWidget):
                 self.update_box_info(self.current_box)
                 return
 
+            from sprite_splitter import Box
             new_box = Box((x, y), (x + width, y + height))
             self.box_info_changed.emit(new_box)
 
@@ -279,55 +565,153 @@ class InfoPanel(QWidget):
         )
         if path:
             self.export_path.setText(path)
-            self.export_button.setEnabled(True)
+            self.export_button.setEnabled(
+                not self.export_worker.is_running())
 
     def get_current_boxes(self):
         if self.file_list is not None:
             return self.file_list.image_boxes
         return []
 
+    def update_encoder_widgets(self):
+        is_png = self.format_combo.currentText() == "PNG"
+        self.compress_level_spin.setEnabled(is_png)
+        self.optimize_check.setEnabled(is_png)
+        self.lossless_check.setEnabled(not is_png)
+        is_atlas = self.export_mode_combo.currentData() == "atlas"
+        self.atlas_size_combo.setEnabled(is_atlas)
+        self.trim_check.setEnabled(is_atlas)
+        self.rotate_check.setEnabled(is_atlas)
+        self.similar_check.setEnabled(
+            self.export_mode_combo.currentData() == "unique")
+
+    def get_export_settings(self):
+        return self.format_combo.currentText(), {
+            "compress_level": self.compress_level_spin.value(),
+            "optimize": self.optimize_check.isChecked(),
+            "lossless": self.lossless_check.isChecked(),
+        }
+
+    def get_atlas_settings(self):
+        """
+        keyword arguments of export_atlas, None in sprites mode
+        """
+        if self.export_mode_combo.currentData() != "atlas":
+            return None
+        return {
+            "page_size": self.atlas_size_combo.currentData(),
+            "trim": self.trim_check.isChecked(),
+            "rotate": self.rotate_check.isChecked(),
+        }
+
+    def get_unique_sources(self):
+        """
+        (image path, boxes) of every split image in list order, the
+        current image with the boxes shown in the preview
+        """
+        if self.file_list is None:
+            return []
+        image_boxes = self.file_list.image_boxes
+        sources = []
+        for path in self.file_list.file_model.paths:
+            if path == self.current_image_path:
+                sources.append((path, self.get_current_boxes()))
+            elif path in image_boxes:
+                sources.append((path, image_boxes[path]))
+        return [(path, boxes) for path, boxes in sources if len(boxes)]
+
     def export_sprites(self):
         if not self.export_path.text() or not os.path.isdir(self.export_path.text()):
             QMessageBox.warning(self, "Invalid Path",
                                 "Please select a valid export directory.")
             return
 
+        if self.export_mode_combo.currentData() == "unique":
+            self.export_unique_sprites()
+            return
+
         if not self.current_image_path:
             QMessageBox.warning(
                 self, "No Image", "Please select an image first.")
             return
 
-        try:
-            image = PILImage.open(self.current_image_path)
-            base_name = os.path.splitext(
-                os.path.basename(self.current_image_path))[0]
+        boxes = self.get_current_boxes()
+
+        if boxes is None or len(boxes) < 1:
+            QMessageBox.warning(
+                self, "Export sprites failed!", "Length of boxes is zero, no need to split.")
+            return
+
+        fmt, options = self.get_export_settings()
+        started = self.export_worker.start(
+            self.current_image_path, boxes, self.export_path.text(), fmt,
+            options, self.get_atlas_settings())
+        if not started:
+            return
 
-            boxes = self.get_current_boxes()
+        self.export_button.setEnabled(False)
+        self.cancel_export_button.setVisible(True)
+        self.export_progress.setRange(0, len(boxes))
+        self.export_progress.setValue(0)
+        self.export_progress.setVisible(True)
+
+    def export_unique_sprites(self):
+        sources = self.get_unique_sources()
+        if not sources:
+            QMessageBox.warning(
+                self, "Export sprites failed!",
+                "No split image has any boxes, no need to split.")
+            return
 
-            if boxes is None or len(boxes) < 1:
-                QMessageBox.warning(
-                    self, "Export sprites failed!", "Length of boxes is zero, no need to split.")
+        fmt, options = self.get_export_settings()
+        max_distance = DEFAULT_SIMILAR_DISTANCE \
+            if self.similar_check.isChecked() else None
+        started = self.export_worker.start_unique(
+            sources, self.export_path.text(), fmt, options, max_distance)
+        if not started:
+            return
 
-            for i, box in enumerate(boxes):
-                left, top = box.left_top_corner
-                right, bottom = box.right_bottom_corner
-                sprite = image.crop((left, top, right + 1, bottom + 1))
+        self.export_button.setEnabled(False)
+        self.cancel_export_button.setVisible(True)
+        self.export_progress.setRange(
+            0, sum(len(boxes) for _, boxes in sources))
+        self.export_progress.setValue(0)
+        self.export_progress.setVisible(True)
+
+    def cancel_export(self):
+        self.export_worker.cancel()
+
+    def on_export_progress(self, done, total):
+        self.export_progress.setValue(done)
+
+    def end_export(self):
+        self.export_button.setEnabled(bool(self.export_path.text()))
+        self.cancel_export_button.setVisible(False)
+        self.export_progress.setVisible(False)
+
+    def on_export_finished(self, count):
+        self.end_export()
+        QMessageBox.information(
+            self,
+            "Export Successful",
+            f"Successfully exported {count} sprites."
+        )
 
-                output_path = os.path.join(
-                    self.export_path.text(),
-                    f"{base_name}_sprite_{i}.png"
-                )
-                sprite.save(output_path, "PNG")
+    def on_export_cancelled(self, done, total):
+        self.end_export()
+        QMessageBox.information(
+            self,
+            "Export Cancelled",
+            f"Export cancelled after {done} of {total} sprites."
+        )
 
-            QMessageBox.information(
-                self,
-                "Export Successful",
-                f"Successfully exported {len(boxes)} sprites."
-            )
+    def on_export_failed(self, error):
+        self.end_export()
+        QMessageBox.critical(
+            self,
+            "Export Failed",
+            f"Failed to export sprites: {error}"
+        )
 
-        except Exception as e:
-            QMessageBox.critical(
-                self,
-                "Export Failed",
-                f"Failed to export sprites: {str(e)}"
-            )
+    def shutdown(self):
+        self.export_worker.shutdown()
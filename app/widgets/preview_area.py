@@ -1,9 +1,91 @@
 import sys
-from PySide6.QtWidgets import QGraphicsView, QGraphicsScene, QGraphicsRectItem, QLabel
+from PySide6.QtWidgets import (QGraphicsView, QGraphicsScene, QGraphicsRectItem,
+                               QGraphicsItem, QLabel, QMessageBox)
 from PySide6.QtCore import Qt, Signal, QRectF, QPointF, QTimer
-from PySide6.QtGui import QImage, QPixmap, QPen, QColor, QPainter
-from sprite_splitter import Box
-from typing import List
+from PySide6.QtGui import QImage, QPen, QColor, QPainter
+from typing import List, TYPE_CHECKING
+from .tiled_image_item import TiledImageItem
+from ..core.history import (BoxHistory, ModifyBox, DeleteBox, ReplaceBoxes,
+                            DEFAULT_HISTORY_DEPTH)
+from ..core.perf import tracer
+from ..core.image_cache import get_image_cache
+
+# sprite_splitter and numpy are only imported once an image is loaded
+if TYPE_CHECKING:
+    from sprite_splitter import Box
+    from ..core.box_store import BoxStore
+
+# on screen size of the box control points, in pixels
+CONTROL_POINT_SIZE = 10
+
+# milliseconds between two refreshes of the performance overlay
+PERF_OVERLAY_INTERVAL = 500
+
+OVERLAY_LABEL_STYLE = """
+    QLabel {
+        background-color: rgba(0, 0, 0, 100);
+        color: white;
+        padding: 5px;
+        border-radius: 3px;
+    }
+"""
+
+
+def box_rect(box: "Box") -> QRectF:
+    ltcx, ltcy = box.left_top_corner
+    rbcx, rbcy = box.right_bottom_corner
+    return QRectF(ltcx, ltcy, rbcx - ltcx + 1, rbcy - ltcy + 1)
+
+
+def array_qimage(pixels) -> QImage:
+    """
+    QImage on the buffer of a height x width x 4 RGBA array, without
+    copying it. the array must outlive the image
+    """
+    height, width = pixels.shape[:2]
+    return QImage(pixels.data, width, height, pixels.strides[0],
+                  QImage.Format_RGBA8888)
+
+
+def control_points(rect: QRectF):
+    """
+    position and type of the eight control points on rect
+    """
+    return [
+        (rect.topLeft(), 'top-left'),
+        (rect.topRight(), 'top-right'),
+        (rect.bottomLeft(), 'bottom-left'),
+        (rect.bottomRight(), 'bottom-right'),
+        (QPointF(rect.center().x(), rect.top()), 'top'),
+        (QPointF(rect.center().x(), rect.bottom()), 'bottom'),
+        (QPointF(rect.left(), rect.center().y()), 'left'),
+        (QPointF(rect.right(), rect.center().y()), 'right')
+    ]
+
+
+# cursor shown while hovering each control point
+CONTROL_POINT_CURSORS = {
+    'top-left': Qt.SizeFDiagCursor,      # ↖↘
+    'top-right': Qt.SizeBDiagCursor,     # ↗↙
+    'bottom-left': Qt.SizeBDiagCursor,   # ↗↙
+    'bottom-right': Qt.SizeFDiagCursor,  # ↖↘
+    'top': Qt.SizeVerCursor,             # ↕
+    'bottom': Qt.SizeVerCursor,          # ↕
+    'left': Qt.SizeHorCursor,            # ↔
+    'right': Qt.SizeHorCursor            # ↔
+}
+
+
+def control_point_rect(point: QPointF, size) -> QRectF:
+    return QRectF(point.x() - size/2, point.y() - size/2, size, size)
+
+
+def cosmetic_pen(color):
+    # cosmetic pens keep their 1 pixel width at any zoom level
+    pen = QPen(color)
+    pen.setCosmetic(True)
+    pen.setWidth(1)
+    return pen
 
 
 class PreviewArea(QGraphicsView):
@@ -30,42 +112,62 @@ class PreviewArea(QGraphicsView):
         self.zoom_factor = 1.0
         self.min_zoom = 1.0
         self.max_zoom = None  # set in image load
+        # view scale at zoom_factor 1.0, the image fits the view
+        self.fit_scale = 1.0
 
         self.current_image = None
-        self.boxes: List[Box] = []
-        self.original_boxes: List[Box] = []
+        # decoded pixels shared with the image cache, current_image
+        # wraps their buffer
+        self.decoded_image = None
+        # BoxStores once an image is loaded, original_boxes are the
+        # saved boxes and share their array with boxes until an edit
+        self.boxes: "BoxStore" = []
+        self.original_boxes: "BoxStore" = []
+        # grid index over self.boxes for click hit-testing, created
+        # with the first image
+        self.box_index = None
         self.selected_box = None
         self.drag_handle = None
         self.drag_start_pos = None
         self.drag_start_rect = None
+        # box under the mouse when the drag started, recorded as the old
+        # state of the edit once the mouse is released
+        self.drag_start_box = None
 
-        # support undo opration
-        self.undo_stack = []
+        # undo and redo history of every loaded image
+        self.history_depth = DEFAULT_HISTORY_DEPTH
+        self.histories = {}
+        self.history = BoxHistory(self.history_depth)
 
         self.current_image_path = None
 
-        # For the purpose of optimizing rendering,
-        # we delay the re-rendering of the box's border
-        # until 100ms after the zoom operation is completed.
-        # This ensures that the border is always drawn at 1 pixel
-        # width across any zoom level.
-        self.redraw_timer = QTimer()
-        self.redraw_timer.setSingleShot(True)
-        self.redraw_timer.setInterval(100)     # 100ms
-        self.redraw_timer.timeout.connect(self.draw_boxes)
+        # every box is painted by one layer item, the selected box is
+        # drawn again above it by its own item
+        self.box_pen = cosmetic_pen(QColor(255, 0, 0))
+        self.selected_box_pen = cosmetic_pen(QColor(0, 255, 0))
+        self._image_item = None
+        self._box_layer = None
+        # created again whenever the scene is cleared, they exist before
+        # the first image so clicks on the empty view can hide them
+        self._selection_item: QGraphicsRectItem = None
+        self._handle_items: List[QGraphicsRectItem] = []
+        self._create_selection_items()
 
         # display position info of cursor
         self.coord_label = QLabel(self)
-        self.coord_label.setStyleSheet("""
-            QLabel {
-                background-color: rgba(0, 0, 0, 100);
-                color: white;
-                padding: 5px;
-                border-radius: 3px;
-            }
-        """)
+        self.coord_label.setStyleSheet(OVERLAY_LABEL_STYLE)
         self.coord_label.hide()
 
+        # timings of the traced paths, shown above the cursor position
+        self.perf_label = QLabel(self)
+        self.perf_label.setStyleSheet(OVERLAY_LABEL_STYLE)
+        self.perf_label.hide()
+        self._perf_timer = QTimer(self)
+        self._perf_timer.setInterval(PERF_OVERLAY_INTERVAL)
+        self._perf_timer.timeout.connect(self.update_perf_label)
+        # tracing state before the overlay turned it on
+        self._tracing_before_overlay = False
+
         self.setFocusPolicy(Qt.StrongFocus)
 
     def dragEnterEvent(self, event):
@@ -81,27 +183,52 @@ class PreviewArea(QGraphicsView):
         files = [url.toLocalFile() for url in event.mimeData().urls()]
         self.file_list.add_files(files)
 
-    def load_image(self, image_path, boxes: List[Box]):
+    def load_image(self, image_path, boxes: "BoxStore"):
         # if same path, do not process
         if image_path == self.current_image_path:
             return
 
+        try:
+            with tracer.span("decode image", "preview", path=image_path):
+                decoded_image = get_image_cache().get(image_path)
+        except Exception as e:
+            QMessageBox.warning(self, "Open image failed: ", f"{e}")
+            return
+
+        # unsaved edits of the last image are dropped, they stay
+        # available as redo steps when it is opened again
+        self.history.seek_saved()
+        self.history = self.histories.get(image_path)
+        if self.history is None:
+            self.history = BoxHistory(self.history_depth)
+            self.histories[image_path] = self.history
+        self.history.seek_saved()
+
         # clear last state
         self.selected_box = None
         self.scene.clear()
-
-        # load image to scene
-        self.current_image = QImage(image_path)
-        pixmap = QPixmap.fromImage(self.current_image)
-        self.scene.setSceneRect(0, 0, pixmap.width(), pixmap.height())
-        self.scene.addPixmap(pixmap)
+        self._box_layer = None
+        self._create_selection_items()
+
+        # load image to scene, only the visible tiles are uploaded
+        self.decoded_image = decoded_image
+        self.current_image = array_qimage(decoded_image.pixels)
+        self._image_item = TiledImageItem(self.current_image)
+        self.scene.setSceneRect(0, 0, self.current_image.width(),
+                                self.current_image.height())
+        self.scene.addItem(self._image_item)
         self.fitInView(self.scene.sceneRect(), Qt.KeepAspectRatio)
         self.zoom_factor = 1.0
+        self.fit_scale = self.transform().m11()
+        self._image_item.set_min_scale(self.fit_scale * self.min_zoom)
+        self._image_item.set_view_scale(self.fit_scale * self.zoom_factor)
         self.current_image_path = image_path
 
         # save and draw box
-        self.original_boxes = boxes.copy()
-        self.boxes = boxes.copy()
+        from ..core.box_store import BoxStore
+        # both share the array of boxes until one of them is changed
+        self.original_boxes = BoxStore(boxes)
+        self.boxes = self.original_boxes.copy()
         self.draw_boxes()
 
         self.max_zoom = min(
@@ -131,9 +258,9 @@ class PreviewArea(QGraphicsView):
             if self.min_zoom <= new_zoom <= self.max_zoom:
                 self.zoom_factor = new_zoom
                 self.scale(factor, factor)
-
-                self.redraw_timer.stop()
-                self.redraw_timer.start()
+                # pick the pyramid level matching the new zoom
+                self._image_item.set_view_scale(
+                    self.fit_scale * self.zoom_factor)
         # horizontal scrolling
         elif modifiers & Qt.ShiftModifier:
             delta = delta_x if delta_x != 0 else delta_y
@@ -150,113 +277,161 @@ class PreviewArea(QGraphicsView):
 
         event.accept()
 
+    def rebuild_box_index(self):
+        if self.box_index is None:
+            from ..core.box_index import BoxIndex
+            self.box_index = BoxIndex()
+        self.box_index.rebuild(self.boxes)
+
     def draw_boxes(self):
-        self.scene.clear()
+        """
+        index self.boxes again and repaint the box layer with them
+        """
+        with tracer.span("draw_boxes", "preview", boxes=len(self.boxes)):
+            self.rebuild_box_index()
+            if self._box_layer is None:
+                from .box_layer_item import BoxLayerItem
+                self._box_layer = BoxLayerItem(
+                    self.box_index, self.box_pen, self.scene.sceneRect())
+                self.scene.addItem(self._box_layer)
+            else:
+                self._box_layer.reset()
+            self.update_selection()
+
+    def update_box_item(self, i):
+        self._box_layer.update_box(i)
+        if i == self.selected_box:
+            self.update_selection()
+
+    def set_box(self, i, box: "Box"):
+        self.boxes[i] = box
+        self.box_index.update(i, box)
+        self.update_box_item(i)
+
+    def insert_box(self, i, box: "Box"):
+        self.boxes.insert(i, box)
+        self.box_index.insert(i, box)
+        self._box_layer.insert_box(i)
+        if self.selected_box is not None and self.selected_box >= i:
+            self.selected_box += 1
+
+    def remove_box(self, i):
+        self.boxes.pop(i)
+        self.box_index.remove(i)
+        self._box_layer.remove_box(i)
+        if self.selected_box == i:
+            self.selected_box = None
+        elif self.selected_box is not None and self.selected_box > i:
+            self.selected_box -= 1
 
-        if self.current_image:
-            pixmap = QPixmap.fromImage(self.current_image)
-            self.scene.addPixmap(pixmap)
+    def replace_boxes(self, boxes: "BoxStore"):
+        self.boxes = boxes.copy()
+        self.selected_box = None
+        self.draw_boxes()
 
-        self.viewport().update()
-        scale = self.transform().m11()  # get scalling ratio
+    def clean_up_boxes(self, options):
+        """
+        post-process every box of the current image as one undoable edit
+        """
+        if self.current_image_path is None:
+            return
+        from ..core.box_store import BoxStore
+        from ..core.postprocess import postprocess_boxes
+        with tracer.span("clean up", "preview", boxes=len(self.boxes)):
+            boxes = BoxStore(postprocess_boxes(self.boxes, **options))
+        if len(boxes) == len(self.boxes) and \
+                (boxes.coords == self.boxes.coords).all():
+            return
+        self.history.record(ReplaceBoxes(self.boxes.copy(), boxes))
+        self.replace_boxes(boxes)
+        self.drag_start_box = None
+        self.box_modified.emit()
 
-        for i, box in enumerate(self.boxes):
-            ltcx, ltcy = box.left_top_corner
-            rbcx, rbcy = box.right_bottom_corner
-            tbox = box.left_top_corner + (rbcx - ltcx + 1, rbcy - ltcy + 1)
-            rect = QGraphicsRectItem(QRectF(*tbox))
+    def edit_box(self, i, box: "Box"):
+        """
+        replace box i as an undoable user edit
+        """
+        old_box = self.boxes[i]
+        self.set_box(i, box)
+        if old_box.left_top_corner != box.left_top_corner or \
+                old_box.right_bottom_corner != box.right_bottom_corner:
+            self.history.record(ModifyBox(i, old_box, box))
 
-            if i == self.selected_box:
-                pen = QPen(QColor(0, 255, 0))
-                pen.setWidthF(1.0 / scale)
-            else:
-                pen = QPen(QColor(255, 0, 0))
-                pen.setWidthF(1.0 / scale)
-            rect.setPen(pen)
-            self.scene.addItem(rect)
-
-            if i == self.selected_box:
-                # draw control point
-                control_point_size = 10 / scale
-                rect_f = QRectF(*tbox)
-
-                control_points = [
-                    (rect_f.topLeft(), 'top-left'),
-                    (rect_f.topRight(), 'top-right'),
-                    (rect_f.bottomLeft(), 'bottom-left'),
-                    (rect_f.bottomRight(), 'bottom-right'),
-                    (QPointF(rect_f.center().x(), rect_f.top()), 'top'),
-                    (QPointF(rect_f.center().x(), rect_f.bottom()), 'bottom'),
-                    (QPointF(rect_f.left(), rect_f.center().y()), 'left'),
-                    (QPointF(rect_f.right(), rect_f.center().y()), 'right')
-                ]
-
-                for point, _ in control_points:
-                    handle = QGraphicsRectItem(
-                        QRectF(
-                            point.x() - control_point_size/2,
-                            point.y() - control_point_size/2,
-                            control_point_size,
-                            control_point_size
-                        )
-                    )
-                    handle.setPen(pen)
-                    handle.setBrush(QColor(0, 255, 0))
-                    self.scene.addItem(handle)
+    def update_selection(self):
+        """
+        move the selection highlight and control points to selected_box
+        """
+        if self.selected_box is None:
+            self._selection_item.hide()
+        else:
+            self._selection_item.setRect(
+                box_rect(self.boxes[self.selected_box]))
+            self._selection_item.show()
+        self._update_handle_items()
+
+    def _create_selection_items(self):
+        self._selection_item = QGraphicsRectItem()
+        self._selection_item.setPen(self.selected_box_pen)
+        self._selection_item.setZValue(1)
+        self._selection_item.hide()
+        self.scene.addItem(self._selection_item)
+        self._handle_items = []
+        half = CONTROL_POINT_SIZE / 2
+        for _ in range(8):
+            handle = QGraphicsRectItem(
+                -half, -half, CONTROL_POINT_SIZE, CONTROL_POINT_SIZE)
+            # fixed on screen size at any zoom level
+            handle.setFlag(QGraphicsItem.ItemIgnoresTransformations)
+            handle.setPen(self.selected_box_pen)
+            handle.setBrush(QColor(0, 255, 0))
+            handle.setZValue(2)
+            handle.hide()
+            self.scene.addItem(handle)
+            self._handle_items.append(handle)
+
+    def _update_handle_items(self):
+        if self.selected_box is None:
+            for handle in self._handle_items:
+                handle.hide()
+            return
+        rect = box_rect(self.boxes[self.selected_box])
+        for handle, (point, _) in zip(self._handle_items,
+                                      control_points(rect)):
+            handle.setPos(point)
+            handle.show()
+
+    def control_point_size(self):
+        # control points keep their on screen size at any zoom level
+        return CONTROL_POINT_SIZE / self.transform().m11()
 
     def _handle_box_checked(self, i, box, pos):
-        ltcx, ltcy = box.left_top_corner
-        rbcx, rbcy = box.right_bottom_corner
-        tbox = box.left_top_corner + (rbcx - ltcx + 1, rbcy - ltcy + 1)
-        rect = QRectF(*tbox)
+        rect = box_rect(box)
 
         """
         handling box control point click
         """
-        # resize control point by scalling
-        control_point_size = 10 / self.transform().m11()
-        # all control point position on box
-        control_point_pos_infos = [
-            (rect.topLeft(), 'top-left'),
-            (rect.topRight(), 'top-right'),
-            (rect.bottomLeft(), 'bottom-left'),
-            (rect.bottomRight(), 'bottom-right'),
-            (QPointF(rect.center().x(), rect.top()), 'top'),
-            (QPointF(rect.center().x(), rect.bottom()), 'bottom'),
-            (QPointF(rect.left(), rect.center().y()), 'left'),
-            (QPointF(rect.right(), rect.center().y()), 'right')
-        ]
-        for control_point_pos, control_point_type in control_point_pos_infos:
-            control_point_rect = QRectF(
-                control_point_pos.x() - control_point_size/2,
-                control_point_pos.y() - control_point_size/2,
-                control_point_size,
-                control_point_size
-            )
-            if control_point_rect.contains(pos):
+        control_point_size = self.control_point_size()
+        for point, control_point_type in control_points(rect):
+            if control_point_rect(point, control_point_size).contains(pos):
                 self.selected_box = i
                 self.drag_start_pos = pos
                 self.drag_start_rect = rect
+                self.drag_start_box = box
                 self.drag_handle = control_point_type
-                self.draw_boxes()
+                self.update_selection()
                 self.box_modified.emit()
                 return True
 
         """
         handling box click
         """
-        inner_rect = QRectF(
-            rect.x(),
-            rect.y(),
-            rect.width(),
-            rect.height()
-        )
-        if inner_rect.contains(pos):
+        if rect.contains(pos):
             self.selected_box = i
             self.drag_start_pos = pos
             self.drag_start_rect = rect
+            self.drag_start_box = box
             self.drag_handle = 'move'
-            self.draw_boxes()
+            self.update_selection()
             self.box_modified.emit()
             return True
         return False
@@ -265,22 +440,25 @@ class PreviewArea(QGraphicsView):
         if event.button() == Qt.LeftButton:
             pos = self.mapToScene(event.pos())
             # do selected box check first
-            if self.selected_box and \
+            if self.selected_box is not None and \
                     self._handle_box_checked(self.selected_box, self.boxes[self.selected_box], pos):
                 return
 
-            for i, box in enumerate(self.boxes):
-                if self._handle_box_checked(i, box, pos):
-                    return
-                elif self.selected_box == i:
-                    continue
+            # only boxes near pos can be hit, in list order
+            if self.box_index is not None:
+                with tracer.span("hit test", "preview"):
+                    for i in self.box_index.query_point(
+                            pos.x(), pos.y(), self.control_point_size() / 2):
+                        if self._handle_box_checked(i, self.boxes[i], pos):
+                            return
             """
             handling empty area click
             (cancel box selected)
             """
             self.selected_box = None
             self.drag_handle = None
-            self.draw_boxes()
+            self.drag_start_box = None
+            self.update_selection()
             self.box_modified.emit()
 
     def mouseMoveEvent(self, event):
@@ -344,9 +522,9 @@ class PreviewArea(QGraphicsView):
                 new_box[3] = max(new_box[1], min(
                     new_box[3], image_rect.bottom()))
 
-            self.boxes[self.selected_box] = Box(
-                (new_box[0], new_box[1]), (new_box[2], new_box[3]))
-            self.draw_boxes()
+            from sprite_splitter import Box
+            self.set_box(self.selected_box, Box(
+                (new_box[0], new_box[1]), (new_box[2], new_box[3])))
             self.box_modified.emit()
         # handling box control point moving
         else:
@@ -354,37 +532,12 @@ class PreviewArea(QGraphicsView):
             cursor = Qt.ArrowCursor
 
             if self.selected_box is not None:
-                box = self.boxes[self.selected_box]
-                ltcx, ltcy = box.left_top_corner
-                rbcx, rbcy = box.right_bottom_corner
-                tbox = box.left_top_corner + (rbcx - ltcx + 1, rbcy - ltcy + 1)
-                rect = QRectF(*tbox)
-                control_point_size = 10 / self.transform().m11()
-
-                control_points = [
-                    (rect.topLeft(), Qt.SizeFDiagCursor, 'top-left'),      # ↖↘
-                    (rect.topRight(), Qt.SizeBDiagCursor, 'top-right'),    # ↗↙
-                    (rect.bottomLeft(), Qt.SizeBDiagCursor, 'bottom-left'),  # ↗↙
-                    (rect.bottomRight(), Qt.SizeFDiagCursor, 'bottom-right'),  # ↖↘
-                    (QPointF(rect.center().x(), rect.top()),
-                     Qt.SizeVerCursor, 'top'),       # ↕
-                    (QPointF(rect.center().x(), rect.bottom()),
-                     Qt.SizeVerCursor, 'bottom'),  # ↕
-                    (QPointF(rect.left(), rect.center().y()),
-                     Qt.SizeHorCursor, 'left'),     # ↔
-                    (QPointF(rect.right(), rect.center().y()),
-                     Qt.SizeHorCursor, 'right')    # ↔
-                ]
-
-                for point, cursor_shape, _ in control_points:
-                    control_point_rect = QRectF(
-                        point.x() - control_point_size/2,
-                        point.y() - control_point_size/2,
-                        control_point_size,
-                        control_point_size
-                    )
-                    if control_point_rect.contains(pos):
-                        cursor = cursor_shape
+                rect = box_rect(self.boxes[self.selected_box])
+                control_point_size = self.control_point_size()
+
+                for point, control_point_type in control_points(rect):
+                    if control_point_rect(point, control_point_size).contains(pos):
+                        cursor = CONTROL_POINT_CURSORS[control_point_type]
                         break
 
                 if cursor == Qt.ArrowCursor:
@@ -417,35 +570,79 @@ class PreviewArea(QGraphicsView):
         super().mouseMoveEvent(event)
 
     def mouseReleaseEvent(self, event):
-        if event.button() == Qt.LeftButton and self.selected_box is not None:
+        if event.button() == Qt.LeftButton and self.selected_box is not None \
+                and self.drag_start_box is not None:
             # Update the coordinates of the upper left and lower right corners
+            from sprite_splitter import Box
             box = self.boxes[self.selected_box]
             lx, ly = box.left_top_corner
             rx, ry = box.right_bottom_corner
-            box.left_top_corner = (min(lx, rx), min(ly, ry))
-            box.right_bottom_corner = (max(lx, rx), max(ly, ry))
-
-            # save tmp box to undo stack
-            self.undo_stack.append(self.boxes.copy())
+            # boxes are shared with the history, never change them in place
+            box = Box((min(lx, rx), min(ly, ry)), (max(lx, rx), max(ly, ry)))
+
+            # the drag replaced the box on every move, record it as one
+            # edit of the box it started from
+            self.boxes[self.selected_box] = self.drag_start_box
+            self.drag_start_box = None
+            self.edit_box(self.selected_box, box)
             self.box_modified.emit()
         super().mouseReleaseEvent(event)
 
+    def apply_history_step(self, step):
+        """
+        run history.undo or history.redo on this view
+        """
+        if self.current_image is None:
+            return
+        selected_box = step(self)
+        self.selected_box = selected_box
+        self.drag_start_box = None
+        self.update_selection()
+        self.box_modified.emit()
+
     def undo_last_action(self):
-        if self.undo_stack:
-            self.boxes = self.undo_stack.pop()
-            self.draw_boxes()
-            if not self.undo_stack:
-                self.box_modified.emit()
+        if self.history.can_undo():
+            self.apply_history_step(self.history.undo)
+
+    def redo_last_action(self):
+        if self.history.can_redo():
+            self.apply_history_step(self.history.redo)
+
+    def set_history_depth(self, depth):
+        self.history_depth = depth
+        self.history.set_max_depth(depth)
+        for history in self.histories.values():
+            history.set_max_depth(depth)
+
+    def clear_histories(self):
+        """
+        forget the history of every image, their boxes were detected again
+        """
+        self.histories.clear()
+        self.history = BoxHistory(self.history_depth)
+
+    def clear_history(self, image_path):
+        """
+        forget the history of one image, its boxes were detected again
+        """
+        history = self.histories.pop(image_path, None)
+        if history is self.history:
+            self.history = BoxHistory(self.history_depth)
 
     def save_changes(self):
         self.original_boxes = self.boxes.copy()
-        self.undo_stack.clear()
+        self.history.mark_saved()
 
     def cancel_changes(self):
         self.boxes = self.original_boxes.copy()
-        self.undo_stack.clear()
+        self.history.seek_saved()
+        self.selected_box = None
         self.draw_boxes()
 
+    def paintEvent(self, event):
+        with tracer.span("paint", "preview"):
+            super().paintEvent(event)
+
     def resizeEvent(self, event):
         super().resizeEvent(event)
         self.update_coord_label_position()
@@ -458,6 +655,46 @@ class PreviewArea(QGraphicsView):
             new_x = self.width() - label_width - margin
             new_y = self.height() - label_height - margin
             self.coord_label.move(new_x, new_y)
+            # the overlay sits right above the cursor position
+            self.perf_label.move(
+                self.width() - self.perf_label.width() - margin,
+                new_y - self.perf_label.height() - margin / 2)
+
+    def set_perf_overlay_visible(self, visible):
+        """
+        show the timings of the traced paths, tracing is on while the
+        overlay is shown
+        """
+        if visible == self.perf_label.isVisible():
+            return
+        if visible:
+            self._tracing_before_overlay = tracer.enabled
+            tracer.enabled = True
+            self.update_perf_label()
+            self.perf_label.show()
+            self._perf_timer.start()
+        else:
+            tracer.enabled = self._tracing_before_overlay
+            self.perf_label.hide()
+            self._perf_timer.stop()
+
+    def toggle_perf_overlay(self):
+        self.set_perf_overlay_visible(not self.perf_label.isVisible())
+
+    def update_perf_label(self):
+        def ms(name):
+            duration = tracer.latest.get(name)
+            return "-" if duration is None else f"{duration * 1000:.1f} ms"
+
+        self.perf_label.setText("\n".join([
+            f"frame: {ms('paint')}",
+            f"boxes: {len(self.boxes)}",
+            f"split: {ms('split')}",
+            f"decode: {ms('decode image')}",
+            f"draw boxes: {ms('draw_boxes')}",
+        ]))
+        self.perf_label.adjustSize()
+        self.update_coord_label_position()
 
     def leaveEvent(self, event):
         super().leaveEvent(event)
@@ -469,10 +706,11 @@ class PreviewArea(QGraphicsView):
         (delete the selected box)
         """
         if event.key() == Qt.Key_Delete and self.selected_box is not None:
-            self.undo_stack.append(self.boxes.copy())
-            self.boxes.pop(self.selected_box)
-            self.selected_box = None
-            self.draw_boxes()
+            i = self.selected_box
+            self.history.record(DeleteBox(i, self.boxes[i]))
+            self.remove_box(i)
+            self.drag_start_box = None
+            self.update_selection()
             self.box_modified.emit()
             event.accept()
         else:
@@ -0,0 +1,102 @@
+import math
+from collections import OrderedDict
+from PySide6.QtWidgets import QGraphicsItem
+from PySide6.QtCore import Qt, QRectF
+from PySide6.QtGui import QImage, QPixmap
+
+TILE_SIZE = 512
+# upper bound of the pixmap tiles kept around, in bytes
+TILE_CACHE_BYTES = 128 * 1024 * 1024
+
+
+class TiledImageItem(QGraphicsItem):
+    """
+    Draws an image from a pyramid of downsampled levels cut into tiles.
+
+    Level n is the image scaled down by 2^n. The view picks the level
+    matching its scale, only the tiles intersecting the exposed area are
+    turned into pixmaps, and those are kept in a LRU cache. A tile of
+    level n is scaled straight from its 2^n times larger region of the
+    image, through a view on the image buffer, so no level is ever held
+    as a whole image. The image itself is not copied either, the preview
+    passes an image sharing the pixels of the image cache.
+    """
+
+    def __init__(self, image: QImage, parent=None):
+        super().__init__(parent)
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption)
+        self._image = image
+        self._max_level = 0
+        self.level = 0
+        self._tiles = OrderedDict()
+        self._tile_bytes = 0
+
+    def boundingRect(self):
+        return QRectF(0, 0, self._image.width(), self._image.height())
+
+    def set_min_scale(self, scale):
+        """
+        the smallest view scale the image is shown at, levels below it
+        are never used
+        """
+        self._max_level = max(0, int(math.floor(math.log2(1 / scale)))) \
+            if scale < 1 else 0
+
+    def set_view_scale(self, scale):
+        level = int(math.floor(math.log2(1 / scale))) if scale < 1 else 0
+        level = min(max(level, 0), self._max_level)
+        if level != self.level:
+            self.level = level
+            self.update()
+
+    def paint(self, painter, option, widget=None):
+        # image pixels covered by one tile of the current level
+        span = TILE_SIZE << self.level
+        width, height = self._image.width(), self._image.height()
+        exposed = option.exposedRect
+        first_x = max(0, int(exposed.left()) // span)
+        first_y = max(0, int(exposed.top()) // span)
+        last_x = min(int(exposed.right()) // span, (width - 1) // span)
+        last_y = min(int(exposed.bottom()) // span, (height - 1) // span)
+        for tile_y in range(first_y, last_y + 1):
+            for tile_x in range(first_x, last_x + 1):
+                tile = self._tile(self.level, tile_x, tile_y)
+                x, y = tile_x * span, tile_y * span
+                target = QRectF(x, y, min(span, width - x),
+                                min(span, height - y))
+                painter.drawPixmap(target, tile, QRectF(tile.rect()))
+
+    def _region(self, x, y, width, height) -> QImage:
+        """
+        the image pixels of a rect, sharing the buffer of the image
+        """
+        line = self._image.bytesPerLine()
+        offset = y * line + x * self._image.depth() // 8
+        return QImage(self._image.constBits()[offset:], width, height, line,
+                      self._image.format())
+
+    def _tile(self, level, tile_x, tile_y) -> QPixmap:
+        key = (level, tile_x, tile_y)
+        tile = self._tiles.get(key)
+        if tile is not None:
+            self._tiles.move_to_end(key)
+            return tile
+
+        span = TILE_SIZE << level
+        x = tile_x * span
+        y = tile_y * span
+        width = min(span, self._image.width() - x)
+        height = min(span, self._image.height() - y)
+        region = self._region(x, y, width, height)
+        if level:
+            # same size as the tile of a level halved level times
+            region = region.scaled(
+                max(1, -(-width >> level)), max(1, -(-height >> level)),
+                Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+        tile = QPixmap.fromImage(region)
+        self._tiles[key] = tile
+        self._tile_bytes += tile.width() * tile.height() * 4
+        while self._tile_bytes > TILE_CACHE_BYTES and len(self._tiles) > 1:
+            _, old = self._tiles.popitem(last=False)
+            self._tile_bytes -= old.width() * old.height() * 4
+        return tile
@@ -0,0 +1,120 @@
+import threading
+from PySide6.QtCore import QObject, Signal, Qt
+from ..core.export import export_sprites
+from ..core.atlas import export_atlas
+from ..core.dedup import export_unique_sprites
+
+
+class ExportWorker(QObject):
+    """
+    Exports the sprites of one image in a background thread, either as
+    one file per sprite or packed into atlas pages, or the distinct
+    sprites of several images at once.
+
+    Only one export runs at a time. Progress and the result are
+    delivered on the GUI thread.
+    """
+    export_progress = Signal(int, int)
+    export_finished = Signal(int)
+    export_failed = Signal(str)
+    export_cancelled = Signal(int, int)
+
+    # emitted from the export thread, delivered on the GUI thread
+    _progress = Signal(int, int)
+    _done = Signal(int, int, str)
+
+    def __init__(self, max_workers=None):
+        super().__init__()
+        self.max_workers = max_workers
+        self._thread = None
+        self._cancel_event = None
+        self._progress.connect(self.export_progress, Qt.QueuedConnection)
+        self._done.connect(self._on_done, Qt.QueuedConnection)
+
+    def start(self, image_path, boxes, export_dir, fmt="PNG", options=None,
+              atlas_options=None):
+        """
+        boxes are a BoxStore or anything BoxStore accepts, they are
+        copied so the caller may keep editing its own boxes.
+        atlas_options are the keyword arguments of export_atlas, sprites
+        are written one by one if it is None
+        """
+        if self.is_running():
+            return False
+        from ..core.box_store import BoxStore
+        # shares the array until the caller changes a box
+        boxes = BoxStore(boxes).copy()
+        options = dict(options or {})
+        if atlas_options is None:
+            def export(cancel_event):
+                return export_sprites(
+                    image_path, boxes, export_dir, fmt, options,
+                    max_workers=self.max_workers,
+                    progress=self._progress.emit, cancel_event=cancel_event)
+        else:
+            def export(cancel_event):
+                return export_atlas(
+                    image_path, boxes, export_dir, fmt, options,
+                    progress=self._progress.emit, cancel_event=cancel_event,
+                    **atlas_options)
+        self._start(export, len(boxes))
+        return True
+
+    def start_unique(self, sources, export_dir, fmt="PNG", options=None,
+                     max_distance=None):
+        """
+        export every distinct sprite of sources, (image path, boxes)
+        pairs, once. see export_unique_sprites
+        """
+        if self.is_running():
+            return False
+        from ..core.box_store import BoxStore
+        sources = [(image_path, BoxStore(boxes).copy())
+                   for image_path, boxes in sources]
+        options = dict(options or {})
+
+        def export(cancel_event):
+            return export_unique_sprites(
+                sources, export_dir, fmt, options, max_distance,
+                max_workers=self.max_workers,
+                progress=self._progress.emit, cancel_event=cancel_event)
+        self._start(export, sum(len(boxes) for _, boxes in sources))
+        return True
+
+    def cancel(self):
+        if self._cancel_event is not None:
+            self._cancel_event.set()
+
+    def is_running(self):
+        return self._thread is not None
+
+    def shutdown(self):
+        self.cancel()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _start(self, export, total):
+        # export(cancel_event) runs in the thread and returns the number
+        # of written sprites
+        self._cancel_event = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, args=(export, total, self._cancel_event),
+            daemon=True)
+        self._thread.start()
+
+    def _run(self, export, total, cancel_event):
+        try:
+            self._done.emit(export(cancel_event), total, "")
+        except Exception as e:
+            self._done.emit(0, total, str(e) or repr(e))
+
+    def _on_done(self, done, total, error):
+        self._thread = None
+        cancelled = self._cancel_event.is_set()
+        self._cancel_event = None
+        if error:
+            self.export_failed.emit(error)
+        elif cancelled and done < total:
+            self.export_cancelled.emit(done, total)
+        else:
+            self.export_finished.emit(done)
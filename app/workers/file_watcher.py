@@ -0,0 +1,62 @@
+import os
+from PySide6.QtCore import QObject, QFileSystemWatcher, QTimer, Signal
+
+# editors write a file in several steps, changes are reported once the
+# file was quiet for this long
+CHANGE_DELAY_MS = 300
+
+
+class FileWatcher(QObject):
+    """
+    Reports files that changed on disk.
+
+    Changes are collected until CHANGE_DELAY_MS passed without another
+    one. Files replaced by a rename, as many editors save them, are
+    watched again. The number of watched files is bounded by the OS,
+    files beyond that limit are not watched.
+    """
+    files_changed = Signal(list)
+
+    def __init__(self):
+        super().__init__()
+        self._watcher = QFileSystemWatcher(self)
+        self._watcher.fileChanged.connect(self._on_file_changed)
+        self._changed = set()
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(CHANGE_DELAY_MS)
+        self._timer.timeout.connect(self._report)
+        self._paths = set()
+
+    def watch(self, paths):
+        paths = [path for path in paths if path not in self._paths]
+        if paths:
+            self._paths.update(paths)
+            self._watcher.addPaths(paths)
+
+    def unwatch(self, paths):
+        paths = [path for path in paths if path in self._paths]
+        if paths:
+            self._paths.difference_update(paths)
+            self._changed.difference_update(paths)
+            self._watcher.removePaths(paths)
+
+    def _on_file_changed(self, path):
+        if path in self._paths:
+            self._changed.add(path)
+            self._timer.start()
+
+    def _report(self):
+        changed = [path for path in self._changed if os.path.isfile(path)]
+        self._changed.difference_update(changed)
+        if self._changed:
+            # deleted files are no longer watched, look for them again
+            # until they are back
+            self._timer.start()
+        if not changed:
+            return
+        watched = set(self._watcher.files())
+        replaced = [path for path in changed if path not in watched]
+        if replaced:
+            self._watcher.addPaths(replaced)
+        self.files_changed.emit(sorted(changed))
@@ -0,0 +1,58 @@
+import threading
+from PySide6.QtCore import QObject, Signal, Qt
+from ..core.image_probe import get_image_info
+from ..core.file_scan import iter_image_files
+
+# probe results delivered to the GUI thread at once
+PROBE_CHUNK_SIZE = 64
+
+
+class ProbeWorker(QObject):
+    """
+    Checks added files by reading their image headers in a background
+    thread, so adding many files never blocks the GUI. Folders and glob
+    patterns are expanded in the same thread, their files stream in with
+    the results.
+
+    Every probe() call is a batch. Its results arrive in chunks of
+    (path, info, error) tuples, info is None for files that are not
+    images, the last chunk of a batch has last set.
+    """
+    probed = Signal(int, object, bool)
+
+    # emitted from the probe threads, delivered on the GUI thread
+    _chunk_done = Signal(int, object, bool)
+
+    def __init__(self):
+        super().__init__()
+        self._next_batch = 0
+        self._stop_event = threading.Event()
+        self._chunk_done.connect(self.probed, Qt.QueuedConnection)
+
+    def probe(self, paths):
+        """
+        probe paths in the background, returns the batch id. paths may
+        hold folders and glob patterns
+        """
+        batch = self._next_batch
+        self._next_batch += 1
+        threading.Thread(target=self._run, args=(batch, list(paths)),
+                         name="probe", daemon=True).start()
+        return batch
+
+    def shutdown(self):
+        self._stop_event.set()
+
+    def _run(self, batch, paths):
+        chunk = []
+        for path in iter_image_files(paths):
+            if self._stop_event.is_set():
+                return
+            try:
+                chunk.append((path, get_image_info(path), ""))
+            except Exception as e:
+                chunk.append((path, None, str(e) or repr(e)))
+            if len(chunk) == PROBE_CHUNK_SIZE:
+                self._chunk_done.emit(batch, chunk, False)
+                chunk = []
+        self._chunk_done.emit(batch, chunk, True)
@@ -0,0 +1,92 @@
+import threading
+from PySide6.QtCore import QObject, Signal, Qt
+
+
+class RefreshWorker(QObject):
+    """
+    Updates the boxes of images that changed on disk in background
+    threads, see refresh_boxes.
+
+    refreshed delivers the new boxes as a BoxStore, or None if the image
+    has to be split in full. The decode of the image from before the
+    change is taken when the change is noticed, the preview may decode
+    the changed file before the refresh thread runs. An image changed
+    again while its refresh runs is refreshed once more afterwards,
+    starting from the boxes and the decode of the first refresh.
+    """
+    refreshed = Signal(str, object)
+    refresh_failed = Signal(str, str)
+
+    # emitted from the refresh threads, delivered on the GUI thread
+    _done = Signal(str, int, object, object, str)
+
+    def __init__(self):
+        super().__init__()
+        # image path -> id of its running refresh
+        self._running = {}
+        # image path -> (alpha_threshold, merge_distance) of the refresh
+        # queued behind the running one
+        self._pending = {}
+        self._next_id = 0
+        self._done.connect(self._on_done, Qt.QueuedConnection)
+
+    def refresh(self, image_path, boxes, alpha_threshold=0, merge_distance=0,
+                old_image=None):
+        """
+        old_image is the DecodedImage of image_path before it changed,
+        the image cache entry is used without it
+        """
+        if image_path in self._running:
+            self._pending[image_path] = (alpha_threshold, merge_distance)
+            return
+        from ..core.box_store import BoxStore
+        refresh_id = self._next_id
+        self._next_id += 1
+        self._running[image_path] = refresh_id
+        threading.Thread(
+            target=self._run,
+            args=(image_path, refresh_id, BoxStore(boxes).copy(),
+                  alpha_threshold, merge_distance, old_image),
+            name="refresh", daemon=True).start()
+
+    def cancel(self, image_path):
+        """
+        drop the result of a running refresh of image_path
+        """
+        self._running.pop(image_path, None)
+        self._pending.pop(image_path, None)
+
+    def cancel_all(self):
+        self._running.clear()
+        self._pending.clear()
+
+    def is_busy(self, image_path):
+        return image_path in self._running
+
+    def _run(self, image_path, refresh_id, boxes, alpha_threshold,
+             merge_distance, old_image):
+        try:
+            # numpy is only imported once a file changed
+            from ..core.relabel import refresh_boxes
+            coords, new_image = refresh_boxes(
+                image_path, boxes, alpha_threshold, merge_distance,
+                old_image)
+            self._done.emit(image_path, refresh_id, coords, new_image, "")
+        except Exception as e:
+            self._done.emit(image_path, refresh_id, None, None,
+                            str(e) or repr(e))
+
+    def _on_done(self, image_path, refresh_id, coords, new_image, error):
+        if self._running.get(image_path) != refresh_id:
+            return
+        del self._running[image_path]
+        pending = self._pending.pop(image_path, None)
+        if error:
+            self.refresh_failed.emit(image_path, error)
+        elif coords is None:
+            self.refreshed.emit(image_path, None)
+        elif pending is not None:
+            self.refresh(image_path, coords, *pending, old_image=new_image)
+        else:
+            from ..core.box_store import BoxStore
+            self.refreshed.emit(image_path, BoxStore(coords))
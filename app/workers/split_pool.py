@@ -0,0 +1,183 @@
+import os
+import time
+from PySide6.QtCore import QObject, Signal, Qt
+from ..core.detection import split_image, DEFAULT_ENGINE
+from ..core.perf import tracer
+
+
+class SplitPool(QObject):
+    """
+    Runs sprite detection in a pool of worker processes.
+
+    The splitter is pure python, so threads would be serialized by the
+    GIL; processes let every core work on a different sheet. Jobs wait in
+    a local queue and are only handed to the pool when a worker is free,
+    which keeps them re-orderable and cancellable until they start.
+    """
+    split_queued = Signal(str)
+    split_started = Signal(str)
+    split_finished = Signal(str, object)
+    split_failed = Signal(str, str)
+    split_cancelled = Signal(str)
+
+    # emitted from the pool's result thread, delivered on the GUI thread
+    _job_done = Signal(object, object, str)
+
+    def __init__(self, max_workers=None):
+        super().__init__()
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.engine = DEFAULT_ENGINE
+        self.options = {}
+        # image path -> engine used for it instead of self.engine
+        self.file_engines = {}
+        # image path -> number of times its file changed, a job of an
+        # older revision split the old file
+        self._revisions = {}
+        # bumped on every settings change, results of older
+        # generations are dropped
+        self._generation = 0
+        self._pool = None
+        self._pending = []
+        # running jobs as (image_path, generation, engine, revision)
+        self._running = set()
+        # job -> perf_counter time it was handed to the pool
+        self._start_times = {}
+        # running jobs can not be interrupted, their results are dropped
+        self._cancelled = set()
+        self._job_done.connect(self._on_job_done, Qt.QueuedConnection)
+
+    def set_options(self, engine, options):
+        """
+        use another splitter configuration for every job that did not
+        start yet. running jobs are abandoned
+        """
+        self.engine = engine
+        self.options = dict(options)
+        self._generation += 1
+        self._cancelled.update(self._running)
+
+    def set_file_engine(self, image_path, engine):
+        """
+        split image_path with another engine than the other images,
+        engine=None goes back to the shared one. a running split of the
+        image is abandoned
+        """
+        if engine is None:
+            self.file_engines.pop(image_path, None)
+        else:
+            self.file_engines[image_path] = engine
+        self._cancel_stale(image_path)
+
+    def restart(self, image_path, front=False):
+        """
+        split image_path again after its file changed, a running split of
+        the old file is abandoned
+        """
+        self._revisions[image_path] = self._revisions.get(image_path, 0) + 1
+        self._cancel_stale(image_path)
+        self.submit(image_path, front)
+
+    def engine_for(self, image_path):
+        return self.file_engines.get(image_path, self.engine)
+
+    def submit(self, image_path, front=False):
+        """
+        queue image_path for detection. front=True moves it ahead of
+        every other waiting job
+        """
+        job = self._job(image_path)
+        if job in self._running:
+            self._cancelled.discard(job)
+            return
+        if image_path in self._pending:
+            if not front:
+                return
+            self._pending.remove(image_path)
+        if front:
+            self._pending.insert(0, image_path)
+        else:
+            self._pending.append(image_path)
+        self.split_queued.emit(image_path)
+        self._pump()
+
+    def cancel(self, image_path):
+        job = self._job(image_path)
+        if image_path in self._pending:
+            self._pending.remove(image_path)
+            self.split_cancelled.emit(image_path)
+        elif job in self._running and job not in self._cancelled:
+            self._cancelled.add(job)
+            self.split_cancelled.emit(image_path)
+
+    def cancel_all(self):
+        for image_path in self._pending.copy():
+            self.cancel(image_path)
+        for image_path, generation, *_ in self._running.copy():
+            if generation == self._generation:
+                self.cancel(image_path)
+
+    def is_busy(self, image_path):
+        job = self._job(image_path)
+        return image_path in self._pending or \
+            (job in self._running and job not in self._cancelled)
+
+    def shutdown(self):
+        self._pending.clear()
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool = None
+        self._running.clear()
+        self._start_times.clear()
+        self._cancelled.clear()
+
+    def _pump(self):
+        while self._pending and len(self._running) < self.max_workers:
+            image_path = self._pending.pop(0)
+            job = self._job(image_path)
+            self._running.add(job)
+            self._start_times[job] = time.perf_counter()
+            self._get_pool().apply_async(
+                split_image, (image_path, job[2], self.options),
+                callback=lambda boxes, job=job:
+                    self._job_done.emit(job, boxes, ""),
+                error_callback=lambda e, job=job:
+                    self._job_done.emit(job, None, str(e) or repr(e))
+            )
+            self.split_started.emit(image_path)
+
+    def _job(self, image_path):
+        return (image_path, self._generation, self.engine_for(image_path),
+                self._revisions.get(image_path, 0))
+
+    def _cancel_stale(self, image_path):
+        job = self._job(image_path)
+        for running in self._running:
+            if running[0] == image_path and running != job:
+                self._cancelled.add(running)
+
+    def _get_pool(self):
+        if self._pool is None:
+            import multiprocessing
+            # never fork a process that already runs a Qt event loop
+            context = multiprocessing.get_context("spawn")
+            self._pool = context.Pool(processes=self.max_workers)
+        return self._pool
+
+    def _on_job_done(self, job, boxes, error):
+        if job not in self._running:
+            # pool was shut down in the meantime
+            return
+        self._running.discard(job)
+        start = self._start_times.pop(job, None)
+        image_path = job[0]
+        if start is not None:
+            # the split ran in a worker process, traced from the GUI side
+            tracer.record("split", start, category="split", path=image_path,
+                          boxes=len(boxes) if boxes is not None else None)
+        if job in self._cancelled:
+            self._cancelled.discard(job)
+        elif error:
+            self.split_failed.emit(image_path, error)
+        else:
+            self.split_finished.emit(image_path, boxes)
+        self._pump()
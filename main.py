@@ -1,12 +1,62 @@
 import sys
-from PySide6.QtWidgets import QApplication
-from app.main_window import MainWindow
+
 
 def main():
-    app = QApplication(sys.argv)
-    window = MainWindow(app)
-    window.show()
-    sys.exit(app.exec())
+    if len(sys.argv) > 1 and sys.argv[1] == "split":
+        # headless mode, keep Qt out of the process entirely
+        from app.cli import main as cli_main
+        sys.exit(cli_main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "bench":
+        # Qt is only imported by the cases that draw
+        from app.bench import main as bench_main
+        sys.exit(bench_main(sys.argv[2:]))
+
+    from app.core.startup import StartupProfiler, warm_up
+    profile_startup = "--profile-startup" in sys.argv
+    profiler = StartupProfiler()
+    if profile_startup:
+        sys.argv.remove("--profile-startup")
+        profiler.install()
+
+    # --trace FILE traces the whole session and writes it on exit
+    trace_path = None
+    if "--trace" in sys.argv:
+        i = sys.argv.index("--trace")
+        if i + 1 >= len(sys.argv):
+            sys.exit("--trace needs a file name")
+        trace_path = sys.argv[i + 1]
+        del sys.argv[i:i + 2]
+        from app.core.perf import tracer
+        tracer.enabled = True
+
+    with profiler.phase("import Qt"):
+        from PySide6.QtWidgets import QApplication
+    with profiler.phase("import main window"):
+        from app.main_window import MainWindow
+    with profiler.phase("create application"):
+        app = QApplication(sys.argv)
+    with profiler.phase("create main window"):
+        window = MainWindow(app)
+
+    def on_first_frame():
+        profiler.mark("first frame")
+        if profile_startup:
+            profiler.uninstall()
+            profiler.report()
+        # everything the window did not need is imported in the background
+        warm_up()
+
+    window.first_frame_shown.connect(on_first_frame)
+    with profiler.phase("show main window"):
+        window.show()
+    # images, folders and glob patterns given on the command line
+    paths = [arg for arg in app.arguments()[1:] if not arg.startswith("-")]
+    if paths:
+        window.file_list.add_files(paths)
+    status = app.exec()
+    if trace_path:
+        tracer.dump(trace_path)
+    sys.exit(status)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
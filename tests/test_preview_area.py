@@ -0,0 +1,31 @@
+import os
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import pytest
+from PySide6.QtCore import QEvent, QPointF, Qt
+from PySide6.QtGui import QMouseEvent
+from PySide6.QtWidgets import QApplication
+
+from app.widgets.preview_area import PreviewArea
+
+
+@pytest.fixture(scope="module")
+def app():
+    return QApplication.instance() or QApplication([])
+
+
+def mouse_event(kind, pos):
+    return QMouseEvent(kind, pos, pos, Qt.LeftButton, Qt.LeftButton,
+                       Qt.NoModifier)
+
+
+def test_click_before_image_is_loaded(app):
+    preview = PreviewArea(None, False)
+    preview.resize(400, 300)
+    preview.show()
+    pos = QPointF(200, 150)
+    # called directly, errors in overrides called by Qt are only printed
+    preview.mousePressEvent(mouse_event(QEvent.MouseButtonPress, pos))
+    preview.mouseReleaseEvent(mouse_event(QEvent.MouseButtonRelease, pos))
+    assert preview.selected_box is None